@@ -0,0 +1,187 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Command line tools: python -m opendaq <command> [options]"""
+
+import optparse
+import signal
+import sys
+from opendaq.daq import DAQ
+from opendaq.discovery import CACHE_PATH, DeviceCache, PROBE_TIMEOUT, \
+    discover
+from opendaq.server import DAQServer, QUEUE_SIZE, parse_address
+
+
+def serve(args):
+    daq = DAQ(args.port, debug=args.debug)
+    server = DAQServer(daq, parse_address(args.listen),
+                       queue_size=args.queue_size)
+    print 'Serving %s on %s' % (args.port, args.listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daq.close()
+
+
+def list_devices(args):
+    cache = DeviceCache(None if args.no_cache else args.cache)
+    found = discover(args.ports or None, args.timeout, cache)
+    for info in found:
+        print '%-20s id %-8d hw %s  fw %d' % (
+            info.port, info.dev_id, info.hw_ver, info.fw_ver)
+    if not found:
+        sys.exit('No devices found')
+
+
+def print_stats(stats):
+    sys.stderr.write(
+        '\r%(elapsed)8.1f s %(samples)10d samples %(rate)10.0f samples/s '
+        '%(bytes)10d bytes  dropped: %(dropped)d  CRC errors: '
+        '%(crc_errors)d ' % stats)
+    sys.stderr.flush()
+
+
+def record(args):
+    # Imported here because the recorder requires NumPy
+    from opendaq.codec import BITPACK, ZLIB
+    from opendaq.experiment import Experiment
+    from opendaq.recorder import Recorder, load_experiment, parse_stream
+
+    exp = load_experiment(args.config) if args.config else Experiment()
+    for spec in args.stream or []:
+        exp.add(parse_stream(spec))
+    if not exp.channels:
+        sys.exit('No DataChannels configured (use --stream or --config)')
+
+    daq = DAQ(args.port, debug=args.debug)
+    recorder = Recorder(daq, args.output, exp,
+                        method=ZLIB if args.zlib else BITPACK,
+                        queue_size=args.queue_size)
+
+    # Stop cleanly, finalizing the file
+    def handler(signum, frame):
+        recorder.request_stop()
+    handlers = dict((signum, signal.signal(signum, handler))
+                    for signum in (signal.SIGINT, signal.SIGTERM))
+
+    try:
+        recorder.run(args.duration, args.interval,
+                     None if args.quiet else print_stats)
+    finally:
+        daq.close()
+        for signum, previous in handlers.items():
+            signal.signal(signum, previous)
+    if not args.quiet:
+        sys.stderr.write('\n')
+
+
+USAGE = """%prog [--debug] <command> [options]
+
+Commands:
+  serve     share a device with several clients
+  discover  list the devices connected to the serial ports
+  record    record stream experiments into a file
+
+Run '%prog <command> --help' for the options of a command."""
+
+
+def serve_parser():
+    p = optparse.OptionParser(prog='python -m opendaq serve',
+                              usage='%prog PORT [options]')
+    p.add_option('-l', '--listen', default='localhost:5050',
+                 help="'host:port' or Unix socket path (default: %default)")
+    p.add_option('-q', '--queue-size', type='int', default=QUEUE_SIZE,
+                 help='stream blocks queued per client (default: %default)')
+    return p
+
+
+def discover_parser():
+    p = optparse.OptionParser(prog='python -m opendaq discover',
+                              usage='%prog [PORT ...] [options]')
+    p.add_option('-t', '--timeout', type='float', default=PROBE_TIMEOUT,
+                 help='seconds to wait for every device (default: %default)')
+    p.add_option('--cache', default=CACHE_PATH,
+                 help='cache of the device ports (default: %default)')
+    p.add_option('--no-cache', action='store_true',
+                 help='do not update the cache')
+    return p
+
+
+def record_parser():
+    p = optparse.OptionParser(prog='python -m opendaq record',
+                              usage='%prog PORT FILE [options]')
+    p.add_option('-s', '--stream', action='append',
+                 metavar='NUMBER:PERIOD[:PINPUT[:GAIN]]',
+                 help='stream DataChannel (period in ms), can be repeated')
+    p.add_option('-c', '--config',
+                 help='JSON file with the list of DataChannels')
+    p.add_option('-d', '--duration', type='float',
+                 help='recording time in seconds (default: until '
+                 'interrupted or all the DataChannels stop)')
+    p.add_option('-z', '--zlib', action='store_true',
+                 help='compress the blocks with zlib')
+    p.add_option('-q', '--queue-size', type='int', default=1024,
+                 help='packet lists queued for writing (default: %default)')
+    p.add_option('-i', '--interval', type='float', default=1.0,
+                 help='seconds between status updates (default: %default)')
+    p.add_option('--quiet', action='store_true',
+                 help='do not print the status')
+    return p
+
+
+# Command name: (function, option parser, positional arguments). A
+# trailing '*' takes any number of values.
+COMMANDS = {
+    'serve': (serve, serve_parser, ['port']),
+    'discover': (list_devices, discover_parser, ['ports*']),
+    'record': (record, record_parser, ['port', 'output']),
+}
+
+
+def main(argv=None):
+    # optparse is used instead of argparse, which is not in the standard
+    # library of Python 2.6
+    parser = optparse.OptionParser(prog='python -m opendaq', usage=USAGE)
+    parser.add_option('--debug', action='store_true',
+                      help='print the command packets')
+    parser.disable_interspersed_args()
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error('missing command')
+    if args[0] not in COMMANDS:
+        parser.error('unknown command: %s' % args[0])
+
+    func, make_parser, names = COMMANDS[args[0]]
+    p = make_parser()
+    opts, values = p.parse_args(args[1:])
+    if names[-1].endswith('*'):
+        if len(values) < len(names) - 1:
+            p.error('missing arguments')
+        values = values[:len(names) - 1] + [values[len(names) - 1:]]
+        names = names[:-1] + [names[-1][:-1]]
+    elif len(values) != len(names):
+        p.error('wrong number of arguments')
+    for name, value in zip(names, values):
+        setattr(opts, name, value)
+    opts.debug = options.debug
+    func(opts)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Alignment of DataChannels with different rates (requires NumPy)
+
+Every DataChannel is demultiplexed, the time of each sample is
+rebuilt from its period, and all of them are resampled on a common time
+grid. Blocks can be fed as they arrive; only the frames which are
+covered by all the channels are returned:
+
+    aligner = Aligner.from_experiment(exp)
+    while acquiring:
+        times, frames = aligner.feed(daq.read_stream())
+        # frames[:, i] is DataChannel aligner.numbers[i]
+"""
+
+import numpy as np
+
+LINEAR = 'linear'
+HOLD = 'hold'
+
+
+class _Timeline(object):
+    """Samples of a DataChannel not needed by the aligner yet"""
+    def __init__(self, period):
+        self.period = period
+        self.base = 0               # sample number of values[0]
+        self.values = np.zeros(0)
+
+    @property
+    def end(self):
+        """Sample number after the last one received"""
+        return self.base + len(self.values)
+
+    def extend(self, values, offset=None):
+        """Add samples; a gap before `offset` is filled with NaN"""
+        if offset is not None and offset > self.end:
+            values = np.concatenate((np.full(offset - self.end, np.nan),
+                                     values))
+        self.values = np.concatenate((self.values, values))
+
+    def last_time(self):
+        return (self.end - 1)*self.period
+
+    def resample(self, t, method):
+        if method == HOLD:
+            # The small offset avoids rounding down exact sample times
+            idx = np.floor(t/self.period + 1e-9).astype(int) - self.base
+            return self.values[idx]
+        times = (self.base + np.arange(len(self.values)))*self.period
+        return np.interp(t, times, self.values)
+
+    def discard(self, t):
+        """Drop the samples before the one needed at time `t`"""
+        n = int(np.floor(t/self.period + 1e-9)) - self.base
+        if n > 0:
+            self.values = self.values[n:]
+            self.base += n
+
+
+class Aligner(object):
+    def __init__(self, periods, period=None, method=LINEAR, t0=0.0):
+        """Incremental resampler of DataChannels on a common time grid
+
+        The first sample of every DataChannel is taken at time `t0`.
+
+        Args:
+            periods: Dictionary of DataChannel number: sample period in
+                seconds
+            period: Period of the time grid (default: the shortest of
+                the DataChannel periods)
+            method: LINEAR interpolation or sample-and-HOLD
+            t0: Time of the first sample (seconds)
+        """
+        if method not in (LINEAR, HOLD):
+            raise ValueError("Invalid method")
+        if not periods:
+            raise ValueError("No DataChannels")
+        for number, p in periods.items():
+            if not p or p <= 0:
+                raise ValueError("Invalid period of DataChannel %d" % number)
+        self.numbers = sorted(periods)
+        self.timelines = dict((n, _Timeline(float(periods[n])))
+                              for n in self.numbers)
+        self.period = float(period or min(periods.values()))
+        self.method = method
+        self.t0 = t0
+        self.index = 0          # next grid point
+
+    @classmethod
+    def from_experiment(cls, experiment, periods=None, **kwargs):
+        """Build an aligner for the DataChannels of an experiment
+
+        Args:
+            experiment: `opendaq.experiment.Experiment`
+            periods: Periods (seconds) of the DataChannels which have no
+                fixed period (External experiments), by number
+            kwargs: Other `Aligner` arguments
+        Raises:
+            ValueError: A DataChannel has an unknown period
+        """
+        all_periods = dict(periods or {})
+        for number, channel in experiment.channels.items():
+            if channel.period is not None:
+                all_periods.setdefault(number, channel.period)
+            elif number not in all_periods:
+                raise ValueError("Unknown period of DataChannel %d" % number)
+        return cls(all_periods, **kwargs)
+
+    def feed(self, packets):
+        """Add stream packets and get the new aligned frames
+
+        The samples of corrupted packets are replaced with NaN, and so
+        are the ones skipped by the packet offsets (e.g. the gaps left by
+        `opendaq.watchdog.Watchdog` restarts). The stream carries no
+        packet counter, so a packet lost whole is not detected: the
+        following samples of its DataChannel are taken as the next ones.
+
+        Args:
+            packets: List of `StreamPacket` objects (see
+                `DAQ.read_stream`)
+        Returns:
+            Times of the new frames and array of frames, with one column
+            per DataChannel (see `numbers`)
+        """
+        for p in packets:
+            timeline = self.timelines.get(p.number)
+            if timeline is not None and not p.is_stop:
+                values = np.asarray(p.values, float)
+                if not p.crc_ok:
+                    values[:] = np.nan
+                timeline.extend(values, p.offset)
+        return self._frames()
+
+    def feed_interleaved(self, data, channel):
+        """Add samples in the format of `DAQ.get_stream`
+
+        Args:
+            data: Samples of all the DataChannels, interleaved
+            channel: Index (DataChannel number - 1) of every sample
+        Returns:
+            See `feed`
+        """
+        data = np.asarray(data, float)
+        channel = np.asarray(channel)
+        for number, timeline in self.timelines.items():
+            timeline.extend(data[channel == number - 1])
+        return self._frames()
+
+    def _frames(self):
+        timelines = [self.timelines[n] for n in self.numbers]
+        last = min(tl.last_time() for tl in timelines)
+        end = int(np.floor(last/self.period + 1e-9)) + 1
+        if end <= self.index:
+            return np.zeros(0), np.zeros((0, len(timelines)))
+
+        t = np.arange(self.index, end)*self.period
+        frames = np.column_stack([tl.resample(t, self.method)
+                                  for tl in timelines])
+        self.index = end
+        for tl in timelines:
+            tl.discard(self.index*self.period)
+        return self.t0 + t, frames
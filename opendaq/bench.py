@@ -0,0 +1,301 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the acquisition path (requires NumPy)
+
+    python -m opendaq.bench [--profile] [--memory] [--json report.json]
+
+Every scenario runs against the simulator (or the given port), and the
+decode scenario can decode the data of a capture file instead of
+simulated data. The record scenario runs a `Recorder` against the
+simulator, so the time to generate the simulated data is included.
+Memory is traced with tracemalloc when it is available (Python 3, or the
+pytracemalloc backport), otherwise only the growth of the peak RSS of
+the process is reported.
+"""
+
+import cProfile
+import json
+import optparse
+import os
+import platform
+import pstats
+import sys
+import tempfile
+import time
+import numpy as np
+
+import opendaq
+from opendaq.calibration import raw_to_volts, volts_to_raw
+from opendaq.capture import read_capture, READ
+from opendaq.clock import VirtualClock
+from opendaq.daq import DAQ
+from opendaq.experiment import Experiment
+from opendaq.recorder import Recorder
+from opendaq.simulator import DAQSimulator
+from opendaq.stream import StreamDecoder
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SCENARIOS = ('commands', 'decode', 'calibration', 'record')
+CHUNK_SIZE = 4096
+
+
+def simulated_stream(seconds, period=1, nchannels=2, seed=0):
+    """Raw stream data of a simulated experiment
+
+    Args:
+        seconds: Simulated duration
+        period: Period of every DataChannel (ms)
+        nchannels: Number of DataChannels
+    """
+    clock = VirtualClock()
+    daq = DAQ(DAQSimulator(seed=seed), clock=clock)
+    for number in range(1, nchannels + 1):
+        daq.create_stream(number, period)
+        daq.conf_channel(number, 0, number)
+    daq.start()
+    chunks = []
+    while clock.time() < seconds:
+        daq.ser.wait_ready()
+        chunks.append(daq.ser.read_available())
+    daq.stop()
+    daq.close()
+    return ''.join(chunks)
+
+
+def captured_stream(path):
+    """Data received from the device in a capture file"""
+    return ''.join(data for _, direction, data in read_capture(path)
+                   if direction == READ)
+
+
+def bench_commands(daq, n):
+    """Command round trips, one by one and pipelined"""
+    for i in xrange(n):
+        daq.get_info()
+    daq.send_batch([('\x01\x00', 'h')]*n)
+    return 2*n, 'commands'
+
+
+def bench_decode(data):
+    decoder = StreamDecoder()
+    for i in xrange(0, len(data), CHUNK_SIZE):
+        decoder.feed(data[i:i + CHUNK_SIZE])
+    return decoder.nsamples, 'samples'
+
+
+def bench_calibration(n):
+    """Vectorized raw <-> volts conversions"""
+    raw = np.arange(n) % 65536 - 32768
+    volts = raw_to_volts(raw, 1250, 10, 's')
+    volts_to_raw(np.clip(volts, 0, 4), 1000, 0, 's')
+    return n, 'samples'
+
+
+def bench_record(seconds, period=1, nchannels=2, seed=0):
+    """Record a simulated experiment into a file with `Recorder`
+
+    Args:
+        seconds: Simulated duration
+        period: Period of every DataChannel (ms)
+        nchannels: Number of DataChannels
+    """
+    npoints = int(round(seconds*1e3/period))
+    # Longer experiments run until the duration expires
+    limited = npoints < 65536
+    exp = Experiment()
+    for number in range(1, nchannels + 1):
+        exp.add_stream(number, period, pinput=number,
+                       npoints=npoints if limited else 0,
+                       continuous=not limited)
+
+    daq = DAQ(DAQSimulator(seed=seed), clock=VirtualClock())
+    fd, path = tempfile.mkstemp(suffix='.odr')
+    os.close(fd)
+    try:
+        recorder = Recorder(daq, path, exp)
+        stats = recorder.run(None if limited else seconds)
+    finally:
+        daq.close()
+        os.remove(path)
+    return stats['samples'], 'samples'
+
+
+def _max_rss():
+    """Peak resident memory of the process in bytes (None if unknown)"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes
+    return rss if sys.platform == 'darwin' else rss*1024
+
+
+def _hotspots(profile, top):
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({'function': '%s:%d(%s)' % (filename, line, func),
+                     'calls': nc, 'tottime': tt, 'cumtime': ct})
+    rows.sort(key=lambda r: r['tottime'], reverse=True)
+    return rows[:top]
+
+
+def run(name, func, args=(), profile=False, memory=False, top=10):
+    """Run a scenario
+
+    Args:
+        name: Scenario name
+        func: Function returning the number of processed items and
+            their unit
+        args: Function arguments
+        profile: Run it under cProfile
+        memory: Trace the memory allocations
+        top: Number of hotspots and allocation sites reported
+    Returns:
+        Result dictionary
+    """
+    result = {'name': name}
+    if memory:
+        if tracemalloc:
+            tracemalloc.start()
+        else:
+            rss = _max_rss()
+
+    profiler = cProfile.Profile() if profile else None
+    start = time.time()
+    if profiler:
+        profiler.enable()
+    count, unit = func(*args)
+    if profiler:
+        profiler.disable()
+    elapsed = time.time() - start
+
+    result.update(items=count, unit=unit, seconds=elapsed,
+                  throughput=count/elapsed if elapsed else None)
+    if profiler:
+        result['hotspots'] = _hotspots(profiler, top)
+    if memory and tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        tracemalloc.stop()
+        result['memory'] = {
+            'method': 'tracemalloc', 'peak': peak,
+            'peak_per_item': float(peak)/count if count else None,
+            'allocations': [{'line': str(s.traceback), 'size': s.size,
+                             'count': s.count} for s in stats]}
+    elif memory:
+        growth = None if rss is None else _max_rss() - rss
+        result['memory'] = {
+            'method': 'rusage', 'peak_growth': growth,
+            'peak_per_item': float(growth)/count if count and growth
+            is not None else None}
+    return result
+
+
+def print_result(result):
+    print '%-12s %10d %-8s %8.3f s %12.0f %s/s' % (
+        result['name'], result['items'], result['unit'], result['seconds'],
+        result['throughput'] or 0, result['unit'])
+    memory = result.get('memory')
+    if memory and memory['peak_per_item'] is not None:
+        print '    memory (%s): %.1f bytes/%s' % (
+            memory['method'], memory['peak_per_item'],
+            result['unit'].rstrip('s'))
+    for row in result.get('hotspots', []):
+        print '    %8.3f s %8.3f s %8d  %s' % (
+            row['tottime'], row['cumtime'], row['calls'], row['function'])
+
+
+def main(argv=None):
+    # optparse is used instead of argparse, which is not in the standard
+    # library of Python 2.6
+    parser = optparse.OptionParser(
+        prog='python -m opendaq.bench', usage='%prog [SCENARIO ...] '
+        '[options]\n\nScenarios: ' + ', '.join(SCENARIOS) +
+        ' (default: all)')
+    parser.add_option('-p', '--port', default='sim',
+                      help='device of the command scenario '
+                      '(default: %default)')
+    parser.add_option('-r', '--replay',
+                      help='capture file decoded by the decode scenario '
+                      '(default: simulated stream)')
+    parser.add_option('-n', '--commands', type='int', default=1000,
+                      help='command round trips (default: %default)')
+    parser.add_option('-s', '--seconds', type='float', default=60,
+                      help='simulated stream duration (default: %default)')
+    parser.add_option('--profile', action='store_true',
+                      help='run under cProfile and print the hotspots')
+    parser.add_option('--memory', action='store_true',
+                      help='trace memory allocations')
+    parser.add_option('--top', type='int', default=10,
+                      help='hotspots reported (default: %default)')
+    parser.add_option('-j', '--json', help='write a JSON report')
+    args, scenarios = parser.parse_args(argv)
+    scenarios = scenarios or SCENARIOS
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: %s' % name)
+
+    data = None
+    if 'decode' in scenarios:
+        if args.replay:
+            data = captured_stream(args.replay)
+        else:
+            data = simulated_stream(args.seconds)
+
+    options = dict(profile=args.profile, memory=args.memory, top=args.top)
+    results = []
+    for name in scenarios:
+        if name == 'commands':
+            daq = DAQ(args.port)
+            results.append(run(name, bench_commands, (daq, args.commands),
+                               **options))
+            daq.close()
+        elif name == 'decode':
+            results.append(run(name, bench_decode, (data,), **options))
+        elif name == 'calibration':
+            results.append(run(name, bench_calibration, (10**6,),
+                               **options))
+        elif name == 'record':
+            results.append(run(name, bench_record, (args.seconds,),
+                               **options))
+        print_result(results[-1])
+
+    if args.json:
+        report = {
+            'opendaq': opendaq.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scenarios': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Stream buffer which spills to disk when the consumer lags (requires
+NumPy)
+
+Samples are kept in a fixed-size memory ring. When it is full, new
+samples go to a memory-mapped spill file instead, and they are moved
+back to the ring, in order, as the consumer reads:
+
+    buf = SpillBuffer(capacity=10**6, dtype=SAMPLE_DTYPE)
+    # acquisition thread
+    buf.put(daq.read_stream())
+    # analysis thread
+    samples = buf.get(4096, timeout=1)
+    print buf.occupancy()['pending']
+"""
+
+import tempfile
+import threading
+import numpy as np
+from opendaq.records import PacketStore
+
+SPILL_CHUNK = 2**20
+
+
+class SpillBuffer(object):
+    def __init__(self, capacity=2**20, dtype=np.int16, path=None,
+                 rate=None):
+        """Tiered FIFO buffer
+
+        The buffer is thread-safe, so one thread can put data while
+        another one gets it.
+
+        Args:
+            capacity: Size of the memory ring (items)
+            dtype: Item type. With a structured dtype with 'number',
+                'offset' and 'value' fields (like
+                `opendaq.records.SAMPLE_DTYPE`) the channel of every
+                sample is kept.
+            path: Spill file (None: anonymous temporary file)
+            rate: Items received per second, used to report the lag in
+                seconds
+        """
+        self.dtype = np.dtype(dtype)
+        self.ring = np.zeros(capacity, self.dtype)
+        self.head = 0
+        self.count = 0
+        self.rate = rate
+
+        self.path = path
+        self.file = None
+        self.spill = None
+        self.spill_start = 0
+        self.spill_end = 0
+
+        self.total_in = 0
+        self.total_out = 0
+        self.total_spilled = 0
+        self.max_pending = 0
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return self.count + self.spill_end - self.spill_start
+
+    @property
+    def spilled(self):
+        """Number of items waiting in the spill file"""
+        return self.spill_end - self.spill_start
+
+    def _to_items(self, values):
+        if len(values) and hasattr(values[0], 'values'):
+            store = PacketStore(len(values))
+            store.extend(values)
+            values = store.samples() if self.dtype.names else store.values
+        return np.asarray(values, self.dtype)
+
+    def put(self, values):
+        """Append items
+
+        Args:
+            values: Array of items, or list of stream packets (see
+                `DAQ.read_stream`)
+        """
+        values = self._to_items(values)
+        with self.cond:
+            n = 0
+            if not self.spilled:
+                # Keep the order: nothing goes to the ring while there
+                # are older items in the spill file
+                n = min(len(values), len(self.ring) - self.count)
+                self._ring_put(values[:n])
+            if n < len(values):
+                self._spill_put(values[n:])
+            self.total_in += len(values)
+            self.max_pending = max(self.max_pending, len(self))
+            self.cond.notify_all()
+
+    def _ring_put(self, values):
+        size = len(self.ring)
+        idx = (self.head + self.count + np.arange(len(values))) % size
+        self.ring[idx] = values
+        self.count += len(values)
+
+    def _ring_get(self, n):
+        idx = (self.head + np.arange(n)) % len(self.ring)
+        values = self.ring[idx]
+        self.head = (self.head + n) % len(self.ring)
+        self.count -= n
+        return values
+
+    def _spill_put(self, values):
+        n = len(values)
+        if self.spill is None or self.spill_end + n > len(self.spill):
+            self._grow_spill(n)
+        self.spill[self.spill_end:self.spill_end + n] = values
+        self.spill_end += n
+        self.total_spilled += n
+
+    def _grow_spill(self, n):
+        pending = self.spilled
+        size = 0 if self.spill is None else len(self.spill)
+        if pending + n <= size//2:
+            # Reuse the space of the items already read (the two ranges
+            # never overlap here)
+            self.spill[:pending] = self.spill[self.spill_start:
+                                              self.spill_end]
+            self.spill_start = 0
+            self.spill_end = pending
+            return
+
+        if self.file is None:
+            self.file = open(self.path, 'w+b') if self.path else \
+                tempfile.TemporaryFile()
+        if self.spill is not None:
+            self.spill.flush()
+        size = max(2*size, self.spill_end + n, SPILL_CHUNK)
+        self.spill = None
+        self.file.truncate(size*self.dtype.itemsize)
+        self.spill = np.memmap(self.file, self.dtype, 'r+', shape=(size,))
+
+    def _refill(self):
+        """Move the oldest spilled items to the free space of the ring"""
+        n = min(self.spilled, len(self.ring) - self.count)
+        if n:
+            self._ring_put(self.spill[self.spill_start:self.spill_start + n])
+            self.spill_start += n
+            if not self.spilled:
+                self.spill_start = self.spill_end = 0
+
+    def get(self, n=None, timeout=0):
+        """Remove the oldest items
+
+        Args:
+            n: Maximum number of items (None: all the items in memory)
+            timeout: Seconds to wait for the first item (None: forever)
+        Returns:
+            Array of items (empty if the timeout expired)
+        """
+        with self.cond:
+            if not len(self) and timeout != 0:
+                self.cond.wait(timeout)
+                while timeout is None and not len(self):
+                    self.cond.wait()
+            n = self.count if n is None else min(n, len(self))
+            values = []
+            while n > 0:
+                chunk = self._ring_get(min(n, self.count))
+                values.append(chunk)
+                n -= len(chunk)
+                self._refill()
+            self.total_out += sum(len(v) for v in values)
+        if not values:
+            return np.zeros(0, self.dtype)
+        return np.concatenate(values) if len(values) > 1 else values[0]
+
+    def occupancy(self):
+        """How far behind the consumer is
+
+        Returns:
+            Dictionary with the items in memory, in the spill file and in
+            total (pending), the fill ratio of the ring, the peak of
+            pending items, the items received, read and spilled since the
+            buffer was created, the size of the spill file in bytes and
+            the lag in seconds (None if `rate` is unknown)
+        """
+        with self.cond:
+            pending = len(self)
+            return {
+                'memory': self.count,
+                'spilled': self.spilled,
+                'pending': pending,
+                'fill': float(self.count)/len(self.ring),
+                'max_pending': self.max_pending,
+                'total_in': self.total_in,
+                'total_out': self.total_out,
+                'total_spilled': self.total_spilled,
+                'spill_bytes': 0 if self.spill is None else
+                self.spill.nbytes,
+                'lag': float(pending)/self.rate if self.rate else None,
+            }
+
+    def close(self):
+        """Release the spill file (the pending items are lost)"""
+        with self.cond:
+            self.spill = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.spill_start = self.spill_end = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
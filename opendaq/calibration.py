@@ -0,0 +1,241 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""DAC-to-ADC sweeps and calibration fitting (requires NumPy)
+
+The calibration of the analog inputs is found by wiring the DAC output
+to an analog input, stepping the DAC along a ramp and fitting the raw
+ADC readings against the output voltage.
+
+The differential calibration entries of openDAQ [S] (9:16) are not
+calibrated: a single DAC output wired to both inputs of a pair gives no
+differential voltage to sweep. They keep the values stored in the
+device.
+"""
+
+import struct
+import numpy as np
+
+# PGA gains of openDAQ [M] (conf_adc gain argument 0:4)
+M_GAINS = (1/3., 1, 2, 10, 100)
+
+# Maximum DAC output (volts)
+DAC_LIMIT = 4.096
+
+
+def fit_linear(x, y):
+    """Least-squares fit of y = a*x + b
+
+    All the rows of 2-D inputs are fitted at once.
+
+    Args:
+        x: Independent values (array, last axis holds the points)
+        y: Dependent values (same shape as x)
+    Returns:
+        Slopes and intercepts (one per row)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.shape[-1]
+    sx = x.sum(-1)
+    sy = y.sum(-1)
+    sxx = (x*x).sum(-1)
+    sxy = (x*y).sum(-1)
+    a = (n*sxy - sx*sy)/(n*sxx - sx*sx)
+    b = (sy - a*sx)/n
+    return a, b
+
+
+def raw_to_volts(raw, gain, offset, hw_ver):
+    """Convert raw ADC values to volts (vectorized version of
+    `DAQ.read_analog`)
+
+    Args:
+        raw: Raw ADC values
+        gain: Calibration gain (x100000[M] or x10000[S])
+        offset: Calibration offset
+        hw_ver: Hardware version ('m' or 's')
+    """
+    raw = np.asarray(raw, dtype=float)
+    if hw_ver == 'm':
+        return (-raw*gain/1e5 + offset)/1e3
+    return (raw*gain/1e4 + offset)/1e3
+
+
+def volts_to_raw(volts, dac_gain, dac_offset, hw_ver):
+    """Convert volts to raw DAC values (vectorized version of
+    `DAQ.set_analog`)
+
+    Raises:
+        ValueError: DAC voltage out of range
+    """
+    mv = np.round(np.asarray(volts, dtype=float)*1000)
+    low = -4096 if hw_ver == 'm' else 0
+    if np.any(mv < low) or np.any(mv >= 4096):
+        raise ValueError('DAC voltage out of range')
+
+    raw = 2*(mv*dac_gain/1000.0 + dac_offset + 4096)
+    if hw_ver == 's':
+        raw = np.clip(raw, 0, 65535)
+    return np.round(raw).astype(int)
+
+
+def adc_cal_from_fit(slope, intercept, hw_ver):
+    """Convert fitted slopes and intercepts (millivolts vs raw) into
+    device calibration gains and offsets
+
+    Returns:
+        Integer gains and offsets, as used by `DAQ.set_cal`
+    """
+    slope = np.asarray(slope, dtype=float)
+    scale = -1e5 if hw_ver == 'm' else 1e4
+    gains = np.round(slope*scale).astype(int)
+    offsets = np.round(intercept).astype(int)
+    return gains, offsets
+
+
+def dac_cal_from_fit(slope, intercept):
+    """Convert the fit of the output millivolts vs the DAC code (without
+    calibration) into the DAC calibration gain and offset
+
+    Returns:
+        Integer gain and offset, as used by `DAQ.set_dac_cal`
+    """
+    return int(round(1000.0/slope)), int(round(-intercept/slope))
+
+
+class Calibrator(object):
+    def __init__(self, daq, pinput=1, ninput=0, npoints=20, nreads=4):
+        """DAC-to-ADC calibration engine
+
+        Args:
+            daq: `DAQ` instance, with the DAC wired to `pinput`
+            pinput: Positive analog input connected to the DAC
+            ninput: Negative analog input
+            npoints: Number of points of the DAC ramps
+            nreads: ADC readings per point
+        """
+        self.daq = daq
+        self.pinput = pinput
+        self.ninput = ninput
+        self.npoints = npoints
+        self.nreads = nreads
+
+    def ramp(self, gain=1.0):
+        """DAC voltages of a ramp for a given PGA gain"""
+        limit = min(DAC_LIMIT, DAC_LIMIT/gain)*0.9
+        low = -limit if self.daq.hw_ver == 'm' else 0.05
+        return np.linspace(low, limit, self.npoints)
+
+    def sweep(self, volts, nreads=None):
+        """Run a DAC ramp reading back the ADC at every point
+
+        The DAC and ADC commands of all the points are pipelined.
+
+        Args:
+            volts: DAC output voltages
+            nreads: ADC readings per point
+        Returns:
+            Raw ADC values, with shape (len(volts), nreads)
+        """
+        if nreads is None:
+            nreads = self.nreads
+        codes = volts_to_raw(volts, self.daq.dac_gain, self.daq.dac_offset,
+                             self.daq.hw_ver)
+        return self.sweep_raw(codes, nreads)
+
+    def sweep_raw(self, codes, nreads=None):
+        """Run a ramp of raw DAC values reading back the ADC at every point
+
+        Returns:
+            Raw ADC values, with shape (len(codes), nreads)
+        """
+        if nreads is None:
+            nreads = self.nreads
+        read = ('\x01\x00', 'h')
+        cmds = []
+        for code in codes:
+            cmds.append((struct.pack('!BBH', 24, 2, code), 'h'))
+            cmds.extend([read]*nreads)
+
+        ret = self.daq.send_batch(cmds)
+        values = np.array([r[0] for r in ret], dtype=float)
+        return values.reshape(len(codes), nreads + 1)[:, 1:]
+
+    def calibrate_adc(self, write=False):
+        """Find the calibration of every gain range ([M]) or every
+        single-ended input ([S])
+
+        Only the single-ended entries (1:8) of an openDAQ [S] are fitted
+        and written. Its differential entries (9:16) are left unchanged.
+
+        Args:
+            write: Store the calibration in the device
+        Returns:
+            Gains and offsets, as used by `DAQ.set_cal`
+        """
+        daq = self.daq
+        if daq.hw_ver == 'm':
+            ranges = [(self.pinput, gain) for gain in range(len(M_GAINS))]
+            factors = M_GAINS
+        else:
+            ranges = [(pinput, 0) for pinput in range(1, 9)]
+            factors = [1]*len(ranges)
+
+        volts = np.array([self.ramp(f) for f in factors])
+        raw = np.empty_like(volts)
+        for i, (pinput, gain) in enumerate(ranges):
+            daq.conf_adc(pinput, self.ninput if daq.hw_ver == 'm' else 0,
+                         gain)
+            raw[i] = self.sweep(volts[i]).mean(axis=1)
+
+        slope, intercept = fit_linear(raw, volts*1000)
+        gains, offsets = adc_cal_from_fit(slope, intercept, daq.hw_ver)
+
+        if write:
+            daq.set_cal(list(gains), list(offsets),
+                        'M' if daq.hw_ver == 'm' else 'SE')
+            daq.gains, daq.offsets = daq.get_cal()
+        return gains, offsets
+
+    def calibrate_dac(self, write=False):
+        """Find the DAC calibration, measuring its output with the
+        (already calibrated) analog input
+
+        Args:
+            write: Store the calibration in the device
+        Returns:
+            DAC gain and offset, as used by `DAQ.set_dac_cal`
+        """
+        daq = self.daq
+        daq.conf_adc(self.pinput, self.ninput, 1 if daq.hw_ver == 'm' else 0)
+        index = 2 if daq.hw_ver == 'm' else self.pinput
+
+        # DAC codes around the ramp, without applying the calibration
+        mv = self.ramp()*1000
+        codes = np.round(2*(mv + 4096)).astype(int)
+        raw = self.sweep_raw(codes).mean(axis=1)
+        measured = raw_to_volts(raw, daq.gains[index], daq.offsets[index],
+                                daq.hw_ver)*1000
+
+        slope, intercept = fit_linear(codes/2.0 - 4096, measured)
+        gain, offset = dac_cal_from_fit(slope, intercept)
+
+        if write:
+            daq.set_dac_cal(gain, offset)
+            daq.dac_gain, daq.dac_offset = daq.get_dac_cal()
+        return gain, offset
@@ -0,0 +1,199 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Raw link capture and replay
+
+Capture files start with `MAGIC`, followed by one record per chunk of
+data read or written:
+
+    delay (uint32, microseconds since the previous record)
+    direction (uint8, READ or WRITE)
+    length (uint16)
+    data
+"""
+
+import struct
+from opendaq.transport import Transport
+
+MAGIC = 'ODAQCAP\x01'
+RECORD = struct.Struct('!IBH')
+READ = 0
+WRITE = 1
+
+MAX_DELAY = 2**32 - 1
+MAX_LENGTH = 2**16 - 1
+
+
+def read_capture(path):
+    """Iterate over the records of a capture file
+
+    Yields:
+        (time in seconds since the start of the capture, direction, data)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a capture file: %s" % path)
+        t = 0
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                break
+            delay, direction, length = RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                break
+            t += delay/1e6
+            yield t, direction, data
+
+
+class CaptureTransport(Transport):
+    """Transport wrapper that records all the traffic of another link"""
+
+    def __init__(self, link, fileobj):
+        """Class constructor
+
+        Args:
+            link: Transport to be recorded
+            fileobj: File object open for binary writing. The header is
+                written only if the file is empty, so that a link can be
+                reopened without starting a new capture.
+        """
+        Transport.__init__(self, link.timeout)
+        self.link = link
+        self.fileobj = fileobj
+        self.reset_delay = link.reset_delay
+        self.clock = link.clock
+        if fileobj.tell() == 0:
+            fileobj.write(MAGIC)
+        self._last = self.clock.time()
+
+    def _log(self, direction, data):
+        now = self.clock.time()
+        delay = min(int((now - self._last)*1e6), MAX_DELAY)
+        self._last = now
+        for i in xrange(0, len(data), MAX_LENGTH):
+            chunk = data[i:i + MAX_LENGTH]
+            self.fileobj.write(RECORD.pack(delay, direction, len(chunk)))
+            self.fileobj.write(chunk)
+            delay = 0
+
+    def _open(self):
+        self.link.open()
+
+    def _close(self):
+        self.link.close()
+        self.fileobj.flush()
+
+    def _recv(self, size, timeout):
+        if not self.link.wait_ready(timeout):
+            return ''
+        data = self.link.read(min(size, self.link.inWaiting()), 0)
+        self._log(READ, data)
+        return data
+
+    def _send(self, data):
+        self._log(WRITE, data)
+        self.link.write(data)
+
+    def flushInput(self):
+        # Pending data is read (and recorded) before being discarded
+        self.read_available()
+
+    def setRTS(self, value):
+        self.link.setRTS(value)
+
+
+class ReplayTransport(Transport):
+    """Transport that plays back a capture file
+
+    The data read from the device is served in the same order it was
+    captured. Data which was received after a write only becomes
+    available once the replayed application writes it again.
+    """
+
+    def __init__(self, path, realtime=False, strict=False, timeout=None):
+        """Class constructor
+
+        Args:
+            path: Capture file
+            realtime: Reproduce the original timing of the incoming data
+                (otherwise it is served as fast as possible)
+            strict: Check that the written data matches the capture
+            timeout: Default read timeout in seconds
+        """
+        Transport.__init__(self, timeout)
+        self.path = path
+        self.realtime = realtime
+        self.strict = strict
+        self.records = list(read_capture(path))
+        self._open()
+
+    def _open(self):
+        self._pos = 0
+        self._anchor = self.clock.time()
+
+    def _available(self):
+        """Return the next readable record, or None"""
+        if self._pos >= len(self.records):
+            return None
+        rec = self.records[self._pos]
+        if rec[1] != READ:
+            return None
+        return rec
+
+    def _recv(self, size, timeout):
+        rec = self._available()
+        if rec is None:
+            return ''
+        if self.realtime:
+            wait = self._anchor + rec[0] - self.clock.time()
+            if wait > 0:
+                if timeout is not None and wait > timeout:
+                    self.clock.sleep(timeout)
+                    return ''
+                self.clock.sleep(wait)
+
+        data = ''
+        while rec is not None and len(data) < size:
+            if self.realtime and self._anchor + rec[0] > self.clock.time():
+                break
+            data += rec[2]
+            self._pos += 1
+            rec = self._available()
+        return data
+
+    def _send(self, data):
+        while data:
+            if self._pos >= len(self.records):
+                if self.strict:
+                    raise IOError("Write beyond the end of the capture")
+                return
+            t, direction, rec_data = self.records[self._pos]
+            if direction == READ:
+                # Responses that were never read by the application
+                self._pos += 1
+                continue
+            chunk, data = data[:len(rec_data)], data[len(rec_data):]
+            if self.strict and chunk != rec_data:
+                raise IOError("Written data does not match the capture")
+            self._pos += 1
+            self._anchor = self.clock.time() - t
+
+    @property
+    def finished(self):
+        """True once all the captured data has been replayed"""
+        return self._pos >= len(self.records)
@@ -0,0 +1,66 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time sources of the transports, the simulator and the DAQ
+
+Every `Transport` has a `clock`, which is the system clock by default.
+A `VirtualClock` makes the simulated time jump forward instead of
+sleeping, so long simulated acquisitions run as fast as the CPU allows
+and with exact sample timing:
+
+    daq = DAQ('sim', clock=VirtualClock())
+"""
+
+import threading
+import time
+
+
+class Clock(object):
+    """System clock"""
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    def __init__(self, start=0.0):
+        """Simulated clock
+
+        Time only moves forward when some code sleeps (or when `advance`
+        is called), and sleeping returns immediately.
+
+        Args:
+            start: Initial time (seconds)
+        """
+        self.now = start
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.now += seconds
+
+
+SYSTEM_CLOCK = Clock()
@@ -0,0 +1,169 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Lossless compression of int16 sample blocks (requires NumPy)
+
+Each block is delta (order 1) or delta-of-delta (order 2) encoded, the
+residuals are zigzag mapped to unsigned integers and bit-packed with the
+smallest width that fits them. The packed data can be further
+compressed with zlib. Every block becomes a frame:
+
+    magic (uint8), method (uint8), order (uint8), bit width (uint8),
+    number of samples (uint32), payload size (uint32), payload
+
+Encoders and decoders carry the last samples of a block over to the
+next one, so a stream can be split in blocks of any size.
+"""
+
+import struct
+import zlib
+import numpy as np
+
+FRAME = struct.Struct('!BBBBII')
+FRAME_MAGIC = 0xDE
+
+BITPACK = 0
+ZLIB = 1
+
+
+def zigzag_encode(values):
+    """Map signed integers to unsigned ones (0, -1, 1, -2... -> 0, 1, 2...)
+    """
+    values = np.asarray(values, np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def zigzag_decode(values):
+    values = np.asarray(values, np.uint64).astype(np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+
+def pack_bits(values, bits):
+    """Pack unsigned integers (< 2**32) using `bits` bits each
+
+    Returns:
+        Packed data (MSB first, last byte padded with zeros)
+    """
+    if not bits or not len(values):
+        return ''
+    v = np.asarray(values).astype('>u4')
+    b = np.unpackbits(v.view(np.uint8).reshape(-1, 4), axis=1)
+    return np.packbits(b[:, 32 - bits:]).tostring()
+
+
+def unpack_bits(data, bits, count):
+    """Unpack `count` unsigned integers of `bits` bits each"""
+    if not bits or not count:
+        return np.zeros(count, np.uint32)
+    b = np.unpackbits(np.frombuffer(data, np.uint8))[:count*bits]
+    full = np.zeros((count, 32), np.uint8)
+    full[:, 32 - bits:] = b.reshape(count, bits)
+    return np.packbits(full, axis=1).view('>u4').ravel().astype(np.uint32)
+
+
+class BlockEncoder(object):
+    def __init__(self, order=1, method=BITPACK, level=6):
+        """Streaming encoder of int16 sample blocks
+
+        Args:
+            order: 1 for delta, 2 for delta-of-delta encoding
+            method: BITPACK or ZLIB (bit-packing followed by zlib)
+            level: zlib compression level
+        """
+        if order not in (1, 2):
+            raise ValueError("Invalid order")
+        if method not in (BITPACK, ZLIB):
+            raise ValueError("Invalid method")
+        self.order = order
+        self.method = method
+        self.level = level
+        self.history = np.zeros(order, np.int64)
+
+    def encode(self, values):
+        """Encode a block of samples
+
+        Args:
+            values: int16 samples
+        Returns:
+            Encoded frame
+        """
+        values = np.asarray(values, np.int64)
+        x = np.concatenate((self.history, values))
+        residuals = np.diff(x, n=self.order)
+        self.history = x[len(x) - self.order:]
+
+        z = zigzag_encode(residuals)
+        bits = int(z.max()).bit_length() if len(z) else 0
+        payload = pack_bits(z, bits)
+        if self.method == ZLIB:
+            payload = zlib.compress(payload, self.level)
+        return FRAME.pack(FRAME_MAGIC, self.method, self.order, bits,
+                          len(values), len(payload)) + payload
+
+
+class BlockDecoder(object):
+    def __init__(self):
+        """Streaming decoder of the frames made by `BlockEncoder`
+
+        Data can be fed in chunks of any size.
+        """
+        self.buf = bytearray()
+        self.history = None
+
+    def _decode_frame(self, method, order, bits, count, payload):
+        if method == ZLIB:
+            payload = zlib.decompress(payload)
+        residuals = zigzag_decode(unpack_bits(payload, bits, count))
+
+        if self.history is None or len(self.history) != order:
+            self.history = np.zeros(order, np.int64)
+        # Integrate `order` times, starting from the previous samples
+        x = residuals
+        for k in range(order, 0, -1):
+            start = np.diff(self.history, n=k - 1)[-1]
+            x = start + np.cumsum(x)
+        self.history = np.concatenate((self.history, x))[-order:]
+        return x.astype(np.int16)
+
+    def feed(self, data):
+        """Decode a chunk of encoded data
+
+        Returns:
+            int16 samples of all the frames completed by the chunk
+        Raises:
+            ValueError: Corrupted data
+        """
+        self.buf.extend(data)
+        blocks = []
+        pos = 0
+        while len(self.buf) - pos >= FRAME.size:
+            magic, method, order, bits, count, size = FRAME.unpack_from(
+                str(self.buf[pos:pos + FRAME.size]))
+            if magic != FRAME_MAGIC:
+                raise ValueError("Bad frame")
+            end = pos + FRAME.size + size
+            if len(self.buf) < end:
+                break
+            payload = str(self.buf[pos + FRAME.size:end])
+            blocks.append(self._decode_frame(method, order, bits, count,
+                                             payload))
+            pos = end
+
+        del self.buf[:pos]
+        if not blocks:
+            return np.zeros(0, np.int16)
+        return np.concatenate(blocks)
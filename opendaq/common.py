@@ -85,3 +85,55 @@ def str2hex(string):
     """Hexdump a string """
     hexstr = ["%02x" % ord(c) for c in string]
     return ' '.join(hexstr)
+
+
+class RTTEstimator(object):
+    def __init__(self, initial=1.0, min_timeout=0.05, max_timeout=1.0,
+                 alpha=0.125, beta=0.25, k=4):
+        """Round-trip time estimator of the commands
+
+        A smoothed mean and mean deviation of the round-trip time of
+        every command are kept, and its timeout is set to mean + k*dev,
+        as TCP does with its retransmission timeout (RFC 6298).
+
+        Args:
+            initial: Timeout of the commands not sent yet (seconds)
+            min_timeout, max_timeout: Limits of the timeouts (seconds)
+            alpha: Weight of the new samples in the mean
+            beta: Weight of the new samples in the deviation
+            k: Deviations added to the mean
+        """
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        # key: [mean, deviation, timeout]
+        self.estimates = {}
+
+    def _clamp(self, timeout):
+        return max(self.min_timeout, min(timeout, self.max_timeout))
+
+    def timeout(self, key):
+        """Timeout of a command (seconds)"""
+        est = self.estimates.get(key)
+        return self.initial if est is None else est[2]
+
+    def update(self, key, rtt):
+        """Add a measured round-trip time (seconds)"""
+        est = self.estimates.get(key)
+        if est is None:
+            mean, dev = rtt, rtt/2.0
+        else:
+            mean, dev = est[:2]
+            dev += self.beta*(abs(mean - rtt) - dev)
+            mean += self.alpha*(rtt - mean)
+        self.estimates[key] = [mean, dev,
+                               self._clamp(mean + self.k*dev)]
+
+    def backoff(self, key):
+        """Double the timeout of a command which did not answer in time"""
+        est = self.estimates.get(key)
+        if est is not None:
+            est[2] = self._clamp(2*est[2])
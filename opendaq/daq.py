@@ -20,30 +20,76 @@
 # along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
 
 import struct
-import time
-import serial
+from array import array
 from opendaq.common import crc, check_crc, mkcmd, check_stream_crc,\
-    LengthError
-from opendaq.simulator import DAQSimulator
+    CRCError, LengthError, RTTEstimator, str2hex
+from opendaq.transport import open_transport
+from opendaq.capture import CaptureTransport
+from opendaq.experiment import INPUT_MODES
+from opendaq.stream import StreamDecoder
 
 BAUDS = 115200
-INPUT_MODES = ('ANALOG_INPUT', 'ANALOG_OUTPUT', 'DIGITAL_INPUT',
-               'DIGITAL_OUTPUT', 'COUNTER_INPUT', 'CAPTURE_INPUT')
 LED_OFF = 0
 LED_GREEN = 1
 LED_RED = 2
 
 NAK = mkcmd(160, '')
 
+# Link timeout, also used for the commands whose latency is unknown yet
+TIMEOUT = 1
+# Lower limit of the adaptive command timeouts
+MIN_TIMEOUT = 0.05
+
+# Maximum number of commands written in a row by send_batch
+BATCH_SIZE = 16
+
+# Maximum values per load_signal command (its length field is one byte)
+MAX_LOAD = 126
+
+# Response of the ADC read command: checksum, command, length and value
+ADC_RESPONSE = struct.Struct('!HBBh')
+
 
 class DAQ:
-    def __init__(self, port, debug=False):
-        """Class constructor"""
+    def __init__(self, port, debug=False, capture=None, clock=None):
+        """Class constructor
+
+        Args:
+            port: Serial port name, 'sim' for the simulator, any other
+                port specification accepted by `open_transport`
+                ('socket://host:port', 'pty://path', 'replay://path') or
+                a `Transport` instance
+            debug: Print the command packets and their responses
+            capture: Record all the link traffic into this file
+            clock: Time source shared with the link (see opendaq.clock).
+                Defaults to the clock of the link.
+
+        The round-trip time of every command is measured, and its
+        response is only waited for a few times its usual latency (see
+        `latency`), so a lost response does not stall the caller for the
+        whole link timeout. A response which arrives after its timeout is
+        discarded before the next command is sent (the rest of the link
+        timeout is waited then), so it is never taken as the response of
+        another command.
+        """
         self.port = port
         self.debug = debug
+        self.clock = clock
         self.simulate = (port == 'sim')
+        self.capture = open(capture, 'wb') if capture else None
 
         self.measuring = False
+        # Commands sent while an experiment runs stop it first (see
+        # `send_command`)
+        self.stop_stream = True
+        self.experiment = None
+        self.decoder = StreamDecoder()
+        # Stream packets received before the response of a command
+        self.pending_packets = []
+        self.latency = RTTEstimator(TIMEOUT, MIN_TIMEOUT, TIMEOUT)
+        # Time until which the response of a command that timed out may
+        # still arrive (None: the link is in sync)
+        self.late = None
         self.gain = 0
         self.pinput = 1
         self.open()
@@ -53,41 +99,98 @@ class DAQ:
         self.gains, self.offsets = self.get_cal()
         self.dac_gain, self.dac_offset = self.get_dac_cal()
 
+    @classmethod
+    def from_id(cls, dev_id, ports=None, cache=None, **kwargs):
+        """Open the device with a given id number
+
+        The device is found with `opendaq.discovery.find_device`, and the
+        link used to identify it is kept open, so the device reset delay
+        is only waited once.
+
+        Args:
+            dev_id: Device id number
+            ports: Candidate ports (None: all the serial ports which may
+                have an openDAQ)
+            cache: `opendaq.discovery.DeviceCache` (None: the default
+                cache file, ~/.opendaq/devices.json, which is created or
+                updated with the ports found)
+            kwargs: Other `DAQ` arguments
+        Raises:
+            IOError: The device was not found
+        """
+        from opendaq.discovery import DeviceCache, find_device
+        if cache is None:
+            cache = DeviceCache()
+        info, link = find_device(dev_id, ports, cache=cache, keep_open=True)
+        # The probe link waits PROBE_TIMEOUT for responses
+        link.timeout = TIMEOUT
+        delay = link.reset_delay
+        # The device has already been reset by the probe
+        link.reset_delay = 0
+        try:
+            return cls(link, **kwargs)
+        except Exception:
+            link.close()
+            raise
+        finally:
+            link.reset_delay = delay
+
     def open(self):
         """Open the serial port
-        Configure serial port to be opened."""
-        if self.simulate:
-            self.ser = DAQSimulator(self.port, BAUDS, timeout=1)
+        Configure the link to the device to be opened."""
+        link = open_transport(self.port, BAUDS, timeout=TIMEOUT)
+        self.late = None
+        if self.clock is None:
+            self.clock = link.clock
         else:
-            self.ser = serial.Serial(self.port, BAUDS, timeout=1)
-            self.ser.setRTS(0)
-            time.sleep(2)
+            link.clock = self.clock
+        if self.capture:
+            if self.capture.closed:
+                # Reopened after `close`: continue the same capture
+                self.capture = open(self.capture.name, 'ab')
+                self.capture.seek(0, 2)
+            link = CaptureTransport(link, self.capture)
+        self.ser = link
+        if self.ser.reset_delay:
+            self.clock.sleep(self.ser.reset_delay)
 
     def close(self):
-        """Close the serial port"""
+        """Close the serial port (and the capture file)"""
         self.ser.close()
+        if self.capture:
+            self.capture.close()
 
-    def send_command(self, cmd, ret_fmt):
+    def send_command(self, cmd, ret_fmt, stop_stream=None):
         """Build a command packet, send it to the openDAQ and process the
         response
 
         Args:
             cmd: Command ID
             ret_fmt: Payload format using python 'struct' format characters
+            stop_stream: Stop the running experiments first (None: use the
+                `stop_stream` attribute). If False, the experiments keep
+                running, and the stream packets received before the
+                response are kept for `read_stream`.
         Returns:
             Command ID and arguments of the response
         Raises:
             LengthError: The legth of the response is not the expected
         """
-        if self.measuring:
+        if stop_stream is None:
+            stop_stream = self.stop_stream
+        if self.measuring and stop_stream:
             self.stop()
 
         # Add 'command' and 'length' fields to the format string
         fmt = '!BB' + ret_fmt
         ret_len = 2 + struct.calcsize(fmt)
         packet = crc(cmd) + cmd
+        key = ord(cmd[0])
+        self.__sync_link()
+        start = self.clock.time()
         self.ser.write(packet)
-        ret = self.ser.read(ret_len)
+        ret = self.__read_packet(self.latency.timeout(key))
+        self.__track_latency(key, start, ret)
         if self.debug:
             print 'Command:  ',
             for c in packet:
@@ -112,6 +215,151 @@ class DAQ:
         # Strip 'command' and 'length' values from returned data
         return data[2:]
 
+    def __read_packet(self, timeout):
+        """Read a response packet, using its length field to find its end
+
+        A NAK (or any short packet) is returned as soon as it arrives,
+        instead of waiting for the length of the expected response.
+        While an experiment runs, the stream packets which arrive first
+        are decoded and kept.
+
+        Args:
+            timeout: Seconds to wait for the whole packet
+        """
+        deadline = self.clock.time() + timeout
+        ret = self.__skip_stream(deadline) if self.measuring else ''
+        if len(ret) < 4:
+            ret += self.ser.read(4 - len(ret),
+                                 max(0, deadline - self.clock.time()))
+        if len(ret) == 4:
+            ret += self.ser.read(ord(ret[3]),
+                                 max(0, deadline - self.clock.time()))
+        return ret
+
+    def __skip_stream(self, deadline):
+        """Decode the stream packets which precede a command response
+
+        Stream packets start with a 0x7E flag, which can not be the first
+        byte (the high byte of the checksum) of a short response.
+
+        Returns:
+            First byte of the response ('' if the deadline expired)
+        """
+        decoder = self.decoder
+        while True:
+            c = self.ser.read(1, max(0, deadline - self.clock.time()))
+            if not c:
+                return ''
+            # decoder.buf holds the start of an incomplete packet
+            if c != '\x7e' and not decoder.buf:
+                return c
+            self.pending_packets.extend(decoder.feed(c))
+
+    def __track_latency(self, key, start, ret):
+        """Update the timeout of a command with the arrival of its response
+
+        Args:
+            key: Command number
+            start: Time when the command was sent
+            ret: Response read (shorter than its length field if the
+                timeout expired)
+        """
+        if len(ret) < 4 or len(ret) < 4 + ord(ret[3]):
+            self.latency.backoff(key)
+            # The rest of the response may still arrive
+            self.late = max(self.late, start + TIMEOUT)
+        else:
+            self.latency.update(key, self.clock.time() - start)
+
+    def __sync_link(self):
+        """Get the link ready to send a command
+
+        The responses of the commands which timed out are discarded. The
+        link timeout since they were sent is waited first, so that a
+        late response can not be read as the one of the next command.
+        While an experiment runs, the pending stream data is decoded and
+        kept instead of discarded.
+        """
+        if self.late is not None:
+            self.clock.sleep(max(0, self.late - self.clock.time()))
+            self.late = None
+            if not self.measuring:
+                self.ser.flushInput()
+        if self.measuring:
+            self.pending_packets.extend(
+                self.decoder.feed(self.ser.read_available()))
+
+    def __read_response(self, cmd, ret_fmt, start):
+        """Read the response of a pipelined command
+
+        Args:
+            cmd: Command packet (without its checksum)
+            ret_fmt: Payload format of the response
+            start: Time when the command was sent
+        Returns:
+            Arguments of the response, or None if a NAK was received
+        Raises:
+            LengthError: The length of the response is not the expected
+        """
+        key = ord(cmd[0])
+        ret = self.__read_packet(self.latency.timeout(key))
+        self.__track_latency(key, start, ret)
+        if self.debug:
+            print 'Response: ', str2hex(ret)
+
+        if ret == NAK:
+            return None
+
+        fmt = '!BB' + ret_fmt
+        ret_len = 2 + struct.calcsize(fmt)
+        if len(ret) != ret_len:
+            raise LengthError("Bad packet length %d (it should be %d)" %
+                              (len(ret), ret_len))
+        return struct.unpack(fmt, check_crc(ret))[2:]
+
+    def send_batch(self, commands, stop_stream=None):
+        """Send several commands and process their responses
+
+        The commands are pipelined: they are written in groups of
+        BATCH_SIZE, without waiting for the response of each one.
+
+        Args:
+            commands: List of (cmd, ret_fmt) tuples, as in `send_command`
+            stop_stream: Stop the running experiments first (see
+                `send_command`)
+        Returns:
+            List with the arguments of the response of each command
+        Raises:
+            IOError: NAK response received (raised once all the responses
+                of the batch have been read)
+            LengthError: The length of a response is not the expected
+        """
+        if stop_stream is None:
+            stop_stream = self.stop_stream
+        if self.measuring and stop_stream:
+            self.stop()
+
+        results = []
+        for i in range(0, len(commands), BATCH_SIZE):
+            batch = commands[i:i + BATCH_SIZE]
+            packet = ''.join(crc(cmd) + cmd for cmd, _ in batch)
+            if self.debug:
+                print 'Command:  ', str2hex(packet)
+            self.__sync_link()
+            start = self.clock.time()
+            self.ser.write(packet)
+            try:
+                for cmd, fmt in batch:
+                    results.append(self.__read_response(cmd, fmt, start))
+            except (ValueError, struct.error):
+                # Discard the responses of the batch not read yet
+                self.late = max(self.late, start + TIMEOUT)
+                raise
+
+        if None in results:
+            raise IOError("NAK response received")
+        return results
+
     def get_info(self):
         """Read device configuration
 
@@ -136,12 +384,85 @@ class DAQ:
             Voltage value
         """
         value = self.send_command('\x01\x00', 'h')[0]
-        # Raw value to voltage->
+        return self.__raw_to_volts([value])[0]
+
+    def __raw_to_volts(self, values):
+        """Convert raw ADC values to volts with the calibration of the
+        current ADC settings"""
         index = self.gain + 1 if self.hw_ver == 'm' else self.pinput
-        value *= self.gains[index]
-        value = -value/1e5 if self.hw_ver == 'm' else value/1e4
-        value = (value + self.offsets[index])/1e3
-        return value
+        gain, offset = self.gains[index], self.offsets[index]
+        if self.hw_ver == 'm':
+            return [(-v*gain/1e5 + offset)/1e3 for v in values]
+        return [(v*gain/1e4 + offset)/1e3 for v in values]
+
+    def read_adc_block(self, n, batch_size=BATCH_SIZE):
+        """Read the ADC `n` times
+
+        The read commands are pipelined: they are written in groups of
+        `batch_size`, and the responses of each group are read and
+        parsed at once. Like any other command, their timeouts adapt to
+        the latency of the link, and a running experiment is stopped
+        first unless the `stop_stream` attribute is cleared (see
+        `send_command`).
+
+        Args:
+            n: Number of conversions
+            batch_size: Commands written in a row
+        Returns:
+            Raw ADC values (array of signed 16-bit integers)
+        Raises:
+            LengthError: Missing or bad responses
+            CRCError: Bad response checksum
+        """
+        if self.measuring and self.stop_stream:
+            self.stop()
+
+        cmd = '\x01\x00'
+        key = ord(cmd[0])
+        packet = crc(cmd) + cmd
+        values = array('h')
+        for i in range(0, n, batch_size):
+            count = min(batch_size, n - i)
+            self.__sync_link()
+            start = self.clock.time()
+            self.ser.write(packet*count)
+            responses = []
+            for j in range(count):
+                ret = self.__read_packet(self.latency.timeout(key))
+                self.__track_latency(key, start, ret)
+                responses.append(ret)
+                if len(ret) != ADC_RESPONSE.size:
+                    # Discard the responses not read yet
+                    self.late = max(self.late, start + TIMEOUT)
+                    break
+            ret = ''.join(responses)
+            if self.debug:
+                print 'Command:  ', str2hex(packet*count)
+                print 'Response: ', str2hex(ret)
+            if len(ret) != count*ADC_RESPONSE.size:
+                raise LengthError("Bad block length %d (it should be %d)" %
+                                  (len(ret), count*ADC_RESPONSE.size))
+
+            fields = struct.unpack('!' + 'HBBh'*count, ret)
+            for csum, ncmd, length, value in zip(*[iter(fields)]*4):
+                if ncmd != 1 or length != 2:
+                    raise LengthError("Bad ADC response")
+                if csum != ncmd + length + (value >> 8 & 0xff) + \
+                        (value & 0xff):
+                    raise CRCError
+            values.extend(fields[3::4])
+        return values
+
+    def read_analog_block(self, n, batch_size=BATCH_SIZE):
+        """Read the ADC `n` times, in volts
+
+        See `read_adc_block`.
+
+        Returns:
+            Voltage values (array of floats)
+        """
+        return array('d', self.__raw_to_volts(
+            self.read_adc_block(n, batch_size)))
 
     def conf_adc(self, pinput, ninput=0, gain=0, nsamples=20):
         """ Configure the analog-to-digital converter.
@@ -675,6 +996,7 @@ class DAQ:
         if not 0 <= nsamples < 255:
             raise ValueError("samples number out of range")
 
+        self.experiment = None
         cmd = struct.pack('!BBBBBBBB', 22, 6, number, mode,
                           pinput, ninput, gain, nsamples)
         return self.send_command(cmd, 'BBBBBB')
@@ -702,6 +1024,7 @@ class DAQ:
         if continuous not in [0, 1]:
             raise ValueError("continuous value out of range")
 
+        self.experiment = None
         cmd = struct.pack('!BBBHb', 32, 4, number, npoints, int(continuous))
         return self.send_command(cmd, 'BHB')
 
@@ -717,6 +1040,7 @@ class DAQ:
         """
         if not 1 <= number <= 4:
             raise ValueError('Invalid number')
+        self.experiment = None
         cmd = struct.pack('!BBB', 57, 1, number)
         return self.send_command(cmd, 'B')
 
@@ -735,6 +1059,7 @@ class DAQ:
             raise ValueError('Invalid number')
         if not 1 <= period <= 65535:
             raise ValueError('Invalid period')
+        self.experiment = None
         cmd = struct.pack('!BBBH', 19, 3, number, period)
         return self.send_command(cmd, 'BH')
 
@@ -751,6 +1076,7 @@ class DAQ:
         if not 100 <= period <= 65535:
             raise ValueError('Invalid period')
 
+        self.experiment = None
         cmd = struct.pack('!BBH', 21, 2, period)
         return self.send_command(cmd, 'H')
 
@@ -770,16 +1096,41 @@ class DAQ:
         if not edge in [0, 1]:
             raise ValueError('Invalid edge')
 
+        self.experiment = None
         cmd = struct.pack('!BBBB', 20, 2, number, edge)
         return self.send_command(cmd, 'BB')
 
+    def apply_experiment(self, experiment):
+        """
+        Configure all the DataChannels of an experiment
+
+        The experiment is validated and all its commands are sent in a
+        single pipelined batch. Only the channels that changed since the
+        last applied experiment are sent.
+
+        Args:
+            experiment: `Experiment` instance
+        Raises:
+            ValueError: Invalid experiment
+        """
+        cmds = experiment.commands(self.hw_ver, self.experiment)
+        self.experiment = None
+        if cmds:
+            self.send_batch(cmds)
+        self.experiment = experiment.copy()
+
     def load_signal(self, data, offset):
         """
         Load an array of values in volts to preload DAC output
 
+        The values are sent in commands of up to MAX_LOAD values.
+
         Args:
-            data: Total number of data points [1:400]
-            offset: Offset for each value
+            data: Values in volts (up to 400 data points)
+            offset: Position of the first value in the signal buffer of
+                the device [0:399]
+        Returns:
+            Number of values loaded and offset
         Raises:
             LengthError: Invalid dada length
         """
@@ -792,11 +1143,16 @@ class DAQ:
             if self.hw_ver == "s":
                 raw *= 2
 
-            values.append(raw)
+            values.append(int(round(raw)))
 
-        cmd = struct.pack(
-            '!bBh%dH' % len(values), 23, len(values) * 2 + 2, offset, *values)
-        return self.send_command(cmd, 'Bh')
+        commands = []
+        for pos in range(0, len(values), MAX_LOAD):
+            chunk = values[pos:pos + MAX_LOAD]
+            cmd = struct.pack('!bBh%dH' % len(chunk), 23, len(chunk)*2 + 2,
+                              offset + pos, *chunk)
+            commands.append((cmd, 'Bh'))
+        self.send_batch(commands)
+        return len(values), offset
 
     def start(self):
         """
@@ -804,26 +1160,31 @@ class DAQ:
         """
         self.send_command('\x40\x00', '')
         self.measuring = True
+        self.decoder = StreamDecoder()
+        self.pending_packets = []
 
     def stop(self):
         """
         Stop all running experiments
-        """
 
-        self.measuring = False
+        The stream packets received before the response are kept for
+        `read_stream`.
+        """
         while True:
             try:
-                self.send_command('\x50\x00', '')
+                self.send_command('\x50\x00', '', stop_stream=False)
                 break
             except:
-                time.sleep(0.2)
+                self.clock.sleep(0.2)
                 self.flush()
+        self.measuring = False
 
     def flush(self):
         """
         Flush internal buffers
         """
         self.ser.flushInput()
+        del self.decoder.buf[:]
 
     def flush_stream(self, data, channel):
         """
@@ -949,6 +1310,31 @@ class DAQ:
         channel.append(self.header[4]-1)
         return 1
 
+    def read_stream(self, block=True, timeout=None):
+        """Read and decode all the pending stream data
+
+        Unlike `get_stream`, which reads a single packet byte by byte,
+        this reads the data in bulk and keeps the whole packet headers.
+        The link is only waited on while an experiment is running: with
+        no experiment, or with `block` False, it returns at once. The
+        packets received while reading command responses are returned
+        first.
+
+        Args:
+            block: Wait for incoming data
+            timeout: Seconds to wait (None: the link timeout)
+        Returns:
+            List of `StreamPacket` objects
+        """
+        if timeout is None:
+            timeout = self.ser.timeout
+        packets, self.pending_packets = self.pending_packets, []
+        if block and self.measuring and not packets and \
+                not self.ser.wait_ready(timeout):
+            return packets
+        packets.extend(self.decoder.feed(self.ser.read_available()))
+        return packets
+
     def set_id(self, id):
         """
         Identify openDAQ device
@@ -975,7 +1361,7 @@ class DAQ:
         """
         if not 0 <= cpol <= 1 or not 0 <= cpha <= 1:
             raise ValueError('Invalid spisw_config values')
-        cmd = struct.pack('!BBB', 26, 2, cpol, cpha)
+        cmd = struct.pack('!BBBB', 26, 2, cpol, cpha)
         return self.send_command(cmd, 'BB')
 
     def spi_setup(self, nbytes, sck=1, mosi=2, miso=3):
@@ -1015,3 +1401,31 @@ class DAQ:
             cmd = struct.pack('!BBB', 29, 1, value)
             ret = self.send_command(cmd, 'B')[0]
         return ret
+
+    def spi_transfer(self, data, word=False):
+        """Bit-bang SPI transfer (send+receive) of a buffer
+
+        The per-byte (or per-word) transfers are pipelined, instead of
+        waiting for the response of each one.
+
+        Args:
+            data: Data to send (string or bytearray)
+            word: send 2-byte words (big endian), instead of bytes
+        Returns:
+            Received data, as a string of the same length
+        Raises:
+            ValueError: Odd data length in word mode
+        """
+        data = str(data)
+        if word:
+            if len(data) % 2:
+                raise ValueError("data length must be even in word mode")
+            values = struct.unpack('!%dH' % (len(data)/2), data)
+            fmt = '!%dH'
+            cmds = [(struct.pack('!BBH', 29, 2, v), 'H') for v in values]
+        else:
+            fmt = '!%dB'
+            cmds = [(struct.pack('!BBB', 29, 1, ord(c)), 'B') for c in data]
+
+        ret = self.send_batch(cmds)
+        return struct.pack(fmt % len(ret), *[r[0] for r in ret])
@@ -0,0 +1,314 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Discovery of the openDAQ devices connected to a computer
+
+All the candidate ports are probed at the same time, and every device
+only answers an identification command (no calibration is read), so the
+whole scan takes about one device reset delay:
+
+    for info in discover():
+        print info.port, info.dev_id
+
+    daq = DAQ.from_id(123)
+
+The port of every device found is kept in a `DeviceCache`, which is
+checked first the next time a device is looked for.
+"""
+
+import glob
+import json
+import os
+import struct
+import threading
+import time
+from opendaq.common import crc, check_crc
+from opendaq.daq import BAUDS
+from opendaq.transport import open_transport
+
+# Ports probed by default
+PORT_PATTERNS = ('/dev/ttyUSB*', '/dev/ttyACM*', '/dev/tty.usbserial*',
+                 '/dev/tty.usbmodem*')
+
+# Seconds to wait for the identification response
+PROBE_TIMEOUT = 0.5
+
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.opendaq',
+                          'devices.json')
+
+# Identification command (39) and its response: checksum, command,
+# length, hardware version, firmware version and device id
+ID_CMD = '\x27\x00'
+ID_RESPONSE = struct.Struct('!HBBBBI')
+
+
+class DeviceInfo(object):
+    """Identity of a device
+
+    Attributes:
+        port: Port of the device
+        hw_ver: Hardware version ('m' or 's')
+        fw_ver: Firmware version
+        dev_id: Device id number
+    """
+    __slots__ = ('port', 'hw_ver', 'fw_ver', 'dev_id')
+
+    def __init__(self, port, hw_ver, fw_ver, dev_id):
+        self.port = port
+        self.hw_ver = hw_ver
+        self.fw_ver = fw_ver
+        self.dev_id = dev_id
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(
+            getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'DeviceInfo(port=%r, hw_ver=%r, fw_ver=%d, dev_id=%d)' % (
+            self.port, self.hw_ver, self.fw_ver, self.dev_id)
+
+    def to_dict(self):
+        return dict((a, getattr(self, a)) for a in self.__slots__)
+
+
+def candidate_ports(patterns=PORT_PATTERNS):
+    """Serial ports which may have an openDAQ connected
+
+    On Windows, where there are no device files, the ports listed by
+    pyserial are returned.
+    """
+    if os.name == 'nt':
+        from serial.tools import list_ports
+        return sorted(p[0] for p in list_ports.comports())
+    ports = set()
+    for pattern in patterns:
+        ports.update(glob.glob(pattern))
+    return sorted(ports)
+
+
+def identify(link, timeout=PROBE_TIMEOUT):
+    """Identification handshake on an open link
+
+    Args:
+        link: Open `Transport`
+        timeout: Seconds to wait for the response
+    Returns:
+        Hardware version ('m' or 's'), firmware version and device id
+    Raises:
+        IOError: No valid response
+    """
+    link.flushInput()
+    link.write(crc(ID_CMD) + ID_CMD)
+    ret = link.read(ID_RESPONSE.size, timeout)
+    if len(ret) != ID_RESPONSE.size:
+        raise IOError("No identification response")
+    try:
+        check_crc(ret)
+    except ValueError:
+        raise IOError("Bad identification response")
+    _, cmd, length, hw_ver, fw_ver, dev_id = ID_RESPONSE.unpack(ret)
+    if cmd != 39 or length != ID_RESPONSE.size - 4:
+        raise IOError("Bad identification response")
+    return 'm' if hw_ver == 1 else 's', fw_ver, dev_id
+
+
+def probe(port, timeout=PROBE_TIMEOUT, keep_open=False):
+    """Identify the device connected to a port
+
+    The port is opened, the reset delay of the link is waited and only
+    the identification command is sent.
+
+    Args:
+        port: Port specification (see `DAQ`)
+        timeout: Seconds to wait for the response
+        keep_open: Return the open link too
+    Returns:
+        `DeviceInfo` (and the link, if `keep_open`), or None if there is
+        no openDAQ at the port
+    """
+    try:
+        link = open_transport(port, BAUDS, timeout=timeout)
+    except (IOError, OSError, ValueError):
+        return None
+    try:
+        if link.reset_delay:
+            link.clock.sleep(link.reset_delay)
+        info = DeviceInfo(port, *identify(link, timeout))
+    except (IOError, OSError):
+        link.close()
+        return None
+    if keep_open:
+        return info, link
+    link.close()
+    return info
+
+
+def _probe_all(ports, timeout, keep_open=False):
+    """Probe several ports in parallel, one thread per port"""
+    results = [None]*len(ports)
+
+    def run(i):
+        results[i] = probe(ports[i], timeout, keep_open)
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(len(ports))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def discover(ports=None, timeout=PROBE_TIMEOUT, cache=None):
+    """Find the openDAQ devices connected to a list of ports
+
+    Args:
+        ports: Ports to probe (None: `candidate_ports`)
+        timeout: Seconds to wait for every identification response
+        cache: `DeviceCache` updated with the results
+    Returns:
+        List of `DeviceInfo`, in port order
+    """
+    if ports is None:
+        ports = candidate_ports()
+    found = [info for info in _probe_all(list(ports), timeout) if info]
+    if cache is not None:
+        cache.update(ports, found)
+    return found
+
+
+def find_device(dev_id, ports=None, timeout=PROBE_TIMEOUT, cache=None,
+                keep_open=False):
+    """Find the port of a device
+
+    The cached port of the device is probed first; all the ports are
+    only scanned if the device is not there.
+
+    Args:
+        dev_id: Device id number
+        ports: Ports to probe (None: `candidate_ports`)
+        timeout: Seconds to wait for every identification response
+        cache: `DeviceCache` used and updated (None: no cache)
+        keep_open: Return the open link too
+    Returns:
+        `DeviceInfo` (and the link, if `keep_open`)
+    Raises:
+        IOError: The device was not found
+    """
+    if cache is not None:
+        cached = cache.find(dev_id)
+        if cached is not None:
+            result = probe(cached.port, timeout, keep_open)
+            info = result[0] if keep_open and result else result
+            if info is not None:
+                cache.update([cached.port], [info])
+                if info.dev_id == dev_id:
+                    return result
+                if keep_open:
+                    result[1].close()
+            else:
+                cache.remove(cached.port)
+
+    if ports is None:
+        ports = candidate_ports()
+    results = _probe_all(list(ports), timeout, keep_open)
+    infos = [r[0] if keep_open and r else r for r in results]
+    if cache is not None:
+        cache.update(ports, [i for i in infos if i is not None])
+
+    match = None
+    for result, info in zip(results, infos):
+        if info is not None and info.dev_id == dev_id and match is None:
+            match = result
+        elif keep_open and result:
+            result[1].close()
+    if match is None:
+        raise IOError("Device %d not found" % dev_id)
+    return match
+
+
+class DeviceCache(object):
+    def __init__(self, path=CACHE_PATH):
+        """Port to device identity mapping, kept in a JSON file
+
+        Args:
+            path: Cache file (None: keep it only in memory)
+        """
+        self.path = path
+        self.devices = {}
+        self.load()
+
+    def load(self):
+        """Read the cache file (a missing or invalid file is ignored)"""
+        self.devices = {}
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)['devices']
+            for entry in entries:
+                info = DeviceInfo(entry['port'], entry['hw_ver'],
+                                  entry['fw_ver'], entry['dev_id'])
+                self.devices[info.port] = info
+        except (IOError, ValueError, KeyError, TypeError):
+            self.devices = {}
+
+    def save(self):
+        if not self.path:
+            return
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        data = {'time': time.time(),
+                'devices': [info.to_dict() for _, info in
+                            sorted(self.devices.items())]}
+        with open(self.path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    def get(self, port):
+        """Identity of the device last seen at a port (or None)"""
+        return self.devices.get(port)
+
+    def find(self, dev_id):
+        """Cached identity of a device (or None)"""
+        for _, info in sorted(self.devices.items()):
+            if info.dev_id == dev_id:
+                return info
+        return None
+
+    def update(self, ports, found):
+        """Store the results of a scan
+
+        Args:
+            ports: Probed ports. The ones without a device are removed.
+            found: `DeviceInfo` of the devices found
+        """
+        for port in ports:
+            if isinstance(port, basestring):
+                self.devices.pop(port, None)
+        for info in found:
+            if isinstance(info.port, basestring):
+                self.devices[info.port] = info
+        self.save()
+
+    def remove(self, port):
+        if self.devices.pop(port, None) is not None:
+            self.save()
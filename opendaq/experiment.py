@@ -0,0 +1,257 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Declarative description of stream experiments
+
+An `Experiment` describes all the DataChannels of a stream setup. It is
+validated once and applied with `DAQ.apply_experiment`, which sends all
+the configuration commands in a single pipelined batch:
+
+    exp = Experiment()
+    exp.add_stream(1, period=100, pinput=8, gain=1)
+    exp.add_external(2, edge=1, mode='COUNTER_INPUT')
+    daq.apply_experiment(exp)
+"""
+
+import copy
+import struct
+
+INPUT_MODES = ('ANALOG_INPUT', 'ANALOG_OUTPUT', 'DIGITAL_INPUT',
+               'DIGITAL_OUTPUT', 'COUNTER_INPUT', 'CAPTURE_INPUT')
+STREAM = 'stream'
+EXTERNAL = 'external'
+BURST = 'burst'
+
+
+class Channel(object):
+    def __init__(self, number, kind, trigger, mode='ANALOG_INPUT', pinput=1,
+                 ninput=0, gain=1, nsamples=1, npoints=0, continuous=True):
+        """DataChannel configuration
+
+        Args:
+            number: DataChannel number [1:4]
+            kind: Experiment type (STREAM, EXTERNAL or BURST)
+            trigger: Period in ms (STREAM) or us (BURST), or edge
+                (EXTERNAL)
+            mode, pinput, ninput, gain, nsamples: See `DAQ.conf_channel`
+            npoints, continuous: See `DAQ.setup_channel`
+        """
+        if mode in INPUT_MODES:
+            mode = INPUT_MODES.index(mode)
+        self.number = number
+        self.kind = kind
+        self.trigger = trigger
+        self.mode = mode
+        self.pinput = pinput
+        self.ninput = ninput
+        self.gain = gain
+        self.nsamples = nsamples
+        self.npoints = npoints
+        self.continuous = int(continuous)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and vars(self) == vars(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Channel(%s)' % ', '.join(
+            '%s=%r' % item for item in sorted(vars(self).items()))
+
+    @property
+    def period(self):
+        """Sampling period in seconds (None for external experiments)"""
+        if self.kind == STREAM:
+            return self.trigger/1e3
+        if self.kind == BURST:
+            return self.trigger/1e6
+        return None
+
+    def validate(self, hw_ver):
+        """Check the configuration against the hardware limits
+
+        Args:
+            hw_ver: Hardware version ('m' or 's')
+        Raises:
+            ValueError: Values out of range
+        """
+        if not 1 <= self.number <= 4:
+            raise ValueError('Invalid number')
+
+        if self.kind == STREAM and not 1 <= self.trigger <= 65535:
+            raise ValueError('Invalid period')
+        elif self.kind == BURST and not 100 <= self.trigger <= 65535:
+            raise ValueError('Invalid period')
+        elif self.kind == EXTERNAL and self.trigger not in [0, 1]:
+            raise ValueError('Invalid edge')
+        elif self.kind not in (STREAM, EXTERNAL, BURST):
+            raise ValueError('Invalid experiment type')
+
+        if self.mode not in range(len(INPUT_MODES)):
+            raise ValueError('Invalid mode')
+
+        if not 0 <= self.pinput <= 8:
+            raise ValueError('pinput out of range')
+
+        if hw_ver == 'm' and self.ninput not in [0, 5, 6, 7, 8, 25]:
+            raise ValueError("negative input out of range")
+
+        if hw_ver == 's' and self.ninput != 0 and (
+            self.pinput % 2 == 0 and self.ninput != self.pinput - 1
+                or self.pinput % 2 != 0 and self.ninput != self.pinput + 1):
+            raise ValueError("negative input out of range")
+
+        if not 0 <= self.gain <= (4 if hw_ver == 'm' else 7):
+            raise ValueError("gain out of range")
+
+        if not 0 <= self.nsamples < 255:
+            raise ValueError("samples number out of range")
+
+        if not 0 <= self.npoints < 65536:
+            raise ValueError('npoints out of range')
+
+        if self.continuous not in [0, 1]:
+            raise ValueError("continuous value out of range")
+
+    def commands(self):
+        """Command packets that create and configure the DataChannel
+
+        Returns:
+            List of (cmd, ret_fmt) tuples for `DAQ.send_batch`
+        """
+        if self.kind == STREAM:
+            cmds = [(struct.pack('!BBBH', 19, 3, self.number, self.trigger),
+                     'BH')]
+        elif self.kind == EXTERNAL:
+            cmds = [(struct.pack('!BBBB', 20, 2, self.number, self.trigger),
+                     'BB')]
+        else:
+            cmds = [(struct.pack('!BBH', 21, 2, self.trigger), 'H')]
+
+        cmds.append((struct.pack('!BBBBBBBB', 22, 6, self.number, self.mode,
+                                 self.pinput, self.ninput, self.gain,
+                                 self.nsamples), 'BBBBBB'))
+        cmds.append((struct.pack('!BBBHb', 32, 4, self.number, self.npoints,
+                                 self.continuous), 'BHB'))
+        return cmds
+
+
+class Experiment(object):
+    def __init__(self):
+        """Set of DataChannels configured together"""
+        self.channels = {}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.channels == other.channels
+
+    def __ne__(self, other):
+        return not self == other
+
+    def add(self, channel):
+        """Add (or replace) a DataChannel"""
+        self.channels[channel.number] = channel
+        return channel
+
+    def add_stream(self, number, period, **kwargs):
+        """Add a Stream DataChannel
+
+        Args:
+            number: DataChannel number [1:4]
+            period: Period in milliseconds [1:65535]
+            kwargs: Other `Channel` arguments
+        """
+        return self.add(Channel(number, STREAM, period, **kwargs))
+
+    def add_external(self, number, edge, **kwargs):
+        """Add an External DataChannel
+
+        Args:
+            number: DataChannel number [1:4]
+            edge: New data on rising (1) or falling (0) edges
+            kwargs: Other `Channel` arguments
+        """
+        return self.add(Channel(number, EXTERNAL, edge, **kwargs))
+
+    def add_burst(self, period, **kwargs):
+        """Add a Burst DataChannel (it always uses DataChannel 1)
+
+        Args:
+            period: Period in microseconds [100:65535]
+            kwargs: Other `Channel` arguments
+        """
+        return self.add(Channel(1, BURST, period, **kwargs))
+
+    def remove(self, number):
+        del self.channels[number]
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def validate(self, hw_ver):
+        """Check all the channels against the hardware limits
+
+        Raises:
+            ValueError: Invalid configuration
+        """
+        for number, channel in self.channels.items():
+            channel.validate(hw_ver)
+            if channel.kind == BURST and len(self.channels) > 1:
+                raise ValueError("Burst experiments use a single channel")
+
+    def diff(self, applied=None):
+        """Find the channels to be sent to move from another experiment
+
+        Args:
+            applied: Currently applied experiment (None: unknown)
+        Returns:
+            Numbers of the changed (or new) channels and of the removed
+            ones
+        """
+        if applied is None:
+            return sorted(self.channels), []
+        changed = [n for n, ch in sorted(self.channels.items())
+                   if applied.channels.get(n) != ch]
+        removed = [n for n in sorted(applied.channels)
+                   if n not in self.channels]
+        return changed, removed
+
+    def commands(self, hw_ver, applied=None):
+        """Validate the experiment and build its command batch
+
+        Args:
+            hw_ver: Hardware version ('m' or 's')
+            applied: Currently applied experiment. Only the channels
+                which differ from it are sent. If None, all the
+                DataChannels are reset and configured.
+        Returns:
+            List of (cmd, ret_fmt) tuples for `DAQ.send_batch`
+        """
+        self.validate(hw_ver)
+        changed, removed = self.diff(applied)
+
+        if applied is None:
+            # Reset all DataChannels
+            cmds = [(struct.pack('!BBB', 57, 1, 0), 'B')]
+        else:
+            cmds = [(struct.pack('!BBB', 57, 1, n), 'B')
+                    for n in sorted(changed + removed)
+                    if n in applied.channels]
+
+        for n in changed:
+            cmds.extend(self.channels[n].commands())
+        return cmds
@@ -0,0 +1,243 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Continuous analog output of long waveforms (requires NumPy)
+
+An ANALOG_OUTPUT DataChannel plays the signal buffer of the device in a
+loop. An `OutputStream` uses that buffer as a ring: the values already
+played are replaced with the next values of the waveform while the
+experiment runs, so the waveform can be of any length:
+
+    t = np.arange(10**6)*1e-3
+    out = OutputStream(daq, 2 + np.sin(2*np.pi*t), period=1)
+    out.run()
+
+The waveform can also be an iterator of volts (for example a generator
+which computes it on the fly). Values are converted to DAC codes in
+vectorized blocks.
+
+The position of the device in the ring is estimated from the time since
+the experiment started. If the buffer was not refilled in time, the
+device plays stale values: the underrun is recorded and the late values
+are skipped, so the rest of the waveform keeps its timing.
+"""
+
+import itertools
+import struct
+import numpy as np
+from opendaq.calibration import volts_to_raw
+from opendaq.daq import MAX_LOAD
+from opendaq.experiment import Experiment
+
+# Size of the signal buffer of the device (values)
+SIGNAL_SIZE = 400
+# Values kept between the playing position and the refilled ones, so the
+# estimate of the device position can be slightly wrong
+GUARD = 2
+
+
+class OutputStream(object):
+    def __init__(self, daq, source, period, number=4, size=SIGNAL_SIZE,
+                 min_load=MAX_LOAD):
+        """Analog output fed from an array or an iterator
+
+        The other DataChannels already applied to the DAQ keep running
+        with the output. As the link is shared, the stream packets
+        received while refilling are kept by the DAQ (see
+        `DAQ.send_command`).
+
+        Args:
+            daq: `DAQ` instance
+            source: Array or iterator of volts
+            period: Period of the output values in ms [1:65535]
+            number: DataChannel used for the output [1:4]
+            size: Size of the ring in the signal buffer of the device
+            min_load: Values refilled at once by `run` (fewer commands
+                with larger loads, at the cost of a shorter lead)
+        """
+        if not 0 < size <= SIGNAL_SIZE:
+            raise ValueError("Invalid buffer size")
+        self.daq = daq
+        self.period = period
+        self.number = number
+        self.size = size
+        self.min_load = max(1, min(min_load, size - GUARD))
+
+        if hasattr(source, '__len__'):
+            self._array = np.asarray(source, dtype=float)
+            self._iter = None
+        else:
+            self._array = None
+            self._iter = iter(source)
+        self._pos = 0
+
+        self.exhausted = False
+        self.total = 0          # values taken from the source
+        self.written = 0        # values loaded into the ring
+        self.hold = None        # code output once the source is exhausted
+        self.underruns = []     # (first stale value, number of values)
+        self.start_time = None
+
+    @property
+    def clock(self):
+        return self.daq.clock
+
+    @property
+    def played(self):
+        """Number of values output by the device (estimated)"""
+        if self.start_time is None:
+            return 0
+        elapsed = self.clock.time() - self.start_time
+        # The small offset avoids rounding down exact sample times
+        return int(elapsed*1e3/self.period + 1e-9)
+
+    @property
+    def lead(self):
+        """Values loaded and not played yet"""
+        return self.written - self.played
+
+    @property
+    def finished(self):
+        """All the values of the source have been played"""
+        return self.exhausted and self.played >= self.total
+
+    def _take(self, n):
+        """Next values (volts) of the source"""
+        if self._array is not None:
+            values = self._array[self._pos:self._pos + n]
+            self._pos += len(values)
+        else:
+            values = np.fromiter(itertools.islice(self._iter, n), float)
+        if len(values) < n:
+            self.exhausted = True
+        self.total += len(values)
+        return values
+
+    def _codes(self, n):
+        """Next `n` DAC codes, padded with the last one at the end"""
+        daq = self.daq
+        codes = volts_to_raw(self._take(n), daq.dac_gain, daq.dac_offset,
+                             daq.hw_ver)
+        if daq.hw_ver == 's':
+            codes *= 2
+        if len(codes):
+            self.hold = codes[-1]
+        elif self.hold is None:
+            raise ValueError("Empty waveform")
+        if len(codes) < n:
+            codes = np.concatenate((codes, [self.hold]*(n - len(codes))))
+        return codes
+
+    def _load(self, codes):
+        daq = self.daq
+        codes = np.asarray(codes, dtype=int).tolist()
+        pos = 0
+        while pos < len(codes):
+            offset = self.written % self.size
+            n = min(len(codes) - pos, MAX_LOAD, self.size - offset)
+            cmd = struct.pack('!bBh%dH' % n, 23, 2*n + 2, offset,
+                              *codes[pos:pos + n])
+            daq.send_command(cmd, 'Bh', stop_stream=False)
+            pos += n
+            self.written += n
+
+    def start(self):
+        """Configure the output DataChannel, fill the signal buffer and
+        start the experiment"""
+        daq = self.daq
+        exp = Experiment() if daq.experiment is None else \
+            daq.experiment.copy()
+        exp.add_stream(self.number, self.period, mode='ANALOG_OUTPUT')
+        daq.apply_experiment(exp)
+        self._load(self._codes(self.size))
+        daq.start()
+        self.start_time = self.clock.time()
+
+    def refill(self):
+        """Load the next values into the part of the ring already played
+
+        Returns:
+            Number of values loaded
+        """
+        played = self.played
+        if played > self.written:
+            late = played - self.written
+            self.underruns.append((self.written, late))
+            # Skip the values which should have been played already
+            self._take(late)
+            self.written = played
+        n = played + self.size - GUARD - self.written
+        if n <= 0:
+            return 0
+        self._load(self._codes(n))
+        return n
+
+    def next_refill(self):
+        """Time when `min_load` values of the ring will have been played"""
+        index = self.written + self.min_load + GUARD - self.size
+        return self.start_time + index*self.period/1e3
+
+    def read_stream(self):
+        """Stream packets of the other DataChannels (see
+        `DAQ.read_stream`), including the ones received while refilling"""
+        return self.daq.read_stream(block=False)
+
+    def run(self, duration=None):
+        """Output the waveform until it ends or the duration expires
+
+        Args:
+            duration: Maximum time in seconds (None: until the end of the
+                waveform)
+        Returns:
+            `stats`
+        """
+        if self.start_time is None:
+            self.start()
+        end = None if duration is None else self.start_time + duration
+        while not self.finished:
+            self.refill()
+            wake = self.next_refill()
+            if self.exhausted:
+                wake = min(wake, self.start_time +
+                           self.total*self.period/1e3)
+            if end is not None:
+                if self.clock.time() >= end:
+                    break
+                wake = min(wake, end)
+            self.clock.sleep(max(0, wake - self.clock.time()))
+        return self.stats()
+
+    def stop(self):
+        """Stop the experiment"""
+        self.daq.stop()
+
+    def stats(self):
+        """Counters of the output
+
+        Returns:
+            Dictionary with the values taken from the source, loaded and
+            played, the lead, the number of underruns and of stale values
+            played
+        """
+        return {
+            'total': self.total,
+            'written': self.written,
+            'played': self.played,
+            'lead': self.lead,
+            'underruns': len(self.underruns),
+            'late': sum(n for _, n in self.underruns),
+        }
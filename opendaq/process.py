@@ -0,0 +1,329 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Acquisition in a separate process (requires NumPy)
+
+A `DAQProcess` owns the device from a child process, which reads and
+decodes the stream and writes the samples into a ring in shared memory.
+The parent gets NumPy views of that memory (no copies), so its own
+computations never delay the device I/O. DAQ methods are called through
+a pipe, and they do not stop a running experiment (`stop` has to be
+called explicitly):
+
+    with DAQProcess('/dev/ttyUSB0') as proc:
+        proc.create_stream(1, 1)
+        proc.conf_channel(1, 0, 1)
+        proc.start()
+        block = proc.acquire(timeout=1)
+        process(block.numbers, block.values)
+        proc.release(block)
+        proc.stop()
+"""
+
+import ctypes
+import multiprocessing
+import threading
+import time
+import numpy as np
+from opendaq.daq import DAQ
+
+CAPACITY = 2**20
+POLL_PERIOD = 0.01
+
+# Positions of the shared counters
+WRITTEN = 0
+RELEASED = 1
+DROPPED = 2
+CRC_ERRORS = 3
+
+_GETATTR = '__getattr__'
+
+
+class Block(object):
+    """Contiguous samples of the shared ring
+
+    Attributes:
+        start: Number of samples written to the ring before this block
+        numbers: DataChannel number of every sample (uint8 view)
+        values: Samples (int16 view)
+    """
+    __slots__ = ('start', 'numbers', 'values')
+
+    def __init__(self, start, numbers, values):
+        self.start = start
+        self.numbers = numbers
+        self.values = values
+
+    @property
+    def end(self):
+        return self.start + len(self.values)
+
+    def channel(self, number):
+        """Samples of a DataChannel (a copy)"""
+        return self.values[self.numbers == number]
+
+
+def _serve(port, kwargs, conn, shared, poll_period):
+    """Main loop of the acquisition process"""
+    values_buf, numbers_buf, counters, stopped, ready = shared
+    try:
+        daq = DAQ(port, **kwargs)
+    except Exception as e:
+        conn.send(('error', e))
+        return
+    daq.stop_stream = False
+    conn.send(('ok', None))
+
+    values = np.frombuffer(values_buf, np.int16)
+    numbers = np.frombuffer(numbers_buf, np.uint8)
+    capacity = len(values)
+
+    def write(packets):
+        for p in packets:
+            if p.is_stop:
+                stopped[p.number] = 1
+        counters[CRC_ERRORS] += sum(not p.crc_ok for p in packets)
+        packets = [p for p in packets if p.crc_ok and len(p.values)]
+        if not packets:
+            return
+        # Keep the packets which fit in the free space
+        free = capacity - (counters[WRITTEN] - counters[RELEASED])
+        counts = np.array([len(p.values) for p in packets])
+        keep = np.searchsorted(np.cumsum(counts), free, side='right')
+        if keep < len(packets):
+            counters[DROPPED] += int(counts[keep:].sum())
+            packets = packets[:keep]
+            if not packets:
+                return
+        data = np.frombuffer(''.join(p.values.tostring() for p in packets),
+                             np.int16)
+        nums = np.repeat([p.number for p in packets], counts[:keep])
+        n = len(data)
+        pos = counters[WRITTEN] % capacity
+        first = min(n, capacity - pos)
+        values[pos:pos + first] = data[:first]
+        numbers[pos:pos + first] = nums[:first]
+        values[:n - first] = data[first:]
+        numbers[:n - first] = nums[first:]
+        counters[WRITTEN] += n
+        ready.set()
+
+    def execute(name, args, kw):
+        if name == _GETATTR:
+            attr = getattr(daq, args[0])
+            return ('method', None) if callable(attr) else ('value', attr)
+        if name == 'start':
+            for i in range(len(stopped)):
+                stopped[i] = 0
+        return getattr(daq, name)(*args, **kw)
+
+    try:
+        while True:
+            if daq.measuring and not conn.poll(0):
+                if daq.ser.wait_ready(poll_period):
+                    write(daq.read_stream(block=False))
+                continue
+            if not conn.poll(poll_period):
+                continue
+            msg = conn.recv()
+            if msg is None:
+                break
+            seq, msg = msg[0], msg[1:]
+            try:
+                result = (seq, 'ok', execute(*msg))
+            except Exception as e:
+                result = (seq, 'error', e)
+            if daq.pending_packets:
+                # Stream packets received before the response
+                write(daq.read_stream(block=False))
+            try:
+                conn.send(result)
+            except Exception as e:
+                # The result could not be pickled
+                conn.send((seq, 'error', IOError(str(e))))
+    finally:
+        daq.close()
+
+
+class DAQProcess(object):
+    def __init__(self, port, capacity=CAPACITY, poll_period=POLL_PERIOD,
+                 timeout=None, **kwargs):
+        """Run a DAQ in a child process
+
+        Any DAQ method can be called on this object: the call is run by
+        the child process and its result returned. Other attributes of
+        the DAQ are read the same way. The calls do not stop a running
+        experiment (the `stop_stream` attribute of the DAQ is cleared).
+
+        Args:
+            port: DAQ port (see `DAQ`)
+            capacity: Size of the shared sample ring
+            poll_period: Maximum time the child waits for stream data
+                before serving commands
+            timeout: Seconds to wait for the result of a call (None:
+                forever)
+            kwargs: Other `DAQ` arguments
+        Raises:
+            Any exception raised when opening the DAQ
+        """
+        self.timeout = timeout
+        self._values_buf = multiprocessing.RawArray(ctypes.c_int16, capacity)
+        self._numbers_buf = multiprocessing.RawArray(ctypes.c_uint8,
+                                                     capacity)
+        self._counters = multiprocessing.RawArray(ctypes.c_uint64, 4)
+        self._stopped = multiprocessing.RawArray(ctypes.c_int8, 5)
+        self._ready = multiprocessing.Event()
+        self.values = np.frombuffer(self._values_buf, np.int16)
+        self.numbers = np.frombuffer(self._numbers_buf, np.uint8)
+        self._next = 0
+        self._seq = 0
+        self._methods = set()
+        self._lock = threading.Lock()
+
+        self.conn, child_conn = multiprocessing.Pipe()
+        shared = (self._values_buf, self._numbers_buf, self._counters,
+                  self._stopped, self._ready)
+        self.process = multiprocessing.Process(
+            target=_serve, args=(port, kwargs, child_conn, shared,
+                                 poll_period))
+        self.process.daemon = True
+        self.process.start()
+        status, error = self.conn.recv()
+        if status == 'error':
+            self.process.join()
+            raise error
+
+    def call(self, name, *args, **kwargs):
+        """Run a DAQ method in the child process
+
+        Every call is numbered, so the result of a call which timed out
+        is discarded when it arrives.
+
+        Raises:
+            IOError: The child did not answer in time
+            Any exception raised by the method
+        """
+        if not self.process.is_alive():
+            raise IOError("The acquisition process is not running")
+        with self._lock:
+            self._seq += 1
+            self.conn.send((self._seq, name, args, kwargs))
+            if self.timeout is not None:
+                deadline = time.time() + self.timeout
+            while True:
+                timeout = None
+                if self.timeout is not None:
+                    timeout = max(0, deadline - time.time())
+                if not self.conn.poll(timeout):
+                    raise IOError("Acquisition process timeout")
+                seq, status, result = self.conn.recv()
+                if seq == self._seq:
+                    break
+        if status == 'error':
+            raise result
+        return result
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self._methods:
+            kind, value = self.call(_GETATTR, name)
+            if kind == 'value':
+                return value
+            self._methods.add(name)
+
+        def call(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        call.__name__ = name
+        return call
+
+    @property
+    def pending(self):
+        """Number of samples written and not acquired yet"""
+        return self._counters[WRITTEN] - self._next
+
+    @property
+    def dropped(self):
+        """Samples lost because the ring was full"""
+        return self._counters[DROPPED]
+
+    @property
+    def crc_errors(self):
+        """Packets dropped because of a bad checksum"""
+        return self._counters[CRC_ERRORS]
+
+    def stopped(self):
+        """Numbers of the DataChannels which sent a stop packet"""
+        return [n for n in range(1, len(self._stopped)) if self._stopped[n]]
+
+    def acquire(self, timeout=None, max_samples=None):
+        """Get the next samples written by the child process
+
+        The returned arrays are views of the shared memory: they stay
+        valid until the block is released.
+
+        Args:
+            timeout: Seconds to wait for new samples (None: forever)
+            max_samples: Maximum length of the block
+        Returns:
+            `Block`, or None if the timeout expired
+        """
+        while True:
+            self._ready.clear()
+            written = self._counters[WRITTEN]
+            if written > self._next:
+                break
+            # Event.wait only returns the flag since Python 2.7
+            self._ready.wait(timeout)
+            if not self._ready.is_set():
+                written = self._counters[WRITTEN]
+                if written > self._next:
+                    break
+                return None
+
+        capacity = len(self.values)
+        pos = self._next % capacity
+        # Blocks never wrap around the end of the ring
+        n = min(written - self._next, capacity - pos)
+        if max_samples is not None:
+            n = min(n, max_samples)
+        block = Block(self._next, self.numbers[pos:pos + n],
+                      self.values[pos:pos + n])
+        self._next += n
+        return block
+
+    def release(self, block):
+        """Let the child process reuse the memory of a block (and of all
+        the blocks acquired before it)"""
+        if block.end > self._counters[RELEASED]:
+            self._counters[RELEASED] = block.end
+
+    def close(self, timeout=None):
+        """Close the DAQ and stop the child process"""
+        if self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except IOError:
+                pass
+            self.process.join(timeout)
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,393 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Recording of stream experiments into chunked files (requires NumPy)
+
+    python -m opendaq record /dev/ttyUSB0 data.odr -s 1:10 -s 2:10:3:1
+
+The stream is read and decoded by a dedicated thread, and the samples of
+every DataChannel are written as compressed blocks (see opendaq.codec).
+A record file is made of:
+
+    magic (8 bytes), metadata size (uint32), JSON metadata
+    chunks: type (uint8), DataChannel number (uint8), offset (uint64)
+        DATA chunks are followed by a codec frame, END chunks by the
+        size (uint32) of a JSON summary
+
+The offset of a DATA chunk is the number of samples of the DataChannel
+received before it, so the corrupted packets, which are not written,
+leave visible gaps. Packets lost whole are not detected: the stream has
+no packet counter. A file which was not finalized can still be read up
+to its last complete chunk.
+"""
+
+import json
+import struct
+import threading
+import time
+import Queue
+import numpy as np
+
+import opendaq
+from opendaq.codec import BITPACK, FRAME, BlockDecoder, BlockEncoder
+from opendaq.experiment import Channel, Experiment, STREAM
+
+FILE_MAGIC = 'ODAQREC\x01'
+FILE_HEADER = struct.Struct('!8sI')
+CHUNK = struct.Struct('!BBQ')
+SIZE = struct.Struct('!I')
+
+# Chunk types
+DATA = 0
+STOP = 1
+END = 2
+
+QUEUE_SIZE = 1024
+POLL_PERIOD = 0.01
+
+
+def parse_stream(spec):
+    """Parse a 'number:period[:pinput[:gain]]' stream channel description
+
+    Returns:
+        `Channel` instance
+    Raises:
+        ValueError: Invalid description
+    """
+    fields = [int(f) for f in spec.split(':')]
+    if not 2 <= len(fields) <= 4:
+        raise ValueError("Invalid stream channel: %s" % spec)
+    kwargs = dict(zip(('pinput', 'gain'), fields[2:]))
+    return Channel(fields[0], STREAM, fields[1], **kwargs)
+
+
+def load_experiment(config):
+    """Build an experiment from its configuration
+
+    Args:
+        config: Dictionary (or path of a JSON file) with a 'channels'
+            list. Every channel is a dictionary of `Channel` arguments.
+    Returns:
+        `Experiment` instance
+    """
+    if isinstance(config, basestring):
+        with open(config) as f:
+            config = json.load(f)
+    exp = Experiment()
+    for kwargs in config['channels']:
+        exp.add(Channel(**dict((str(k), v) for k, v in kwargs.items())))
+    return exp
+
+
+class Recorder(object):
+    def __init__(self, daq, path, experiment=None, method=BITPACK,
+                 queue_size=QUEUE_SIZE):
+        """Record the stream of a DAQ into a file
+
+        While recording, the link is only used by the reader thread.
+
+        Args:
+            daq: `DAQ` instance
+            path: Output file
+            experiment: `Experiment` applied before starting (None: use
+                the DataChannels already configured)
+            method: Compression method of the blocks (see opendaq.codec)
+            queue_size: Maximum number of packet lists waiting to be
+                written. Newer ones are dropped (and counted in
+                `dropped`) if the writer does not keep up.
+        """
+        self.daq = daq
+        self.path = path
+        self.experiment = experiment
+        self.method = method
+        self.queue = Queue.Queue(queue_size)
+        self.file = None
+        self.encoders = {}
+        self.stopped = set()
+
+        self.npackets = 0
+        self.nsamples = 0
+        self.nbytes = 0
+        self.dropped = 0
+        self.start_time = None
+
+        self._stop = threading.Event()
+        self._reader = None
+
+    def _metadata(self):
+        exp = self.experiment or self.daq.experiment
+        channels = [] if exp is None else [
+            vars(ch) for _, ch in sorted(exp.channels.items())]
+        return {
+            'opendaq': opendaq.__version__,
+            'time': time.time(),
+            'hw_ver': self.daq.hw_ver,
+            'gains': list(self.daq.gains),
+            'offsets': list(self.daq.offsets),
+            'channels': channels,
+        }
+
+    def _write(self, data):
+        self.file.write(data)
+        self.nbytes += len(data)
+
+    def start(self):
+        """Apply the experiment, create the file and start acquiring"""
+        if self.experiment is not None:
+            self.daq.apply_experiment(self.experiment)
+        metadata = json.dumps(self._metadata())
+        self.file = open(self.path, 'wb')
+        self._write(FILE_HEADER.pack(FILE_MAGIC, len(metadata)) + metadata)
+
+        self._stop.clear()
+        self.daq.start()
+        self.start_time = self.daq.clock.time()
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _read(self):
+        while not self._stop.is_set():
+            if not self.daq.ser.wait_ready(POLL_PERIOD):
+                continue
+            packets = self.daq.read_stream(block=False)
+            if not packets:
+                continue
+            try:
+                self.queue.put_nowait(packets)
+            except Queue.Full:
+                self.dropped += len(packets)
+
+    def _write_packets(self, packets):
+        runs = {}
+        for p in packets:
+            self.npackets += 1
+            if p.is_stop:
+                self._flush_runs(runs)
+                runs = {}
+                self._write(CHUNK.pack(STOP, p.number, 0))
+                self.stopped.add(p.number)
+            elif p.crc_ok:
+                # Join the packets of contiguous samples
+                run = runs.get(p.number)
+                if run and run[2] == p.offset:
+                    run[1].append(p.values)
+                    run[2] += len(p.values)
+                else:
+                    if run:
+                        self._flush_run(p.number, run)
+                    runs[p.number] = [p.offset, [p.values],
+                                      p.offset + len(p.values)]
+        self._flush_runs(runs)
+
+    def _flush_runs(self, runs):
+        for number, run in sorted(runs.items()):
+            self._flush_run(number, run)
+
+    def _flush_run(self, number, run):
+        offset, arrays, _ = run
+        values = np.concatenate([np.frombuffer(v, np.int16) for v in arrays])
+        encoder = self.encoders.get(number)
+        if encoder is None:
+            encoder = self.encoders[number] = BlockEncoder(method=self.method)
+        self._write(CHUNK.pack(DATA, number, offset) + encoder.encode(values))
+        self.nsamples += len(values)
+
+    def write_pending(self, timeout=None):
+        """Write the packets read so far
+
+        Args:
+            timeout: Seconds to wait for the first packets (None: forever)
+        Returns:
+            Number of packet lists written
+        """
+        count = 0
+        try:
+            packets = self.queue.get(timeout=timeout)
+            while True:
+                self._write_packets(packets)
+                count += 1
+                packets = self.queue.get_nowait()
+        except Queue.Empty:
+            pass
+        return count
+
+    @property
+    def done(self):
+        """All the DataChannels of the experiment have stopped"""
+        exp = self.experiment or self.daq.experiment
+        return bool(exp and exp.channels) and set(exp.channels) <= \
+            self.stopped
+
+    def stats(self):
+        """Counters of the recording
+
+        Returns:
+            Dictionary with the elapsed time, received packets, written
+            samples and bytes, sample rate, packets dropped by the writer
+            queue, packets with CRC errors and bytes skipped by the stream
+            decoder
+        """
+        elapsed = 0.0
+        if self.start_time is not None:
+            elapsed = self.daq.clock.time() - self.start_time
+        decoder = self.daq.decoder
+        return {
+            'elapsed': elapsed,
+            'packets': self.npackets,
+            'samples': self.nsamples,
+            'bytes': self.nbytes,
+            'rate': self.nsamples/elapsed if elapsed > 0 else 0.0,
+            'dropped': self.dropped,
+            'crc_errors': decoder.crc_errors,
+            'skipped': decoder.skipped,
+        }
+
+    def request_stop(self):
+        """Make `run` finish (it can be called from a signal handler)"""
+        self._stop.set()
+
+    def stop(self):
+        """Stop the acquisition, write the pending data and finalize the
+        file"""
+        self._stop.set()
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+        self.daq.stop()
+        self.write_pending(timeout=0)
+        # Packets received before the response of the stop command
+        packets = self.daq.read_stream(block=False)
+        if packets and self.file is not None:
+            self._write_packets(packets)
+        if self.file is not None:
+            summary = json.dumps(self.stats())
+            self._write(CHUNK.pack(END, 0, self.nsamples) +
+                        SIZE.pack(len(summary)) + summary)
+            self.file.close()
+            self.file = None
+
+    def run(self, duration=None, interval=1.0, callback=None):
+        """Record until the duration expires, all the DataChannels stop
+        or `request_stop` is called
+
+        Args:
+            duration: Maximum recording time in seconds (None: no limit)
+            interval: Seconds between `callback` calls
+            callback: Function called with the `stats` dictionary
+        Returns:
+            Final `stats`
+        """
+        self.start()
+        try:
+            next_report = interval
+            while not self._stop.is_set() and not self.done:
+                self.write_pending(timeout=POLL_PERIOD)
+                elapsed = self.daq.clock.time() - self.start_time
+                if duration is not None and elapsed >= duration:
+                    break
+                if callback and elapsed >= next_report:
+                    callback(self.stats())
+                    next_report = elapsed + interval
+        finally:
+            self.stop()
+        stats = self.stats()
+        if callback:
+            callback(stats)
+        return stats
+
+
+class RecordReader(object):
+    def __init__(self, path):
+        """Reader of the files written by `Recorder`
+
+        Attributes:
+            metadata: Acquisition settings (dictionary)
+            summary: Final counters of the recording (None if the file
+                was not finalized)
+        """
+        self.file = open(path, 'rb')
+        magic, size = FILE_HEADER.unpack(self.file.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError("Not a record file")
+        self.metadata = json.loads(self.file.read(size))
+        self.summary = None
+
+    def chunks(self):
+        """Iterate over the chunks of the file
+
+        Yields:
+            (type, number, offset, payload) tuples. The payload is an
+            int16 array for DATA chunks, the summary for END chunks and
+            None for STOP chunks.
+        """
+        decoders = {}
+        while True:
+            head = self.file.read(CHUNK.size)
+            if len(head) < CHUNK.size:
+                return
+            kind, number, offset = CHUNK.unpack(head)
+            if kind == DATA:
+                frame = self.file.read(FRAME.size)
+                if len(frame) < FRAME.size:
+                    return
+                size = FRAME.unpack(frame)[-1]
+                payload = self.file.read(size)
+                if len(payload) < size:
+                    return
+                decoder = decoders.setdefault(number, BlockDecoder())
+                yield kind, number, offset, decoder.feed(frame + payload)
+            elif kind == END:
+                data = self.file.read(SIZE.size)
+                if len(data) < SIZE.size:
+                    return
+                size = SIZE.unpack(data)[0]
+                data = self.file.read(size)
+                if len(data) < size:
+                    return
+                self.summary = json.loads(data)
+                yield kind, number, offset, self.summary
+            elif kind == STOP:
+                yield kind, number, offset, None
+            else:
+                raise ValueError("Bad chunk")
+
+    def read(self):
+        """Read all the samples
+
+        Returns:
+            Dictionary of DataChannel number: (offsets, values), where
+            `offsets` has the sample number of every value (gaps show
+            corrupted packets) and `values` is an int16 array
+        """
+        blocks = {}
+        for kind, number, offset, values in self.chunks():
+            if kind == DATA:
+                blocks.setdefault(number, []).append(
+                    (np.arange(offset, offset + len(values)), values))
+        return dict((number, (np.concatenate([b[0] for b in bl]),
+                              np.concatenate([b[1] for b in bl])))
+                    for number, bl in blocks.items())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,139 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Structured storage of stream packets (requires NumPy)
+
+    store = PacketStore()
+    store.extend(daq.read_stream())
+    ch1 = store.channel(1)
+    good = store.records[store.records['crc_ok']]
+"""
+
+import numpy as np
+
+PACKET_DTYPE = np.dtype([
+    ('index', 'u4'),        # packet number
+    ('number', 'u1'),       # DataChannel number
+    ('cmd', 'u1'),          # command number
+    ('crc', 'u2'),          # packet checksum
+    ('info', 'u1', (3,)),   # remaining header bytes
+    ('crc_ok', '?'),        # checksum validation
+    ('offset', 'u8'),       # samples of the channel before the packet
+    ('start', 'u8'),        # position of the first sample in `values`
+    ('count', 'u2'),        # number of samples
+])
+
+SAMPLE_DTYPE = np.dtype([
+    ('number', 'u1'),
+    ('packet', 'u4'),
+    ('offset', 'u8'),
+    ('value', 'i2'),
+])
+
+
+class PacketStore(object):
+    """Compact store of stream packets
+
+    Packet headers are kept in a structured array (`records`) and the
+    samples of all the packets in a flat int16 array (`values`). Both
+    arrays grow geometrically, so appending is amortized O(1).
+    """
+    def __init__(self, capacity=1024):
+        self._records = np.zeros(capacity, PACKET_DTYPE)
+        self._values = np.zeros(capacity*16, np.int16)
+        self.npackets = 0
+        self.nvalues = 0
+
+    def __len__(self):
+        return self.npackets
+
+    @property
+    def records(self):
+        """Structured array of packet headers (a view)"""
+        return self._records[:self.npackets]
+
+    @property
+    def values(self):
+        """Samples of all the packets, in order of arrival (a view)"""
+        return self._values[:self.nvalues]
+
+    @staticmethod
+    def _grow(arr, size):
+        if size <= len(arr):
+            return arr
+        new = np.zeros(max(size, 2*len(arr)), arr.dtype)
+        new[:len(arr)] = arr
+        return new
+
+    def extend(self, packets):
+        """Append decoded packets (stop packets are stored with no samples)
+
+        Args:
+            packets: Sequence of `StreamPacket` objects
+        """
+        n = len(packets)
+        if not n:
+            return
+        values = np.frombuffer(
+            ''.join(p.values.tostring() for p in packets), np.int16)
+        counts = np.array([len(p.values) for p in packets], np.uint16)
+
+        self._records = self._grow(self._records, self.npackets + n)
+        self._values = self._grow(self._values, self.nvalues + len(values))
+
+        rec = self._records[self.npackets:self.npackets + n]
+        rec['index'] = [p.index for p in packets]
+        rec['number'] = [p.number for p in packets]
+        rec['cmd'] = [p.cmd for p in packets]
+        rec['crc'] = [p.crc for p in packets]
+        rec['info'] = [p.info for p in packets]
+        rec['crc_ok'] = [p.crc_ok for p in packets]
+        rec['offset'] = [p.offset for p in packets]
+        rec['count'] = counts
+        rec['start'] = self.nvalues + np.cumsum(counts) - counts
+
+        self._values[self.nvalues:self.nvalues + len(values)] = values
+        self.npackets += n
+        self.nvalues += len(values)
+
+    def sample_numbers(self):
+        """DataChannel number of every sample in `values`"""
+        rec = self.records
+        return np.repeat(rec['number'], rec['count'])
+
+    def samples(self):
+        """Per-sample structured array (DataChannel number, packet index,
+        sample offset in its channel and value)
+        """
+        rec = self.records
+        counts = rec['count'].astype(np.intp)
+        out = np.empty(self.nvalues, SAMPLE_DTYPE)
+        out['number'] = np.repeat(rec['number'], counts)
+        out['packet'] = np.repeat(rec['index'], counts)
+        # Position of each sample inside its packet
+        pos = np.arange(self.nvalues) - np.repeat(rec['start'], counts)
+        out['offset'] = np.repeat(rec['offset'], counts) + pos
+        out['value'] = self.values
+        return out
+
+    def channel(self, number):
+        """All the samples of a DataChannel"""
+        return self.values[self.sample_numbers() == number]
+
+    def clear(self):
+        self.npackets = 0
+        self.nvalues = 0
@@ -18,28 +18,37 @@
 import struct
 from functools import wraps
 from opendaq.common import check_crc, LengthError, mkcmd
+from opendaq.transport import Transport
 
 
-class SerialSim(object):
+class SerialSim(Transport):
     __commands = {}
 
     def __init__(self, port=None, baudrate=9600, timeout=None):
+        Transport.__init__(self, timeout)
         self.port = port
         self.baudrate = baudrate
-        self.timeout = timeout
         self._init()
 
     def _init(self):
         self.rts = 1
         self.port_open = True
         self.NACK = '\x00\xa0\xa0\x00'
-        self.__out_buf = bytearray()
+        self.__in_buf = bytearray()
+        del self._rbuf[:]
 
     @classmethod
     def command(cls, ncmd, cmd_fmt, ret_fmt):
-        """Command decorator"""
+        """Command decorator
+
+        A '*' in `cmd_fmt` marks a variable-length command: the item after
+        it is repeated up to the end of the packet, and the repeated
+        values are passed as a single tuple argument.
+        """
         def inner_command(f):
-            cmd_len = struct.calcsize(cmd_fmt)
+            cmd_len = None
+            if '*' not in cmd_fmt:
+                cmd_len = struct.calcsize('!' + cmd_fmt)
             cls.__commands[f.__name__] = (f, ncmd, cmd_len, cmd_fmt, ret_fmt)
 
             def wrapped(*args, **kwargs):
@@ -49,23 +58,39 @@ class SerialSim(object):
         return inner_command
 
     def __get_command(self, ncmd, length):
-        try:
-            ret = next((e for e in self.__commands.itervalues()
-                        if e[1] == ncmd and e[2] == length))
-        except StopIteration:
-            raise ValueError("Invalid command number")
-        return ret
+        matches = [e for e in self.__commands.itervalues() if e[1] == ncmd]
+        for e in matches:
+            if e[2] == length:
+                return e
+        for e in matches:
+            if e[2] is None:
+                return e
+        raise ValueError("Invalid command number")
+
+    @staticmethod
+    def __unpack_args(cmd_fmt, data):
+        if '*' not in cmd_fmt:
+            return struct.unpack('!' + cmd_fmt, data)
+        head, item = cmd_fmt.split('*')
+        head_len = struct.calcsize('!' + head)
+        count, rest = divmod(len(data) - head_len, struct.calcsize(item))
+        if count < 0 or rest:
+            raise LengthError("Wrong command length")
+        return struct.unpack('!' + head, data[:head_len]) + (
+            struct.unpack('!%d%s' % (count, item), data[head_len:]),)
 
     def __unpack_header(self, data):
         pay_len = len(data) - 4
-        ncmd, length, cmd_data = struct.unpack('!bb%ds' % pay_len,
+        ncmd, length, cmd_data = struct.unpack('!BB%ds' % pay_len,
                                                check_crc(data))
         if pay_len != length:
             raise LengthError("Wrong command length")
         return ncmd, length, cmd_data
 
     def __pack_response(self, ncmd, ret_values, fmt=''):
-        if not type(ret_values) is tuple:
+        if ret_values is None:
+            ret_values = ()
+        elif not type(ret_values) is tuple:
             ret_values = (ret_values,)
         return mkcmd(ncmd, fmt, *ret_values)
 
@@ -77,38 +102,37 @@ class SerialSim(object):
         try:
             ncmd, ln, cmd_data = self.__unpack_header(data)
             f, _, _, cmd_fmt, ret_fmt = self.__get_command(ncmd, ln)
-            args = struct.unpack('!'+cmd_fmt, cmd_data)
+            args = self.__unpack_args(cmd_fmt, cmd_data)
             ret = self.__pack_response(ncmd, f(self, *args), ret_fmt)
-        except (LengthError, ValueError):
+        except (LengthError, ValueError, struct.error):
             return self.NACK
         return ret
 
-    def write(self, data):
+    def _send(self, data):
         if not self.port_open:
             raise IOError("Port is closed")
 
-        self.__out_buf.extend(self.exec_command(data))
-        return len(data)
+        # Several packets can arrive in one write (pipelined commands),
+        # and a packet can be split among several writes
+        self.__in_buf.extend(data)
+        while len(self.__in_buf) >= 4:
+            size = 4 + self.__in_buf[3]
+            if len(self.__in_buf) < size:
+                break
+            packet = str(self.__in_buf[:size])
+            del self.__in_buf[:size]
+            # Responses go straight into the receive buffer
+            self._rbuf.extend(self.exec_command(packet))
 
-    def read(self, size=1):
+    def _recv(self, size, timeout):
         if not self.port_open:
             raise IOError("Port is closed")
+        return ''
 
-        ret = bytearray()
-        for i in xrange(size):
-            try:
-                ret.append(self.__out_buf.pop(0))
-            except IndexError:
-                break
-        return str(ret)
-
-    def flushInput(self):
-        self.__out_buf = bytearray()
-
-    def open(self):
+    def _open(self):
         self.port_open = True
 
-    def close(self):
+    def _close(self):
         self._init()
         self.port_open = False
 
@@ -0,0 +1,463 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Share one openDAQ among several processes
+
+A `DAQServer` owns the device, runs the stream acquisition and publishes
+the decoded stream blocks to every connected client. Clients can also
+run `DAQ` commands through the server. The commands do not stop the
+shared experiment: a client has to call 'stop' explicitly.
+
+Messages are JSON objects, one per line:
+
+    client -> server: {"id": 1, "cmd": "set_led", "args": [1]}
+    server -> client: {"type": "result", "id": 1, "result": [1]}
+                      {"type": "error", "id": 1, "error": "ValueError",
+                       "message": "..."}
+                      {"type": "stream", "data": [...], "channel": [...]}
+                      {"type": "stop", "channel": 0}
+
+Arrays in the arguments and results are sent as lists, and byte strings
+as {"bytes": "<base64>"} objects (see `to_json`).
+"""
+
+import base64
+import collections
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import Queue
+import SocketServer
+from opendaq.common import CRCError, LengthError
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 256
+BLOCK_SIZE = 1024
+POLL_PERIOD = 0.01
+
+# DAQ methods that cannot be called through the server
+FORBIDDEN = ('open', 'close', 'get_stream', 'read_stream', 'flush_stream',
+             'send_command')
+
+ERRORS = {
+    'ValueError': ValueError,
+    'LengthError': LengthError,
+    'CRCError': CRCError,
+    'IOError': IOError,
+}
+
+
+def encode(msg):
+    return json.dumps(msg) + '\n'
+
+
+def to_json(value):
+    """Convert command arguments or results to JSON types
+
+    Arrays (array.array or NumPy) become lists and byte strings become
+    {"bytes": "<base64>"} objects.
+    """
+    if isinstance(value, str):
+        return {'bytes': base64.b64encode(value)}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+
+def from_json(value):
+    """Inverse of `to_json` (arrays are returned as lists)"""
+    if isinstance(value, dict) and value.keys() == ['bytes']:
+        return base64.b64decode(value['bytes'])
+    if isinstance(value, list):
+        return [from_json(v) for v in value]
+    return value
+
+
+def parse_address(address):
+    """Parse a 'host:port' TCP address or a Unix socket path
+
+    Returns:
+        (host, port) tuple or path string
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host or 'localhost', int(port)
+    return address
+
+
+class Subscriber(object):
+    """Outgoing message queues of a connected client
+
+    Command replies are always delivered. Stream blocks are kept in a
+    bounded queue, and the oldest ones are dropped if the client does not
+    keep up, so that it can never stall the acquisition or the other
+    clients.
+    """
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.cond = threading.Condition()
+        self.replies = collections.deque()
+        self.blocks = collections.deque(maxlen=queue_size)
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, msg, droppable=True):
+        with self.cond:
+            if droppable:
+                if len(self.blocks) == self.blocks.maxlen:
+                    self.dropped += 1
+                self.blocks.append(msg)
+            else:
+                self.replies.append(msg)
+            self.cond.notify()
+
+    def pop(self):
+        """Wait for the next message
+
+        Returns:
+            Encoded message, or None if the subscriber was closed
+        """
+        with self.cond:
+            while not (self.replies or self.blocks or self.closed):
+                self.cond.wait()
+            if self.replies:
+                return self.replies.popleft()
+            if self.blocks:
+                return self.blocks.popleft()
+            return None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        daq_server = self.server.daq_server
+        sub = daq_server.subscribe()
+        writer = threading.Thread(target=self._write, args=(sub,))
+        writer.daemon = True
+        writer.start()
+        try:
+            while not sub.closed:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                sub.push(daq_server.handle_request(line), droppable=False)
+        finally:
+            daq_server.unsubscribe(sub)
+            writer.join()
+
+    def _write(self, sub):
+        while True:
+            msg = sub.pop()
+            if msg is None:
+                break
+            try:
+                self.wfile.write(msg)
+            except socket.error:
+                sub.close()
+                break
+
+
+class _TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class _UnixServer(SocketServer.ThreadingMixIn,
+                      SocketServer.UnixStreamServer):
+        daemon_threads = True
+
+
+class DAQServer(object):
+    def __init__(self, daq, address, queue_size=QUEUE_SIZE,
+                 block_size=BLOCK_SIZE):
+        """Class constructor
+
+        Args:
+            daq: `DAQ` instance owned by the server. Its `stop_stream`
+                attribute is cleared.
+            address: (host, port) tuple for TCP, or a Unix socket path
+            queue_size: Maximum number of stream blocks queued per client
+            block_size: Maximum number of samples per stream block
+        """
+        self.daq = daq
+        daq.stop_stream = False
+        self.queue_size = queue_size
+        self.block_size = block_size
+        self.lock = threading.RLock()
+        self.crc_errors = 0
+        self.subscribers = []
+        self._sub_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._serving = False
+
+        if isinstance(address, tuple):
+            self.server = _TCPServer(address, _Handler)
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = _UnixServer(address, _Handler)
+        self.server.daq_server = self
+        self.address = self.server.server_address
+
+    def subscribe(self):
+        sub = Subscriber(self.queue_size)
+        with self._sub_lock:
+            self.subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._sub_lock:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+        sub.close()
+
+    def publish(self, msg):
+        """Send a stream message to all the subscribers"""
+        line = encode(msg)
+        with self._sub_lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.push(line)
+
+    def execute(self, cmd, args=()):
+        """Run a DAQ method
+
+        Raises:
+            ValueError: Unknown command
+        """
+        if cmd.startswith('_') or cmd in FORBIDDEN:
+            raise ValueError("Invalid command: %s" % cmd)
+        func = getattr(self.daq, cmd, None)
+        if not callable(func):
+            raise ValueError("Invalid command: %s" % cmd)
+        with self.lock:
+            return func(*args)
+
+    def handle_request(self, line):
+        """Run a request line and return the encoded reply"""
+        req_id = None
+        try:
+            req = json.loads(line)
+            req_id = req.get('id')
+            ret = self.execute(req['cmd'], from_json(req.get('args', [])))
+            # Results which can not be encoded get an error reply
+            return encode({'type': 'result', 'id': req_id,
+                           'result': to_json(ret)})
+        except Exception as e:
+            return encode({'type': 'error', 'id': req_id,
+                           'error': type(e).__name__, 'message': str(e)})
+
+    def _read_block(self):
+        """Read the pending stream data
+
+        Packets with a bad checksum are dropped (and counted in
+        `crc_errors`).
+
+        Returns:
+            Messages to publish: stream blocks of up to `block_size`
+            samples and stop messages, in order of arrival
+        """
+        msgs = []
+        data, channel = [], []
+
+        def add_blocks():
+            for i in range(0, len(data), self.block_size):
+                msgs.append({'type': 'stream',
+                             'data': data[i:i + self.block_size],
+                             'channel': channel[i:i + self.block_size]})
+            del data[:], channel[:]
+
+        for p in self.daq.read_stream(block=False):
+            if p.is_stop:
+                add_blocks()
+                msgs.append({'type': 'stop', 'channel': p.number - 1})
+            elif p.crc_ok:
+                data.extend(p.values)
+                channel.extend([p.number - 1]*len(p.values))
+            else:
+                self.crc_errors += 1
+        add_blocks()
+        return msgs
+
+    def _acquire(self):
+        while not self._stop.is_set():
+            msgs = []
+            try:
+                with self.lock:
+                    if self.daq.pending_packets or (
+                            self.daq.measuring and
+                            self.daq.ser.wait_ready(POLL_PERIOD)):
+                        msgs = self._read_block()
+            except Exception:
+                # Keep serving the clients; the link may recover
+                logger.exception("Stream acquisition error")
+                self._stop.wait(POLL_PERIOD)
+                continue
+            for msg in msgs:
+                self.publish(msg)
+            if not msgs and not self.daq.measuring:
+                self._stop.wait(POLL_PERIOD)
+
+    def start(self):
+        """Run the server in background threads"""
+        self._stop.clear()
+        self._serving = True
+        for target in (self._acquire, self.server.serve_forever):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self):
+        """Run the server until `shutdown` is called"""
+        self.start()
+        try:
+            while not self._stop.is_set():
+                self._stop.wait(1)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._serving:
+            self.server.shutdown()
+            self._serving = False
+        self.server.server_close()
+        with self._sub_lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+        if not isinstance(self.address, tuple) and os.path.exists(
+                self.address):
+            os.unlink(self.address)
+
+
+class DAQClient(object):
+    def __init__(self, address, timeout=None, queue_size=QUEUE_SIZE):
+        """Connect to a `DAQServer`
+
+        Args:
+            address: (host, port) tuple for TCP, or a Unix socket path
+            timeout: Seconds to wait for command replies (None: forever)
+            queue_size: Maximum number of stream blocks kept unread
+        """
+        if isinstance(address, tuple):
+            self.sock = socket.create_connection(address)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(address)
+        self.timeout = timeout
+        self.rfile = self.sock.makefile('rb')
+        self.replies = Queue.Queue()
+        self.blocks = Queue.Queue(queue_size)
+        self.dropped = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                line = self.rfile.readline()
+            except socket.error:
+                line = ''
+            if not line:
+                break
+            msg = json.loads(line)
+            if msg['type'] in ('result', 'error'):
+                self.replies.put(msg)
+                continue
+            try:
+                self.blocks.put_nowait(msg)
+            except Queue.Full:
+                self.dropped += 1
+        self.replies.put(None)
+
+    def command(self, cmd, *args):
+        """Run a DAQ method in the server
+
+        The replies of the commands which timed out are discarded when
+        they arrive.
+
+        Args:
+            cmd: Method name (e.g. 'set_led')
+            args: Method arguments
+        Returns:
+            Return value of the method
+        Raises:
+            IOError: Connection closed or reply timeout
+        """
+        with self._lock:
+            self._next_id += 1
+            self.sock.sendall(encode({'id': self._next_id, 'cmd': cmd,
+                                      'args': to_json(args)}))
+            if self.timeout is not None:
+                deadline = time.time() + self.timeout
+            while True:
+                timeout = None
+                if self.timeout is not None:
+                    timeout = max(0, deadline - time.time())
+                try:
+                    msg = self.replies.get(timeout=timeout)
+                except Queue.Empty:
+                    raise IOError("Command timeout")
+                if msg is None or msg.get('id') == self._next_id:
+                    break
+        if msg is None:
+            raise IOError("Connection closed by the server")
+        if msg['type'] == 'error':
+            raise ERRORS.get(msg['error'], IOError)(msg['message'])
+        return from_json(msg['result'])
+
+    def get_block(self, timeout=None):
+        """Get the next stream message
+
+        Args:
+            timeout: Seconds to wait (None: forever)
+        Returns:
+            Stream message, or None if the timeout expired
+        """
+        try:
+            return self.blocks.get(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        self._reader.join()
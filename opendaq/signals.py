@@ -0,0 +1,200 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Signal models of the simulated analog inputs (requires NumPy)
+
+Models are evaluated on whole blocks of sample times, and can be added
+together:
+
+    sim = daq.ser
+    sim.set_signal(1, Sine(1.0, 50) + Noise(0.01, seed=1))
+"""
+
+import numpy as np
+from opendaq.calibration import M_GAINS
+
+# PGA gains of openDAQ [S] (conf_adc gain argument 0:7)
+S_GAINS = (1, 2, 4, 5, 8, 10, 16, 20)
+
+# Input range of the ADC with unity gain (volts)
+ADC_LIMIT = 4.096
+
+
+class Signal(object):
+    """Base class of the signal models"""
+    def generate(self, t):
+        """Signal values (volts) at the times `t` (seconds)"""
+        raise NotImplementedError
+
+    def samples(self, start, n, period):
+        """Values of `n` samples taken every `period` seconds, starting at
+        sample number `start`"""
+        return self.generate((start + np.arange(n))*period)
+
+    def reset(self):
+        """Restart the random generators"""
+        pass
+
+    def __add__(self, other):
+        return Sum(self, other)
+
+
+class Constant(Signal):
+    def __init__(self, value):
+        self.value = value
+
+    def generate(self, t):
+        return np.full(len(t), float(self.value))
+
+
+class Sine(Signal):
+    def __init__(self, amplitude=1.0, freq=1.0, offset=0.0, phase=0.0):
+        self.amplitude = amplitude
+        self.freq = freq
+        self.offset = offset
+        self.phase = phase
+
+    def generate(self, t):
+        return self.offset + self.amplitude*np.sin(
+            2*np.pi*self.freq*np.asarray(t) + self.phase)
+
+
+class Square(Signal):
+    def __init__(self, amplitude=1.0, freq=1.0, offset=0.0, duty=0.5):
+        self.amplitude = amplitude
+        self.freq = freq
+        self.offset = offset
+        self.duty = duty
+
+    def generate(self, t):
+        phase = np.mod(np.asarray(t)*self.freq, 1)
+        return self.offset + np.where(phase < self.duty, self.amplitude,
+                                      -self.amplitude)
+
+
+class Ramp(Signal):
+    """Sawtooth wave, rising from offset - amplitude to offset + amplitude
+    """
+    def __init__(self, amplitude=1.0, freq=1.0, offset=0.0):
+        self.amplitude = amplitude
+        self.freq = freq
+        self.offset = offset
+
+    def generate(self, t):
+        phase = np.mod(np.asarray(t)*self.freq, 1)
+        return self.offset + self.amplitude*(2*phase - 1)
+
+
+class Noise(Signal):
+    def __init__(self, std=1.0, mean=0.0, seed=None):
+        """Gaussian noise
+
+        Args:
+            std: Standard deviation (volts)
+            mean: Mean value (volts)
+            seed: Seed of the random generator
+        """
+        self.std = std
+        self.mean = mean
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self.rng = np.random.RandomState(self.seed)
+
+    def generate(self, t):
+        return self.mean + self.std*self.rng.standard_normal(len(t))
+
+
+class Replay(Signal):
+    def __init__(self, values, fs, loop=True):
+        """Recorded values (volts)
+
+        Args:
+            values: Sequence of values
+            fs: Sample rate of the values (Hz)
+            loop: Start again at the end (otherwise the last value is
+                held)
+        """
+        self.values = np.asarray(values, dtype=float)
+        self.fs = fs
+        self.loop = loop
+
+    def generate(self, t):
+        # The small offset avoids rounding down exact sample times
+        idx = np.floor(np.asarray(t)*self.fs + 1e-9).astype(int)
+        if self.loop:
+            idx %= len(self.values)
+        else:
+            idx = np.clip(idx, 0, len(self.values) - 1)
+        return self.values[idx]
+
+
+class Loopback(Signal):
+    def __init__(self, sim, gain=1.0, offset=0.0):
+        """Output of the simulated DAC, wired to the input
+
+        Args:
+            sim: `DAQSimulator`
+            gain, offset: Errors of the wiring (volts = gain*dac + offset)
+        """
+        self.sim = sim
+        self.gain = gain
+        self.offset = offset
+
+    def generate(self, t):
+        return np.full(len(t), self.sim.dac_volts*self.gain + self.offset)
+
+
+class Sum(Signal):
+    def __init__(self, *signals):
+        self.signals = signals
+
+    def generate(self, t):
+        return sum(s.generate(t) for s in self.signals)
+
+    def reset(self):
+        for s in self.signals:
+            s.reset()
+
+
+def pga_gain(gain, hw_ver):
+    """Amplification of a PGA gain setting"""
+    return (M_GAINS if hw_ver == 'm' else S_GAINS)[gain]
+
+
+def adc_codes(volts, cal_gain, cal_offset, hw_ver, pga=1):
+    """Raw ADC values read for input voltages (inverse of
+    `opendaq.calibration.raw_to_volts`)
+
+    The input saturates at ADC_LIMIT/pga volts and the output at the
+    int16 limits.
+
+    Args:
+        volts: Input voltages
+        cal_gain: Calibration gain (x100000[M] or x10000[S])
+        cal_offset: Calibration offset
+        hw_ver: Hardware version ('m' or 's')
+        pga: PGA amplification
+    Returns:
+        int16 array
+    """
+    limit = ADC_LIMIT/pga
+    mv = np.clip(np.asarray(volts, dtype=float), -limit, limit)*1e3
+    scale = -1e5 if hw_ver == 'm' else 1e4
+    raw = np.round((mv - cal_offset)*scale/cal_gain)
+    return np.clip(raw, -32768, 32767).astype(np.int16)
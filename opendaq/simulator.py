@@ -15,32 +15,172 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
 
+import random
 from opendaq.serial_sim import SerialSim
-from random import randint
+from opendaq.stream import encode_packet, encode_stop
 
 NPIOS = 7
 NINPUTS = 8
 NGAINS = 4
+NCHANNELS = 4
+
+# Time between two single ADC reads of the same input (seconds)
+AIN_PERIOD = 1e-3
+
+# DataChannel modes
+ANALOG_INPUT = 0
+ANALOG_OUTPUT = 1
+DIGITAL_INPUT = 2
+DIGITAL_OUTPUT = 3
+COUNTER_INPUT = 4
+CAPTURE_INPUT = 5
+
+# Maximum number of samples per stream packet
+PACKET_SAMPLES = 20
+
+# Size of the DAC signal buffer (see load_signal)
+SIGNAL_SIZE = 400
 
 
 class DAQSimulator(SerialSim):
-    def __init__(self, port=None, baudrate=9600, timeout=None):
+    def __init__(self, port=None, baudrate=9600, timeout=None, seed=None,
+                 clock=None):
+        """Simulated openDAQ
+
+        Args:
+            seed: Seed of the random values read from inputs without a
+                signal model
+            clock: Time source of the stream experiments (e.g. an
+                `opendaq.clock.VirtualClock`)
+        """
         SerialSim.__init__(self, port, baudrate, timeout)
+        if clock is not None:
+            self.clock = clock
         self.pios = [0]*NPIOS
         self.pios_dir = [0]*NPIOS
         self.led_color = 0
         self.dac_value = 0
+        self.dac_raw = 0
+        self.dac_volts = 0.0
         self.adc_pinput = 5
         self.adc_ninput = 0
         self.adc_gain = 1
         self.adc_nsamples = 20
-        self.calib_gains = [100]*17
-        self.calib_offsets = [1]*17
+        # Calibration table stored in the device (DAC, then ADC entries)
+        self.calib_gains = [1000] + [1250]*16
+        self.calib_offsets = [0]*17
+        # Actual response of the simulated DAC and ADC, in the units of
+        # the calibration table. They start being equal to the stored
+        # calibration (full scale of +-4.096 V over the int16 range).
+        self.dac_response = (1000, 0)
+        self.adc_gains = [1250]*17
+        self.adc_offsets = [0]*17
+        self.crc_enabled = 0
+        self.port_value = 0
+        self.counter_edge = 1
+        self.counter = 0
+        self.capture_running = False
+        self.capture_period = 0
+        # Low and high times (us) of the signal at the capture input
+        self.capture_input = (500, 500)
+        self.encoder_running = False
+        self.encoder_resolution = 0
+        self.encoder_position = 0
+        self.pwm_duty = 0
+        self.pwm_period = 0
+        self.signal_buffer = [0]*SIGNAL_SIZE
+        self.signal_length = 0
+        self.streaming = False
+        self.stream_start = 0
+        self.spi_cpol = 0
+        self.spi_cpha = 0
+        self.spi_pins = (1, 2, 3)
+        self.spi_sent = []
+        self.channels = {}
+        self.signals = {}
+        self.ain_index = {}
+        self.seed(seed)
 
         self.hw_ver = 0
         self.fw_ver = 56
         self.dev_id = 456423
 
+    def seed(self, seed=None):
+        """Restart the random generators and the time of all the inputs"""
+        self.rng = random.Random(seed)
+        self.ain_index.clear()
+        for signal in self.signals.values():
+            signal.reset()
+
+    def set_signal(self, pinput, signal):
+        """Attach a signal model to an analog input
+
+        Args:
+            pinput: Positive input (1-8)
+            signal: `opendaq.signals.Signal` (requires NumPy), or None
+                for random values
+        """
+        if not 0 < pinput <= NINPUTS:
+            raise ValueError("Invalid positive input")
+        if signal is None:
+            self.signals.pop(pinput, None)
+        else:
+            self.signals[pinput] = signal
+        self.ain_index.pop(pinput, None)
+
+    def _cal_index(self, pinput, ninput, gain):
+        """Calibration entry used by `DAQ.read_analog`"""
+        if self.hw_ver == 1:
+            return gain + 1
+        if ninput:
+            return (pinput - 1)/2 + 9
+        return pinput
+
+    def generate(self, n, period=AIN_PERIOD, pinput=None, ninput=None,
+                 gain=None, start=None):
+        """Raw ADC values of consecutive samples of an input
+
+        Inputs with a signal model are converted in a single block, using
+        the PGA gain and the actual ADC response (`adc_gains` and
+        `adc_offsets`). The other inputs return random values.
+
+        Args:
+            n: Number of samples
+            period: Sampling period (seconds)
+            pinput, ninput, gain: Input configuration (defaults to the
+                current ADC configuration)
+            start: Number of the first sample (defaults to the sample
+                after the last one generated for this input)
+        Returns:
+            Sequence of raw values
+        """
+        pinput = self.adc_pinput if pinput is None else pinput
+        ninput = self.adc_ninput if ninput is None else ninput
+        gain = self.adc_gain if gain is None else gain
+        if start is None:
+            start = self.ain_index.get(pinput, 0)
+        self.ain_index[pinput] = start + n
+
+        signal = self.signals.get(pinput)
+        if signal is None:
+            return [self.rng.randint(-2**14, 2**14 - 1) for _ in xrange(n)]
+
+        from opendaq.signals import adc_codes, pga_gain
+        hw_ver = 'm' if self.hw_ver == 1 else 's'
+        index = self._cal_index(pinput, ninput, gain)
+        volts = signal.samples(start, n, period)
+        return adc_codes(volts, self.adc_gains[index],
+                         self.adc_offsets[index], hw_ver,
+                         pga_gain(gain, hw_ver))
+
+    def _dac_output(self, code):
+        """Output voltage of the DAC for a raw code"""
+        gain, offset = self.dac_response
+        return (code/2.0 - 4096 - offset)/gain
+
+    def _now(self):
+        return self.clock.time()
+
     @SerialSim.command(18, 'B', 'B')
     def cmd_led_w(self, color):
         """Set LED color
@@ -127,11 +267,12 @@ class DAQSimulator(SerialSim):
             raise ValueError("Invalid voltage value")
 
         self.dac_value = value
+        self.dac_volts = value/1000.0
         return value
 
     @SerialSim.command(1, '', 'h')
     def cmd_ain(self):
-        return randint(-2**14, 2**14 - 1)
+        return int(self.generate(1)[0])
 
     @SerialSim.command(2, 'BBBB', 'hBBBB')
     def cmd_ain_cfg(self, pinput, ninput, gain, nsamples):
@@ -148,7 +289,7 @@ class DAQSimulator(SerialSim):
         self.adc_ninput = ninput
         self.adc_gain = gain
         self.adc_nsamples = nsamples
-        value = randint(-2**14, 2**14 - 1)
+        value = int(self.generate(1)[0])
         return value, pinput, ninput, gain, nsamples
 
     @SerialSim.command(39, '', 'BBI')
@@ -160,3 +301,323 @@ class DAQSimulator(SerialSim):
         if not 0 <= index <= (5 if self.hw_ver else 16):
             raise ValueError("Invalid calibration index")
         return index, self.calib_gains[index], self.calib_offsets[index]
+
+    @SerialSim.command(26, 'BB', 'BB')
+    def cmd_spi_config(self, cpol, cpha):
+        if cpol not in (0, 1) or cpha not in (0, 1):
+            raise ValueError("Invalid SPI clock configuration")
+
+        self.spi_cpol = cpol
+        self.spi_cpha = cpha
+        return cpol, cpha
+
+    @SerialSim.command(28, 'BBB', 'BBB')
+    def cmd_spi_setup(self, sck, mosi, miso):
+        for pin in (sck, mosi, miso):
+            if not 0 < pin < NPIOS:
+                raise ValueError("Invalid PIO number")
+
+        self.spi_pins = (sck, mosi, miso)
+        return sck, mosi, miso
+
+    @SerialSim.command(29, 'B', 'B')
+    def cmd_spi_byte(self, value):
+        """SPI transfer of a byte (MISO is looped back to MOSI)"""
+        self.spi_sent.append(value)
+        return value
+
+    @SerialSim.command(29, 'H', 'H')
+    def cmd_spi_word(self, value):
+        """SPI transfer of a word (MISO is looped back to MOSI)"""
+        self.spi_sent.append(value)
+        return value
+
+    def _get_channel(self, number):
+        if not 0 < number <= NCHANNELS:
+            raise ValueError("Invalid DataChannel number")
+        return self.channels.setdefault(number, {})
+
+    @SerialSim.command(19, 'BH', 'BH')
+    def cmd_create_stream(self, number, period):
+        if not period:
+            raise ValueError("Invalid period")
+        self._get_channel(number).update(kind='stream', trigger=period)
+        return number, period
+
+    @SerialSim.command(20, 'BB', 'BB')
+    def cmd_create_external(self, number, edge):
+        if edge not in (0, 1):
+            raise ValueError("Invalid edge")
+        self._get_channel(number).update(kind='external', trigger=edge)
+        return number, edge
+
+    @SerialSim.command(21, 'H', 'H')
+    def cmd_create_burst(self, period):
+        if period < 100:
+            raise ValueError("Invalid period")
+        self._get_channel(1).update(kind='burst', trigger=period)
+        return period
+
+    @SerialSim.command(22, 'BBBBBB', 'BBBBBB')
+    def cmd_conf_channel(self, number, mode, pinput, ninput, gain, nsamples):
+        if not 0 <= mode <= 5:
+            raise ValueError("Invalid mode")
+        self._get_channel(number).update(
+            mode=mode, pinput=pinput, ninput=ninput, gain=gain,
+            nsamples=nsamples)
+        return number, mode, pinput, ninput, gain, nsamples
+
+    @SerialSim.command(32, 'BHB', 'BHB')
+    def cmd_setup_channel(self, number, npoints, continuous):
+        self._get_channel(number).update(npoints=npoints,
+                                         continuous=continuous)
+        return number, npoints, continuous
+
+    @SerialSim.command(57, 'B', 'B')
+    def cmd_destroy_channel(self, number):
+        if not 0 <= number <= NCHANNELS:
+            raise ValueError("Invalid DataChannel number")
+        if number == 0:
+            self.channels.clear()
+        else:
+            self.channels.pop(number, None)
+        return number
+
+    @SerialSim.command(24, 'H', 'h')
+    def cmd_set_dac_raw(self, value):
+        """Set the DAC output (raw code)"""
+        if value >= (16384 if self.hw_ver == 1 else 65536):
+            raise ValueError("Invalid DAC value")
+        self.dac_raw = value
+        self.dac_volts = self._dac_output(value)
+        return value - 65536 if value >= 32768 else value
+
+    def _read_port(self):
+        return sum(self.pios[i] << i for i in range(6))
+
+    @SerialSim.command(7, 'B', 'B')
+    def cmd_set_port(self, value):
+        """Write the output PIOs; returns the state of the whole port"""
+        if value >= 64:
+            raise ValueError("Invalid port value")
+        for i in range(6):
+            if self.pios_dir[i]:
+                self.pios[i] = (value >> i) & 1
+        return self._read_port()
+
+    @SerialSim.command(9, 'B', 'B')
+    def cmd_set_port_dir(self, output):
+        if output >= 64:
+            raise ValueError("Invalid port direction")
+        for i in range(6):
+            self.pios_dir[i] = (output >> i) & 1
+        return output
+
+    @SerialSim.command(41, 'B', 'B')
+    def cmd_init_counter(self, edge):
+        if edge not in (0, 1):
+            raise ValueError("Invalid edge")
+        self.counter_edge = edge
+        self.counter = 0
+        return edge
+
+    @SerialSim.command(42, 'B', 'H')
+    def cmd_get_counter(self, reset):
+        """Read the counter (edges are added to `counter` by the user)"""
+        value = self.counter & 0xFFFF
+        if reset:
+            self.counter = 0
+        return value
+
+    @SerialSim.command(14, 'H', 'H')
+    def cmd_init_capture(self, period):
+        self.capture_running = True
+        self.capture_period = period
+        return period
+
+    @SerialSim.command(15, '', '')
+    def cmd_stop_capture(self):
+        self.capture_running = False
+
+    @SerialSim.command(16, 'B', 'BH')
+    def cmd_get_capture(self, mode):
+        """Measure the signal at the capture input (`capture_input`)"""
+        if not self.capture_running:
+            raise ValueError("Capture not running")
+        if mode not in (0, 1, 2):
+            raise ValueError("Invalid capture mode")
+        low, high = self.capture_input
+        value = (low, high, low + high)[mode]
+        return mode, min(value, 0xFFFF)
+
+    @SerialSim.command(50, 'B', 'B')
+    def cmd_init_encoder(self, resolution):
+        self.encoder_running = True
+        self.encoder_resolution = resolution
+        self.encoder_position = 0
+        return resolution
+
+    @SerialSim.command(51, '', '')
+    def cmd_stop_encoder(self):
+        self.encoder_running = False
+
+    @SerialSim.command(52, '', 'H')
+    def cmd_get_encoder(self):
+        """Read the encoder (moved by changing `encoder_position`)"""
+        if not self.encoder_running:
+            raise ValueError("Encoder not running")
+        if self.encoder_resolution:
+            return self.encoder_position % self.encoder_resolution
+        return self.encoder_position & 0xFFFF
+
+    @SerialSim.command(10, 'HH', 'HH')
+    def cmd_init_pwm(self, duty, period):
+        if duty >= 1024:
+            raise ValueError("Invalid duty cycle")
+        self.pwm_duty = duty
+        self.pwm_period = period
+        return duty, period
+
+    @SerialSim.command(11, '', '')
+    def cmd_stop_pwm(self):
+        self.pwm_duty = 0
+        self.pwm_period = 0
+
+    @SerialSim.command(37, 'BHh', 'BHh')
+    def cmd_setcalib(self, index, gain, offset):
+        if not 0 <= index <= (5 if self.hw_ver else 16):
+            raise ValueError("Invalid calibration index")
+        self.calib_gains[index] = gain
+        self.calib_offsets[index] = offset
+        return index, gain, offset
+
+    @SerialSim.command(55, 'B', 'B')
+    def cmd_enable_crc(self, on):
+        if on not in (0, 1):
+            raise ValueError("Invalid CRC flag")
+        self.crc_enabled = on
+        return on
+
+    @SerialSim.command(39, 'I', 'BBI')
+    def cmd_set_id(self, dev_id):
+        if dev_id >= 1000:
+            raise ValueError("Invalid device id")
+        self.dev_id = dev_id
+        return self.hw_ver, self.fw_ver, dev_id
+
+    @SerialSim.command(23, 'h*H', 'Bh')
+    def cmd_load_signal(self, offset, values):
+        """Store DAC codes in the signal buffer, starting at `offset`"""
+        if not values or not 0 <= offset <= SIGNAL_SIZE - len(values):
+            raise ValueError("Invalid signal offset")
+        self.signal_buffer[offset:offset + len(values)] = values
+        self.signal_length = max(self.signal_length, offset + len(values))
+        return len(values), offset
+
+    @SerialSim.command(64, '', '')
+    def cmd_start(self):
+        for ch in self.channels.values():
+            ch['sent'] = 0
+            ch['done'] = False
+        self.streaming = True
+        self.stream_start = self._now()
+
+    @SerialSim.command(80, '', '')
+    def cmd_stop(self):
+        self.streaming = False
+
+    @staticmethod
+    def _period(ch):
+        """Sampling period of a DataChannel (None if it has no timer)"""
+        if ch.get('kind') == 'stream':
+            return ch['trigger']/1e3
+        if ch.get('kind') == 'burst':
+            return ch['trigger']/1e6
+        return None
+
+    def _channel_values(self, ch, n, period):
+        """Samples of a DataChannel (None for output modes)"""
+        mode = ch.get('mode', ANALOG_INPUT)
+        if mode == ANALOG_INPUT:
+            return self.generate(n, period, ch.get('pinput', 1),
+                                 ch.get('ninput', 0), ch.get('gain', 0),
+                                 start=ch['sent'])
+        if mode == ANALOG_OUTPUT:
+            if self.signal_length:
+                pos = (ch['sent'] + n - 1) % self.signal_length
+                code = self.signal_buffer[pos]
+                self.dac_volts = self._dac_output(
+                    code/2 if self.hw_ver == 0 else code)
+            return None
+        if mode == DIGITAL_INPUT:
+            return [self._read_port()]*n
+        if mode == COUNTER_INPUT:
+            return [min(self.counter, 32767)]*n
+        if mode == CAPTURE_INPUT:
+            return [min(sum(self.capture_input), 32767)]*n
+        return None
+
+    def _stream_data(self):
+        """Stream packets of all the samples due since the last call"""
+        if not self.streaming:
+            return ''
+        elapsed = self._now() - self.stream_start
+        packets = []
+        for number in sorted(self.channels):
+            ch = self.channels[number]
+            period = self._period(ch)
+            if period is None or ch.get('done'):
+                continue
+            # The small offset avoids rounding down exact sample times
+            due = int(elapsed/period + 1e-9)
+            limited = ch.get('npoints') and not ch.get('continuous', 1)
+            if limited:
+                due = min(due, ch['npoints'])
+            n = due - ch['sent']
+            if n <= 0:
+                continue
+            values = self._channel_values(ch, n, period)
+            ch['sent'] = due
+            if values is not None:
+                for i in xrange(0, n, PACKET_SAMPLES):
+                    packets.append(encode_packet(
+                        number, values[i:i + PACKET_SAMPLES]))
+            if limited and due == ch['npoints']:
+                packets.append(encode_stop(number))
+                ch['done'] = True
+        return ''.join(packets)
+
+    def _next_packet(self):
+        """Time left until a DataChannel has a full packet to send"""
+        times = []
+        for ch in self.channels.values():
+            period = self._period(ch)
+            if period is None or ch.get('done'):
+                continue
+            n = PACKET_SAMPLES
+            if ch.get('npoints') and not ch.get('continuous', 1):
+                n = min(n, ch['npoints'] - ch['sent'])
+            times.append((ch['sent'] + n)*period)
+        if not times:
+            return None
+        return min(times) - (self._now() - self.stream_start)
+
+    def _send(self, data):
+        # The stream data due was sent before the command arrived, so it
+        # precedes the response
+        if self.port_open:
+            self._rbuf.extend(self._stream_data())
+        SerialSim._send(self, data)
+
+    def _recv(self, size, timeout):
+        SerialSim._recv(self, size, timeout)
+        data = self._stream_data()
+        if data or timeout == 0:
+            return data
+        wait = self._next_packet()
+        if wait is None:
+            return ''
+        if timeout is not None:
+            wait = min(wait, timeout)
+        self.clock.sleep(max(0, wait))
+        return self._stream_data()
@@ -0,0 +1,185 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Streaming power spectral density (requires NumPy)
+
+Samples are split in overlapping segments, windowed and transformed, and
+the periodograms are averaged as they arrive (Welch's method):
+
+    spec = Spectrum.from_channel(exp.channels[1], nperseg=512)
+    while acquiring:
+        spec.feed(daq.read_stream())
+        print spec.peaks(3)
+"""
+
+import numpy as np
+
+WINDOWS = {
+    'boxcar': np.ones,
+    'hann': np.hanning,
+    'hamming': np.hamming,
+    'blackman': np.blackman,
+}
+
+
+def get_window(window, n):
+    """Window function of length `n`
+
+    Args:
+        window: Name of the window (see `WINDOWS`) or array of weights
+    """
+    if isinstance(window, basestring):
+        if window not in WINDOWS:
+            raise ValueError("Unknown window")
+        return WINDOWS[window](n)
+    window = np.asarray(window, dtype=float)
+    if window.shape != (n,):
+        raise ValueError("Invalid window length")
+    return window
+
+
+class Spectrum(object):
+    def __init__(self, fs, nperseg=256, overlap=0.5, window='hann',
+                 alpha=None, max_segments=None, number=None):
+        """Running Welch PSD estimator
+
+        Args:
+            fs: Sample rate in Hz
+            nperseg: Length of each segment
+            overlap: Fraction of overlap between segments (0 <= x < 1)
+            window: Window name or array of weights
+            alpha: Weight of the new segments in an exponential average
+                (None: plain average of all the segments)
+            max_segments: Maximum number of segments transformed per
+                `feed` call, to bound its cost. The oldest segments are
+                skipped (and counted in `skipped`).
+            number: DataChannel taken from stream packets (None: all)
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError("Invalid overlap")
+        if alpha is not None and not 0 < alpha <= 1:
+            raise ValueError("Invalid alpha")
+        self.fs = float(fs)
+        self.nperseg = nperseg
+        self.step = max(int(round(nperseg*(1 - overlap))), 1)
+        self.window = get_window(window, nperseg)
+        self.alpha = alpha
+        self.max_segments = max_segments
+        self.number = number
+
+        # One-sided density scaling
+        self.scale = np.full(nperseg//2 + 1, 2.0/(fs*(self.window**2).sum()))
+        self.scale[0] /= 2
+        if nperseg % 2 == 0:
+            self.scale[-1] /= 2
+
+        self.buf = np.zeros(0)
+        self.psd = np.zeros(nperseg//2 + 1)
+        self.nsegments = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_channel(cls, channel, **kwargs):
+        """Build an estimator with the sample rate of an experiment
+
+        Args:
+            channel: `opendaq.experiment.Channel` (stream or burst)
+            kwargs: Other `Spectrum` arguments
+        """
+        if channel.period is None:
+            raise ValueError("The channel has no sampling period")
+        kwargs.setdefault('number', channel.number)
+        return cls(1/channel.period, **kwargs)
+
+    @property
+    def freqs(self):
+        """Frequency of every PSD bin, in Hz"""
+        return np.fft.rfftfreq(self.nperseg, 1/self.fs)
+
+    def _segments(self):
+        """Complete segments in the buffer, as rows of a 2-D array"""
+        n = (len(self.buf) - self.nperseg)//self.step + 1
+        if n <= 0:
+            return np.zeros((0, self.nperseg)), 0
+        starts = np.arange(n)*self.step
+        return self.buf[starts[:, np.newaxis] + np.arange(self.nperseg)], n
+
+    def feed(self, values):
+        """Add samples and update the PSD
+
+        Args:
+            values: Samples, or list of stream packets (see
+                `DAQ.read_stream`)
+        Returns:
+            Number of new segments
+        """
+        if len(values) and hasattr(values[0], 'values'):
+            values = [p.values for p in values if
+                      self.number is None or p.number == self.number]
+            values = np.concatenate(values) if values else []
+        self.buf = np.concatenate((self.buf, np.asarray(values, float)))
+
+        segments, n = self._segments()
+        if not n:
+            return 0
+        self.buf = self.buf[n*self.step:]
+        if self.max_segments and n > self.max_segments:
+            self.skipped += n - self.max_segments
+            segments = segments[n - self.max_segments:]
+
+        # Remove the mean of each segment, as the default 'constant'
+        # detrending of scipy.signal.welch
+        segments = segments - segments.mean(axis=1)[:, np.newaxis]
+        power = np.abs(np.fft.rfft(segments*self.window))**2*self.scale
+
+        count = len(power)
+        if self.alpha is None:
+            total = self.nsegments + count
+            self.psd += (power.sum(axis=0) - count*self.psd)/total
+        else:
+            if not self.nsegments:
+                self.psd = power[0].copy()
+                power = power[1:]
+            for p in power:
+                self.psd += self.alpha*(p - self.psd)
+        self.nsegments += count
+        return count
+
+    def peaks(self, n=5, threshold=0.0):
+        """Highest local maxima of the PSD
+
+        Args:
+            n: Maximum number of peaks
+            threshold: Minimum PSD value of a peak
+        Returns:
+            List of (frequency, PSD value) tuples, strongest first
+        """
+        psd = self.psd
+        if len(psd) < 3 or not self.nsegments:
+            return []
+        inner = (psd[1:-1] > psd[:-2]) & (psd[1:-1] >= psd[2:]) & \
+            (psd[1:-1] > threshold)
+        idx = np.flatnonzero(inner) + 1
+        idx = idx[np.argsort(psd[idx])[::-1][:n]]
+        freqs = self.freqs
+        return [(freqs[i], psd[i]) for i in idx]
+
+    def reset(self):
+        self.buf = np.zeros(0)
+        self.psd[:] = 0
+        self.nsegments = 0
+        self.skipped = 0
@@ -0,0 +1,204 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Streaming statistics of the stream channels (requires NumPy)
+
+    stats = ChannelStats(window=1000)
+    while acquiring:
+        stats.update_packets(daq.read_stream())
+    print stats[1].mean, stats[1].rms, stats.window(1).std
+"""
+
+import math
+import numpy as np
+
+
+class RunningStats(object):
+    """Count, mean, variance, RMS, minimum and maximum of a data stream
+
+    Blocks are merged with the parallel form of Welford's algorithm, so
+    memory use is constant and accumulators can be combined.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def _merge(self, count, mean, m2, vmin, vmax):
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta*count/total
+        self.m2 += m2 + delta*delta*self.count*count/total
+        self.count = total
+        self.min = vmin if self.min is None else min(self.min, vmin)
+        self.max = vmax if self.max is None else max(self.max, vmax)
+
+    def update(self, values):
+        """Add a block of values"""
+        values = np.asarray(values, dtype=float)
+        if not values.size:
+            return
+        mean = values.mean()
+        m2 = ((values - mean)**2).sum()
+        self._merge(values.size, mean, m2, values.min(), values.max())
+
+    def merge(self, other):
+        """Add the values seen by another accumulator"""
+        self._merge(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance"""
+        return self.m2/(self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def rms(self):
+        if not self.count:
+            return 0.0
+        return math.sqrt(self.mean**2 + self.m2/self.count)
+
+    def to_dict(self):
+        """Plain representation, to move the accumulator between
+        processes"""
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        stats._merge(d['count'], d['mean'], d['m2'], d['min'], d['max'])
+        return stats
+
+    def __repr__(self):
+        return ('RunningStats(count=%d, mean=%g, std=%g, rms=%g, min=%s, '
+                'max=%s)' % (self.count, self.mean, self.std, self.rms,
+                             self.min, self.max))
+
+
+class WindowStats(object):
+    """Statistics of the last `size` values of a data stream"""
+    def __init__(self, size):
+        self.buf = np.zeros(size)
+        self.pos = 0
+        self.full = False
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)[-len(self.buf):]
+        n = len(values)
+        end = self.pos + n
+        if end <= len(self.buf):
+            self.buf[self.pos:end] = values
+        else:
+            split = len(self.buf) - self.pos
+            self.buf[self.pos:] = values[:split]
+            self.buf[:n - split] = values[split:]
+        self.full = self.full or end >= len(self.buf)
+        self.pos = end % len(self.buf)
+
+    @property
+    def values(self):
+        """Values of the window, oldest first"""
+        if not self.full:
+            return self.buf[:self.pos]
+        return np.roll(self.buf, -self.pos)
+
+    def stats(self):
+        """Statistics of the window, as a `RunningStats`"""
+        stats = RunningStats()
+        stats.update(self.values)
+        return stats
+
+
+class ChannelStats(object):
+    def __init__(self, window=None):
+        """Per-DataChannel lifetime and windowed statistics
+
+        Args:
+            window: Number of recent samples of the windowed statistics
+                (None: lifetime statistics only)
+        """
+        self.window_size = window
+        self.lifetime = {}
+        self.windows = {}
+
+    def __getitem__(self, number):
+        """Lifetime statistics of a DataChannel"""
+        return self.lifetime[number]
+
+    def channels(self):
+        return sorted(self.lifetime)
+
+    def update(self, number, values):
+        """Add a block of samples of a DataChannel"""
+        if number not in self.lifetime:
+            self.lifetime[number] = RunningStats()
+            if self.window_size:
+                self.windows[number] = WindowStats(self.window_size)
+        self.lifetime[number].update(values)
+        if self.window_size:
+            self.windows[number].update(values)
+
+    def update_mixed(self, values, numbers):
+        """Add samples of several DataChannels
+
+        Args:
+            values: Samples
+            numbers: DataChannel number of each sample
+        """
+        values = np.asarray(values)
+        numbers = np.asarray(numbers)
+        for number in np.unique(numbers):
+            self.update(int(number), values[numbers == number])
+
+    def update_packets(self, packets):
+        """Add decoded stream packets (see `DAQ.read_stream`)"""
+        blocks = {}
+        for p in packets:
+            if len(p.values):
+                blocks.setdefault(p.number, []).append(p.values)
+        for number, arrays in blocks.items():
+            self.update(number, np.concatenate(arrays))
+
+    def window(self, number):
+        """Statistics of the last samples of a DataChannel"""
+        return self.windows[number].stats()
+
+    def merge(self, other):
+        """Add the lifetime statistics of another accumulator (e.g. from
+        another device or process). Windows are not merged."""
+        for number, stats in other.lifetime.items():
+            self.lifetime.setdefault(number, RunningStats()).merge(stats)
+        return self
+
+    def to_dict(self):
+        return dict((n, s.to_dict()) for n, s in self.lifetime.items())
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        for n, s in d.items():
+            stats.lifetime[int(n)] = RunningStats.from_dict(s)
+        return stats
@@ -0,0 +1,217 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bulk decoding of stream packets
+
+Stream packets start with a 0x7E flag, followed by an 8-byte header
+(checksum, command, length, DataChannel number and 3 more bytes) and
+the big-endian int16 samples. 0x7E and 0x7D bytes inside a packet are
+escaped with a 0x7D prefix.
+"""
+
+import struct
+import sys
+from array import array
+from opendaq.common import check_stream_crc
+
+FLAG = 0x7E
+ESC = 0x7D
+STREAM_CMD = 25
+STOP_CMD = 80
+HEADER_SIZE = 8
+
+
+class StreamPacket(object):
+    """Decoded stream packet
+
+    Attributes:
+        number: DataChannel number (1-4)
+        cmd: Command number (STOP_CMD for stop packets)
+        crc: Packet checksum
+        info: Remaining header bytes
+        index: Packet number since the decoder was created
+        offset: Number of samples of the DataChannel received before
+            this packet
+        values: Samples (array of signed 16-bit integers)
+        crc_ok: The checksum is correct
+    """
+    __slots__ = ('number', 'cmd', 'crc', 'info', 'index', 'offset',
+                 'values', 'crc_ok')
+
+    def __init__(self, number, cmd, crc=0, info=(0, 0, 0), index=0,
+                 offset=0, values=None, crc_ok=True):
+        self.number = number
+        self.cmd = cmd
+        self.crc = crc
+        self.info = tuple(info)
+        self.index = index
+        self.offset = offset
+        self.values = array('h') if values is None else values
+        self.crc_ok = crc_ok
+
+    @property
+    def is_stop(self):
+        return self.cmd == STOP_CMD
+
+    def __repr__(self):
+        return 'StreamPacket(number=%d, cmd=%d, index=%d, %d values)' % (
+            self.number, self.cmd, self.index, len(self.values))
+
+
+def _escape(data):
+    out = bytearray()
+    for c in bytearray(data):
+        if c in (FLAG, ESC):
+            out.append(ESC)
+            c ^= 0x20
+        out.append(c)
+    return out
+
+
+def encode_packet(number, values, info=(0, 0, 0)):
+    """Build a stream packet, as sent by the openDAQ
+
+    Args:
+        number: DataChannel number
+        values: Signed 16-bit samples
+        info: Remaining header bytes
+    """
+    body = struct.pack('!BBB3B%dh' % len(values), STREAM_CMD,
+                       4 + 2*len(values), number, *(tuple(info) +
+                                                    tuple(values)))
+    crc = sum(bytearray(body)) % 65536
+    return '\x7e' + str(_escape(struct.pack('!H', crc) + body))
+
+
+def encode_stop(number):
+    """Build the packet sent by the openDAQ when a DataChannel stops"""
+    body = struct.pack('!BBB', STOP_CMD, 1, number)
+    crc = sum(bytearray(body)) % 65536
+    return '\x7e' + str(_escape(struct.pack('!H', crc) + body))
+
+
+def _unescape(buf, pos, n):
+    """Read `n` unescaped bytes from `buf`, starting at `pos`
+
+    Returns:
+        Unescaped bytes and the position after them, or (None, pos) if
+        the buffer is not long enough
+    """
+    end = pos + n
+    if buf.find('\x7d', pos, end) < 0:
+        if end > len(buf):
+            return None, pos
+        return buf[pos:end], end
+
+    out = bytearray()
+    start = pos
+    while len(out) < n:
+        if pos >= len(buf):
+            return None, start
+        c = buf[pos]
+        pos += 1
+        if c == ESC:
+            if pos >= len(buf):
+                return None, start
+            c = buf[pos] | 0x20
+            pos += 1
+        out.append(c)
+    return out, pos
+
+
+class StreamDecoder(object):
+    """Incremental decoder of stream packets
+
+    Data can be fed in chunks of any size: incomplete packets are kept
+    until the rest of their bytes arrive.
+    """
+    def __init__(self):
+        self.buf = bytearray()
+        self.npackets = 0
+        self.nsamples = 0
+        self.crc_errors = 0
+        self.skipped = 0
+        self.offsets = {}
+
+    def feed(self, data):
+        """Decode a chunk of stream data
+
+        Args:
+            data: Raw data read from the device
+        Returns:
+            List of complete `StreamPacket` objects
+        """
+        buf = self.buf
+        buf.extend(data)
+        packets = []
+        pos = 0
+        while True:
+            start = buf.find('\x7e', pos)
+            if start < 0:
+                self.skipped += len(buf) - pos
+                pos = len(buf)
+                break
+            self.skipped += start - pos
+
+            packet, end = self._decode(buf, start + 1)
+            if packet is None:
+                pos = start
+                break
+            packets.append(packet)
+            pos = end
+
+        del buf[:pos]
+        return packets
+
+    def _decode(self, buf, pos):
+        head, end = _unescape(buf, pos, 3)
+        if head is None:
+            return None, pos
+        crc = (head[0] << 8) | head[1]
+
+        if head[2] == STOP_CMD:
+            tail, end = _unescape(buf, end, 2)
+            if tail is None:
+                return None, pos
+            packet = StreamPacket(tail[1], STOP_CMD, crc, index=self.npackets)
+            self.npackets += 1
+            return packet, end
+
+        rest, end = _unescape(buf, end, HEADER_SIZE - 3)
+        if rest is None:
+            return None, pos
+        header = head + rest
+        payload, end = _unescape(buf, end, max(header[3] - 4, 0))
+        if payload is None:
+            return None, pos
+
+        values = array('h', str(payload[:len(payload) & ~1]))
+        if sys.byteorder == 'little':
+            values.byteswap()
+
+        crc_ok = check_stream_crc(header, payload)
+        if not crc_ok:
+            self.crc_errors += 1
+
+        number = header[4]
+        offset = self.offsets.get(number, 0)
+        self.offsets[number] = offset + len(values)
+        packet = StreamPacket(number, header[2], crc, header[5:8],
+                              self.npackets, offset, values, crc_ok)
+        self.npackets += 1
+        self.nsamples += len(values)
+        return packet, end
@@ -0,0 +1,272 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Thread-safe access to a DAQ
+
+All the link I/O of a `ThreadedDAQ` is done by a single worker thread.
+Method calls are queued and return a `Future`; urgent commands (see
+`URGENT`) jump ahead of the queued ones. While an experiment is running,
+the worker reads the stream between commands, and the commands do not
+stop the experiment (call `stop` first to reconfigure the DataChannels):
+
+    tdaq = ThreadedDAQ(DAQ('/dev/ttyUSB0'))
+    tdaq.set_led(1).result()
+    tdaq.start().result()
+    packets = tdaq.read_stream(timeout=1)
+    tdaq.stop()
+"""
+
+import itertools
+import threading
+import Queue
+
+# Priorities of the queued commands
+HIGH = 0
+NORMAL = 1
+
+# Commands queued with HIGH priority
+URGENT = ('stop',)
+
+POLL_PERIOD = 0.01
+
+
+class TimeoutError(IOError):
+    pass
+
+
+class CancelledError(Exception):
+    pass
+
+
+class Future(object):
+    """Result of a queued command
+
+    A minimal version of `concurrent.futures.Future`.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._running = False
+        self._cancelled = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._event.is_set()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """Cancel the command if it has not started yet
+
+        Returns:
+            True if the command was cancelled
+        """
+        with self._lock:
+            if self._running or self.done():
+                return self._cancelled
+            self._cancelled = True
+        self._finish()
+        return True
+
+    def set_running(self):
+        """Mark the command as started
+
+        Returns:
+            False if it was cancelled before
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._running = True
+            return True
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        # Callbacks added concurrently are either run here or by
+        # add_done_callback, never skipped
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Call `callback(future)` when the command finishes"""
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def exception(self, timeout=None):
+        # Event.wait only returns the flag since Python 2.7
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise TimeoutError("Command timeout")
+        if self._cancelled:
+            raise CancelledError()
+        return self._exception
+
+    def result(self, timeout=None):
+        """Wait for the command and return its result
+
+        Args:
+            timeout: Seconds to wait (None: forever)
+        Raises:
+            TimeoutError: The command did not finish in time
+            CancelledError: The command was cancelled
+            Any exception raised by the command
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+
+class ThreadedDAQ(object):
+    def __init__(self, daq, poll_period=POLL_PERIOD):
+        """Serve the methods of a DAQ from a single I/O thread
+
+        Any DAQ method can be called on this object. The call is queued
+        and a `Future` is returned. Other attributes are read directly.
+
+        Args:
+            daq: `DAQ` instance (it must not be used directly anymore).
+                Its `stop_stream` attribute is cleared.
+            poll_period: Maximum time the worker waits for stream data
+                before serving queued commands
+        """
+        self.daq = daq
+        daq.stop_stream = False
+        self.poll_period = poll_period
+        self.commands = Queue.PriorityQueue()
+        self.packets = Queue.Queue()
+        self._seq = itertools.count()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, method, *args, **kwargs):
+        """Queue a DAQ method call
+
+        Args:
+            method: Method name (e.g. 'set_led'); methods in `URGENT` are
+                served before the other queued commands
+            args, kwargs: Method arguments
+        Returns:
+            `Future` of the call
+        """
+        priority = HIGH if method in URGENT else NORMAL
+        return self._put(priority, method, args, kwargs)
+
+    def _put(self, priority, method, args=(), kwargs=None):
+        if self._closed:
+            raise IOError("ThreadedDAQ is closed")
+        future = Future()
+        self.commands.put((priority, next(self._seq), future, method, args,
+                           kwargs or {}))
+        return future
+
+    def __getattr__(self, name):
+        attr = getattr(self.daq, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self.submit(name, *args, **kwargs)
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+
+    def read_stream(self, timeout=None):
+        """Get the stream packets read by the worker
+
+        Args:
+            timeout: Seconds to wait for the first packet (None: forever)
+        Returns:
+            List of `StreamPacket` objects (empty if the timeout expired)
+        """
+        packets = []
+        try:
+            packets.extend(self.packets.get(timeout=timeout))
+            while True:
+                packets.extend(self.packets.get_nowait())
+        except Queue.Empty:
+            pass
+        return packets
+
+    def _poll_stream(self, timeout):
+        packets = self.daq.read_stream(timeout=timeout)
+        if packets:
+            self.packets.put(packets)
+
+    def _run(self):
+        while True:
+            try:
+                if self.daq.measuring:
+                    # The stream is read before every command, waiting
+                    # for it only if no command is queued
+                    self._poll_stream(
+                        0 if self.commands.qsize() else self.poll_period)
+                    item = self.commands.get_nowait()
+                else:
+                    item = self.commands.get()
+            except Queue.Empty:
+                continue
+
+            _, _, future, method, args, kwargs = item
+            if method is None:
+                future.set_result(None)
+                break
+            if not future.set_running():
+                continue
+            try:
+                result = getattr(self.daq, method)(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            if self.daq.pending_packets:
+                # Stream packets received before the response
+                self._poll_stream(0)
+
+    def close(self, timeout=None):
+        """Serve the queued commands and stop the worker
+
+        The DAQ itself is not closed.
+        """
+        if not self._closed:
+            self._put(NORMAL, None)
+            self._closed = True
+        self._worker.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,347 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import select
+import socket
+import tty
+import serial
+from opendaq.clock import SYSTEM_CLOCK
+
+CHUNK_SIZE = 4096
+
+_DEFAULT = object()
+
+
+class Transport(object):
+    """Base class of the byte links used to talk to an openDAQ
+
+    Backends only implement the raw primitives (`_open`, `_recv`, `_send`
+    and `_close`). All of them share the same receive buffer, which is
+    filled in bulk, so that `read` can return exact amounts of data
+    without issuing a system call per byte.
+    """
+    # Seconds to wait after opening the link before talking to the device
+    reset_delay = 0
+    # Time source of the read timeouts (see opendaq.clock)
+    clock = SYSTEM_CLOCK
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._rbuf = bytearray()
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def _recv(self, size, timeout):
+        """Receive up to `size` bytes from the link
+
+        Args:
+            size: Maximum number of bytes to receive
+            timeout: Seconds to wait for the first byte (None: forever)
+        Returns:
+            Received data, or an empty string if the timeout expired
+        """
+        raise NotImplementedError
+
+    def _send(self, data):
+        raise NotImplementedError
+
+    def _fill(self, size, timeout):
+        data = self._recv(max(size, CHUNK_SIZE), timeout)
+        self._rbuf.extend(data)
+        return len(data)
+
+    def open(self):
+        """Open (or reopen) the link"""
+        del self._rbuf[:]
+        self._open()
+
+    def close(self):
+        """Close the link, discarding any buffered data"""
+        del self._rbuf[:]
+        self._close()
+
+    def write(self, data):
+        """Send data to the device
+
+        Returns:
+            Number of bytes written
+        """
+        self._send(data)
+        return len(data)
+
+    def read(self, size=1, timeout=_DEFAULT):
+        """Read `size` bytes
+
+        Args:
+            size: Number of bytes to read
+            timeout: Seconds to wait for the whole read (None: forever).
+                Defaults to the transport timeout.
+        Returns:
+            The data read, which is shorter than `size` if the timeout
+            expired
+        """
+        if timeout is _DEFAULT:
+            timeout = self.timeout
+        if timeout is not None:
+            deadline = self.clock.time() + timeout
+
+        while len(self._rbuf) < size:
+            remaining = None
+            if timeout is not None:
+                remaining = max(0, deadline - self.clock.time())
+            if not self._fill(size - len(self._rbuf), remaining):
+                break
+
+        ret = str(self._rbuf[:size])
+        del self._rbuf[:size]
+        return ret
+
+    def read_available(self):
+        """Read all the data pending in the link, without blocking"""
+        while self._fill(0, 0):
+            pass
+        ret = str(self._rbuf)
+        del self._rbuf[:]
+        return ret
+
+    def wait_ready(self, timeout=_DEFAULT):
+        """Wait for incoming data
+
+        Args:
+            timeout: Seconds to wait (None: forever). Defaults to the
+                transport timeout.
+        Returns:
+            True if there is data ready to be read
+        """
+        if timeout is _DEFAULT:
+            timeout = self.timeout
+        return bool(self._rbuf) or self._fill(1, timeout) > 0
+
+    def inWaiting(self):
+        """Number of bytes that can be read without blocking"""
+        self._fill(0, 0)
+        return len(self._rbuf)
+
+    def flushInput(self):
+        """Discard all the pending input data"""
+        del self._rbuf[:]
+        while self._recv(CHUNK_SIZE, 0):
+            pass
+
+    def setRTS(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SerialTransport(Transport):
+    """Serial port link (pyserial)"""
+    reset_delay = 2
+
+    def __init__(self, port, baudrate=9600, timeout=None):
+        Transport.__init__(self, timeout)
+        self.port = port
+        self.baudrate = baudrate
+        self.ser = None
+        self._open()
+
+    def _open(self):
+        if self.ser is None:
+            self.ser = serial.Serial(self.port, self.baudrate,
+                                     timeout=self.timeout)
+        elif not self.ser.isOpen():
+            self.ser.open()
+        self.ser.setRTS(0)
+
+    def _close(self):
+        self.ser.close()
+
+    def _recv(self, size, timeout):
+        pending = self.ser.inWaiting()
+        if pending:
+            return self.ser.read(min(pending, size))
+        if timeout == 0:
+            return ''
+
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
+        data = self.ser.read(1)
+        pending = self.ser.inWaiting()
+        if data and pending:
+            data += self.ser.read(min(pending, size - 1))
+        return data
+
+    def _send(self, data):
+        self.ser.write(data)
+
+    def flushInput(self):
+        del self._rbuf[:]
+        self.ser.flushInput()
+
+    def setRTS(self, value):
+        self.ser.setRTS(value)
+
+    def fileno(self):
+        return self.ser.fileno()
+
+
+class _FileTransport(Transport):
+    """Base class for links with a selectable file descriptor"""
+
+    def fileno(self):
+        raise NotImplementedError
+
+    def _select(self, timeout):
+        r, _, _ = select.select([self.fileno()], [], [], timeout)
+        return bool(r)
+
+
+class TCPTransport(_FileTransport):
+    """Raw TCP link to a serial server (e.g. ser2net in raw mode)"""
+
+    def __init__(self, host, port, timeout=None):
+        _FileTransport.__init__(self, timeout)
+        self.host = host
+        self.port = port
+        self.sock = None
+        self._open()
+
+    def _open(self):
+        if self.sock is not None:
+            return
+        self.sock = socket.create_connection((self.host, self.port),
+                                             self.timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _recv(self, size, timeout):
+        if not self._select(timeout):
+            return ''
+        data = self.sock.recv(size)
+        if not data:
+            raise IOError("Connection closed by the server")
+        return data
+
+    def _send(self, data):
+        self.sock.sendall(data)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+class PtyTransport(_FileTransport):
+    """Pseudo-terminal link
+
+    If no path is given, a new pty pair is created. The transport keeps
+    the master side, and the slave side is left for the peer (a device
+    emulator, socat...), which can be reached through `peer_name` or
+    `peer_fd`.
+    """
+
+    def __init__(self, path=None, timeout=None):
+        _FileTransport.__init__(self, timeout)
+        self.path = path
+        self.fd = None
+        self.peer_fd = None
+        self.peer_name = None
+        self._open()
+
+    def _open(self):
+        if self.fd is not None:
+            return
+        if self.path is None:
+            self.fd, self.peer_fd = os.openpty()
+            tty.setraw(self.peer_fd)
+            self.peer_name = os.ttyname(self.peer_fd)
+        else:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(self.fd)
+
+    def _close(self):
+        for fd in (self.fd, self.peer_fd):
+            if fd is not None:
+                os.close(fd)
+        self.fd = self.peer_fd = None
+
+    def _recv(self, size, timeout):
+        if not self._select(timeout):
+            return ''
+        return os.read(self.fd, size)
+
+    def _send(self, data):
+        while data:
+            data = data[os.write(self.fd, data):]
+
+    def fileno(self):
+        return self.fd
+
+
+def open_transport(port, baudrate=9600, timeout=None):
+    """Open the link described by a port specification
+
+    Args:
+        port: One of:
+            - a `Transport` instance, which is (re)opened. It gets the
+              given timeout unless it already had one.
+            - 'sim': openDAQ simulator
+            - 'socket://host:port': raw TCP serial server
+            - 'pty://path': existing pseudo-terminal
+            - 'replay://path': capture file, replayed as fast as possible
+            - any other string: serial port name
+        baudrate: Serial baud rate
+        timeout: Default read timeout in seconds
+    Returns:
+        An open `Transport`
+    """
+    if isinstance(port, Transport):
+        if port.timeout is None:
+            port.timeout = timeout
+        port.open()
+        return port
+
+    if port == 'sim':
+        from opendaq.simulator import DAQSimulator
+        return DAQSimulator(port, baudrate, timeout=timeout)
+
+    if port.startswith('socket://'):
+        host, _, tcp_port = port[len('socket://'):].rpartition(':')
+        if not host or not tcp_port.isdigit():
+            raise ValueError("Invalid socket address: %s" % port)
+        return TCPTransport(host, int(tcp_port), timeout)
+
+    if port.startswith('pty://'):
+        return PtyTransport(port[len('pty://'):], timeout)
+
+    if port.startswith('replay://'):
+        from opendaq.capture import ReplayTransport
+        return ReplayTransport(port[len('replay://'):], timeout=timeout)
+
+    return SerialTransport(port, baudrate, timeout)
@@ -0,0 +1,275 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Software trigger on the decoded stream (requires NumPy)
+
+The trigger works on blocks of samples of one channel, or of several
+synchronized channels (one column per channel). Conditions are evaluated
+on whole blocks at once:
+
+    trig = Trigger(Edge(1000) & Level(200, channel=1), pre=100, post=400)
+    for block in blocks:
+        for seg in trig.feed(block):
+            print seg.index, seg.data.shape
+"""
+
+import numpy as np
+
+
+class Condition(object):
+    """Base class of the trigger conditions
+
+    Conditions can be combined with the & and | operators.
+    """
+    def __init__(self, channel=0):
+        self.channel = channel
+
+    def _columns(self, values, last):
+        x = values[:, self.channel]
+        first = x[:1] if last is None else [last[self.channel]]
+        prev = np.concatenate((first, x[:-1]))
+        return x, prev
+
+    def mask(self, values, last):
+        """Evaluate the condition
+
+        Args:
+            values: Block of samples (one column per channel)
+            last: Last row of the previous block, or None
+        Returns:
+            Boolean array, true where the condition is met
+        """
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+
+class Level(Condition):
+    def __init__(self, threshold, above=True, channel=0):
+        """The signal is above (or below) a threshold"""
+        Condition.__init__(self, channel)
+        self.threshold = threshold
+        self.above = above
+
+    def mask(self, values, last):
+        x = values[:, self.channel]
+        return x >= self.threshold if self.above else x <= self.threshold
+
+
+class Edge(Condition):
+    def __init__(self, threshold, rising=True, channel=0):
+        """The signal crosses a threshold"""
+        Condition.__init__(self, channel)
+        self.threshold = threshold
+        self.rising = rising
+
+    def mask(self, values, last):
+        x, prev = self._columns(values, last)
+        if self.rising:
+            return (prev < self.threshold) & (x >= self.threshold)
+        return (prev > self.threshold) & (x <= self.threshold)
+
+
+class Window(Condition):
+    def __init__(self, low, high, entering=False, channel=0):
+        """The signal leaves (or enters) the [low, high] range"""
+        Condition.__init__(self, channel)
+        self.low = low
+        self.high = high
+        self.entering = entering
+
+    def mask(self, values, last):
+        x, prev = self._columns(values, last)
+        inside = (x >= self.low) & (x <= self.high)
+        was_inside = (prev >= self.low) & (prev <= self.high)
+        if self.entering:
+            return inside & ~was_inside
+        return was_inside & ~inside
+
+
+class Slope(Condition):
+    def __init__(self, rate, rising=True, channel=0):
+        """The signal changes faster than `rate` units per sample"""
+        Condition.__init__(self, channel)
+        self.rate = rate
+        self.rising = rising
+
+    def mask(self, values, last):
+        x, prev = self._columns(values, last)
+        diff = x.astype(float) - prev
+        return diff >= self.rate if self.rising else diff <= -self.rate
+
+
+class AllOf(Condition):
+    def __init__(self, *conditions):
+        """All the conditions are met at the same sample"""
+        self.conditions = conditions
+
+    def mask(self, values, last):
+        masks = [c.mask(values, last) for c in self.conditions]
+        return np.logical_and.reduce(masks)
+
+
+class AnyOf(AllOf):
+    """Any of the conditions is met"""
+    def mask(self, values, last):
+        masks = [c.mask(values, last) for c in self.conditions]
+        return np.logical_or.reduce(masks)
+
+
+class RingBuffer(object):
+    """Fixed-size buffer of the last rows of a stream"""
+    def __init__(self, size, width, dtype=float):
+        self.buf = np.zeros((size, width), dtype)
+        self.pos = 0
+        self.count = 0
+
+    def extend(self, values):
+        size = len(self.buf)
+        values = values[-size:]
+        n = len(values)
+        idx = (self.pos + np.arange(n)) % size
+        self.buf[idx] = values
+        self.pos = (self.pos + n) % size
+        self.count = min(self.count + n, size)
+
+    def last(self, n):
+        """Last `n` rows, oldest first"""
+        n = min(n, self.count)
+        idx = (self.pos - n + np.arange(n)) % len(self.buf)
+        return self.buf[idx]
+
+
+class Segment(object):
+    """Captured segment
+
+    Attributes:
+        index: Sample number of the trigger
+        time: Trigger time in seconds (None if the sample period is
+            unknown)
+        data: Samples (pre + post rows, one column per channel); the
+            trigger sample is at row `pre`
+        pre: Number of pre-trigger samples
+    """
+    __slots__ = ('index', 'time', 'data', 'pre')
+
+    def __init__(self, index, time, data, pre):
+        self.index = index
+        self.time = time
+        self.data = data
+        self.pre = pre
+
+
+class Trigger(object):
+    def __init__(self, condition, pre=0, post=100, holdoff=0, rearm=True,
+                 period=None, t0=0.0):
+        """Trigger engine
+
+        Args:
+            condition: `Condition` which fires the trigger
+            pre: Number of samples kept before the trigger
+            post: Number of samples captured from the trigger on
+            holdoff: Samples to wait after a segment before rearming
+            rearm: Rearm automatically after every segment (otherwise
+                `arm` has to be called)
+            period: Sample period in seconds, to timestamp the triggers
+            t0: Time of the first sample
+        """
+        if post < 1 or pre < 0 or holdoff < 0:
+            raise ValueError("Invalid segment length")
+        self.condition = condition
+        self.pre = pre
+        self.post = post
+        self.holdoff = holdoff
+        self.rearm = rearm
+        self.period = period
+        self.t0 = t0
+        self.armed = True
+        self.nsamples = 0
+        self._ring = None
+        self._last = None
+        self._capture = None
+        # The pre-trigger history has to be filled before triggering
+        self._next = pre
+
+    def arm(self):
+        self.armed = True
+
+    def _segment(self, index, data):
+        time = None
+        if self.period is not None:
+            time = self.t0 + index*self.period
+        return Segment(index, time, data, self.pre)
+
+    def feed(self, values):
+        """Process a block of samples
+
+        Args:
+            values: 1-D array (one channel) or 2-D array (one column per
+                channel)
+        Returns:
+            List of the `Segment` objects completed by this block
+        """
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[:, np.newaxis]
+        n = len(values)
+        if self._ring is None:
+            self._ring = RingBuffer(max(self.pre, 1), values.shape[1],
+                                    values.dtype)
+        base = self.nsamples
+        mask = self.condition.mask(values, self._last) if n else []
+
+        segments = []
+        pos = 0
+        while pos < n:
+            if self._capture is not None:
+                index, parts, count = self._capture
+                take = values[pos:pos + self.post - count]
+                parts.append(take)
+                count += len(take)
+                pos += len(take)
+                if count < self.post:
+                    self._capture = index, parts, count
+                    break
+                segments.append(self._segment(index, np.concatenate(parts)))
+                self._capture = None
+                self._next = index + self.post + self.holdoff
+                self.armed = self.rearm
+                continue
+
+            if not self.armed:
+                break
+            start = max(pos, self._next - base)
+            hits = np.flatnonzero(mask[start:])
+            if not len(hits):
+                break
+            t = start + hits[0]
+            history = np.concatenate((self._ring.last(self.pre), values[:t]))
+            pre = history[len(history) - self.pre:]
+            self._capture = base + t, [pre], 0
+            pos = t
+
+        if n:
+            self._ring.extend(values)
+            self._last = values[-1]
+        self.nsamples += n
+        return segments
@@ -0,0 +1,331 @@
+# Copyright 2013 Juan Menendez <juanmb@ingen10.com>
+#
+# This file is part of opendaq.
+#
+# opendaq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# opendaq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with opendaq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Supervision of stream acquisitions
+
+A `Watchdog` reads the stream of a DAQ and checks it against the packet
+rate expected from the experiment. When the link fails, the stream
+stalls or only corrupt data arrives, the port is reopened, the
+calibration and the experiment are restored and the acquisition is
+restarted:
+
+    watchdog = Watchdog(daq, exp)
+    watchdog.start()
+    while acquiring:
+        packets = watchdog.read_stream()
+    watchdog.stop()
+    for gap in watchdog.gaps:
+        print gap
+
+The packet offsets keep counting across restarts, skipping the samples
+lost during every gap, so the gaps stay visible to the consumers of the
+stream (see opendaq.recorder and opendaq.align).
+"""
+
+import struct
+
+# Lower limit of the default stall timeout (seconds)
+MIN_STALL_TIMEOUT = 1.0
+# Full packets the fastest DataChannel may be late before the stream is
+# considered stalled
+STALL_PACKETS = 4
+# Samples of a full stream packet
+PACKET_SAMPLES = 20
+# Consecutive reads with only corrupt data before the link is reset
+MAX_ERRORS = 8
+# Seconds between reconnection attempts
+RETRY_DELAY = 0.5
+# Attempts to stop the device after reconnecting
+STOP_RETRIES = 5
+
+# Causes of a gap
+LINK_ERROR = 'link'
+STALL = 'stall'
+CORRUPT = 'corrupt'
+
+STOP_CMD = '\x50\x00'
+
+
+class RecoveryError(IOError):
+    pass
+
+
+class Gap(object):
+    """Interruption of the acquisition
+
+    Attributes:
+        reason: LINK_ERROR, STALL or CORRUPT
+        start: Time of the last valid data before the fault
+        end: Time when the acquisition was restarted
+        offsets: Offset of the first missing sample of every DataChannel
+        resume: Offset of the first sample after the restart, for every
+            DataChannel (estimated from the DataChannel period)
+        attempts: Reconnection attempts
+    """
+    __slots__ = ('reason', 'start', 'end', 'offsets', 'resume', 'attempts')
+
+    def __init__(self, reason, start, end, offsets, resume, attempts=1):
+        self.reason = reason
+        self.start = start
+        self.end = end
+        self.offsets = offsets
+        self.resume = resume
+        self.attempts = attempts
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return 'Gap(reason=%s, start=%.3f, duration=%.3f, attempts=%d)' % (
+            self.reason, self.start, self.duration, self.attempts)
+
+
+class Watchdog(object):
+    def __init__(self, daq, experiment=None, stall_timeout=None,
+                 max_errors=MAX_ERRORS, retry_delay=RETRY_DELAY,
+                 max_retries=None, restore_cal=True, callback=None):
+        """Stream reader which restarts the acquisition after link faults
+
+        The calibration in use when the watchdog is created is the one
+        restored after a fault. DataChannels with a limited number of
+        points start over after a restart.
+
+        Args:
+            daq: `DAQ` instance
+            experiment: `Experiment` applied by `start` (None: the
+                experiment already applied to the DAQ)
+            stall_timeout: Seconds without valid data before the stream
+                is considered stalled (None: a few packets of the fastest
+                DataChannel, at least MIN_STALL_TIMEOUT; no stall
+                detection if no DataChannel has a fixed period)
+            max_errors: Consecutive reads with only corrupt data (bad
+                CRC or bytes out of any packet) before the link is reset
+            retry_delay: Seconds between reconnection attempts
+            max_retries: Maximum reconnection attempts per fault (None:
+                no limit)
+            restore_cal: Write the calibration back to the device if it
+                changed
+            callback: Function called with every new `Gap`
+        """
+        self.daq = daq
+        self.experiment = experiment
+        self._stall_timeout = stall_timeout
+        self.max_errors = max_errors
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.restore_cal = restore_cal
+        self.callback = callback
+        self.calibration = (list(daq.gains), list(daq.offsets),
+                            daq.dac_gain, daq.dac_offset)
+
+        self.gaps = []
+        self.running = False
+        self.stopped = set()
+        self.bases = {}
+        self.ends = {}
+        self.errors = 0
+        self.last_data = None
+
+    @property
+    def clock(self):
+        return self.daq.clock
+
+    @property
+    def stall_timeout(self):
+        """Current stall timeout in seconds (None: no stall detection)"""
+        if self._stall_timeout is not None or self.experiment is None:
+            return self._stall_timeout
+        periods = [ch.period for n, ch in self.experiment.channels.items()
+                   if ch.period and n not in self.stopped]
+        if not periods:
+            return None
+        return max(MIN_STALL_TIMEOUT,
+                   STALL_PACKETS*PACKET_SAMPLES*min(periods))
+
+    @property
+    def downtime(self):
+        """Total duration of the gaps in seconds"""
+        return sum(gap.duration for gap in self.gaps)
+
+    def start(self):
+        """Apply the experiment and start acquiring
+
+        Raises:
+            ValueError: No experiment
+        """
+        if self.experiment is None:
+            if self.daq.experiment is None:
+                raise ValueError("No experiment")
+            self.experiment = self.daq.experiment.copy()
+        else:
+            self.daq.apply_experiment(self.experiment)
+        self.daq.start()
+        self.running = True
+        self.stopped = set()
+        self.bases = {}
+        self.ends = {}
+        self.errors = 0
+        self.last_data = self.clock.time()
+
+    def stop(self):
+        """Stop the acquisition"""
+        self.running = False
+        self.daq.stop()
+
+    def read_stream(self, timeout=None):
+        """Read the pending stream packets, recovering from link faults
+
+        Args:
+            timeout: Seconds to wait for data (None: the link timeout)
+        Returns:
+            List of `StreamPacket` objects, whose offsets count the
+            samples since `start` (including the lost ones)
+        Raises:
+            RecoveryError: The device could not be reconnected
+        """
+        if not self.running:
+            return []
+        stall_timeout = self.stall_timeout
+        if stall_timeout is not None:
+            # Do not wait beyond the stall deadline
+            if timeout is None:
+                timeout = self.daq.ser.timeout
+            left = self.last_data + stall_timeout - self.clock.time()
+            timeout = max(0, min(timeout, left))
+        decoder = self.daq.decoder
+        skipped = decoder.skipped
+        try:
+            packets = self.daq.read_stream(timeout=timeout)
+        except (IOError, OSError):
+            self.recover(LINK_ERROR)
+            return []
+
+        valid = False
+        corrupt = decoder.skipped > skipped
+        for p in packets:
+            if p.is_stop:
+                self.stopped.add(p.number)
+                valid = True
+                continue
+            p.offset += self.bases.get(p.number, 0)
+            if p.crc_ok:
+                self.ends[p.number] = p.offset + len(p.values)
+                valid = True
+            else:
+                corrupt = True
+
+        now = self.clock.time()
+        if valid:
+            self.last_data = now
+            self.errors = 0
+        elif corrupt:
+            self.errors += 1
+
+        stall_timeout = self.stall_timeout
+        if self.errors >= self.max_errors:
+            self.recover(CORRUPT)
+        elif stall_timeout is not None and \
+                now - self.last_data >= stall_timeout:
+            self.recover(STALL)
+        return packets
+
+    def recover(self, reason):
+        """Reconnect the device and restart the acquisition
+
+        Args:
+            reason: Cause of the fault (LINK_ERROR, STALL or CORRUPT)
+        Returns:
+            The new `Gap`
+        Raises:
+            RecoveryError: All the reconnection attempts failed
+        """
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                self._restart()
+                break
+            except (IOError, OSError, ValueError, struct.error) as e:
+                if self.max_retries is not None and \
+                        attempts >= self.max_retries:
+                    self.running = False
+                    raise RecoveryError("Reconnection failed after %d "
+                                        "attempts: %s" % (attempts, e))
+                self.clock.sleep(self.retry_delay)
+
+        end = self.clock.time()
+        offsets = dict(self.ends)
+        for number, channel in self.experiment.channels.items():
+            lost = 0
+            if channel.period:
+                lost = int(round((end - self.last_data)/channel.period))
+            self.bases[number] = offsets.get(number, 0) + lost
+        self.ends = dict(self.bases)
+        gap = Gap(reason, self.last_data, end, offsets, dict(self.bases),
+                  attempts)
+        self.gaps.append(gap)
+        self.stopped = set()
+        self.errors = 0
+        self.last_data = end
+        if self.callback:
+            self.callback(gap)
+        return gap
+
+    def _restart(self):
+        daq = self.daq
+        daq.measuring = False
+        try:
+            daq.close()
+        except (IOError, OSError):
+            pass
+        daq.open()
+        self._stop_device()
+        if self.restore_cal:
+            self._restore_calibration()
+        # The device may have been reset: send the whole experiment
+        daq.experiment = None
+        daq.apply_experiment(self.experiment)
+        daq.start()
+
+    def _stop_device(self):
+        """Stop any running experiment, with a bounded number of tries
+        (unlike `DAQ.stop`)"""
+        error = None
+        for i in range(STOP_RETRIES):
+            try:
+                self.daq.send_command(STOP_CMD, '')
+                self.daq.flush()
+                return
+            except (ValueError, struct.error) as e:
+                error = e
+                self.daq.flush()
+        raise IOError("The device does not answer: %s" % error)
+
+    def _restore_calibration(self):
+        daq = self.daq
+        gains, offsets, dac_gain, dac_offset = self.calibration
+        if daq.get_cal() != (gains, offsets):
+            if daq.hw_ver == 'm':
+                daq.set_cal(gains[1:6], offsets[1:6], 'M')
+            else:
+                daq.set_cal(gains[1:9], offsets[1:9], 'SE')
+                daq.set_cal(gains[9:17], offsets[9:17], 'DE')
+        if daq.get_dac_cal() != (dac_gain, dac_offset):
+            daq.set_dac_cal(dac_gain, dac_offset)
+        daq.gains, daq.offsets = list(gains), list(offsets)
+        daq.dac_gain, daq.dac_offset = dac_gain, dac_offset
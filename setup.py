@@ -34,6 +34,7 @@ setup(
     package_dir={'opendaq': 'opendaq'},
     include_package_data=True,
     install_requires=['pyserial==2.7'],
+    extras_require={'numpy': ['numpy']},
     license='LGPL',
     zip_safe=False,
     test_suite='tests',
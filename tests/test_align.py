@@ -0,0 +1,102 @@
+import unittest
+from array import array
+import numpy as np
+from opendaq.align import Aligner, HOLD
+from opendaq.experiment import Experiment
+from opendaq.stream import StreamDecoder, StreamPacket, encode_packet
+
+
+def packets(number, values, size, start=0):
+    return [StreamPacket(number, 25, offset=start + i,
+                         values=array('h', values[i:i + size]))
+            for i in range(0, len(values), size)]
+
+
+class TestAligner(unittest.TestCase):
+    def setUp(self):
+        # Linear signals: 3*t on the 1 ms channel, 1000 - 2*t on the 4 ms
+        # one (t in ms)
+        self.ch1 = 3*np.arange(400)
+        self.ch2 = 1000 - 8*np.arange(100)
+
+    def test_linear(self):
+        aligner = Aligner({1: 1e-3, 2: 4e-3}, t0=10.0)
+        stream = packets(1, self.ch1, 20) + packets(2, self.ch2, 20)
+        # interleaved in order of arrival, fed in blocks of any size
+        stream.sort(key=lambda p: p.offset*(1 if p.number == 1 else 4))
+        times, frames = [], []
+        for i in range(0, len(stream), 3):
+            t, f = aligner.feed(stream[i:i + 3])
+            assert f.shape == (len(t), 2)
+            times.append(t)
+            frames.append(f)
+        times = np.concatenate(times)
+        frames = np.concatenate(frames)
+
+        # up to the last sample of the slowest channel (396 ms)
+        assert len(times) == 397
+        assert np.allclose(times, 10 + np.arange(397)*1e-3)
+        ms = np.arange(397)
+        assert np.allclose(frames[:, 0], 3*ms)
+        assert np.allclose(frames[:, 1], 1000 - 2*ms)
+        assert aligner.numbers == [1, 2]
+
+    def test_hold(self):
+        aligner = Aligner({1: 1e-3, 2: 4e-3}, method=HOLD, period=2e-3)
+        times, frames = aligner.feed(packets(2, self.ch2, 20) +
+                                     packets(1, self.ch1[:50], 20))
+        assert len(times) == 25
+        ms = 2*np.arange(25)
+        assert np.array_equal(frames[:, 0], 3*ms)
+        assert np.array_equal(frames[:, 1], 1000 - 8*(ms//4))
+        # nothing new until the fast channel advances
+        assert len(aligner.feed([])[0]) == 0
+        times, frames = aligner.feed(packets(1, self.ch1[50:60], 10, 50))
+        assert np.allclose(times, [0.05, 0.052, 0.054, 0.056, 0.058])
+
+    def test_gaps(self):
+        # offsets which skip samples, as rebased by a Watchdog
+        aligner = Aligner({1: 1e-3, 2: 1e-3})
+        stream = packets(1, self.ch1[:100], 20) + \
+            packets(2, self.ch1[:100], 20)
+        del stream[2]
+        stream[5].crc_ok = False
+        times, frames = aligner.feed(stream)
+        assert len(times) == 100
+        missing = np.isnan(frames[:, 0])
+        assert not missing[:40].any() and missing[40:60].all()
+        assert np.isnan(frames[:, 1]).sum() == 20
+        assert np.isnan(frames[20:40, 1]).all()
+
+    def test_decoded_stream(self):
+        aligner = Aligner({1: 1e-3})
+        stream = [encode_packet(1, self.ch1[i:i + 20])
+                  for i in range(0, 100, 20)]
+        # a packet is lost and another one corrupted
+        del stream[1]
+        stream[2] = stream[2][:-1] + chr(ord(stream[2][-1]) ^ 0x01)
+        packets = StreamDecoder().feed(''.join(stream))
+        assert [p.offset for p in packets] == [0, 20, 40, 60]
+        times, frames = aligner.feed(packets)
+        # the corrupted samples are NaN, the lost ones are not detected
+        assert len(times) == 80
+        missing = np.isnan(frames[:, 0])
+        assert missing[40:60].all() and missing.sum() == 20
+        assert np.array_equal(frames[20:40, 0], self.ch1[40:60])
+
+    def test_interleaved(self):
+        aligner = Aligner({1: 1e-3, 3: 2e-3})
+        data = [0, 10, 1, 2, 20, 3]
+        channel = [0, 2, 0, 0, 2, 0]
+        times, frames = aligner.feed_interleaved(data, channel)
+        assert np.allclose(frames, [[0, 10], [1, 15], [2, 20]])
+
+    def test_experiment(self):
+        exp = Experiment()
+        exp.add_stream(1, 10)
+        exp.add_external(2, 1)
+        self.assertRaises(ValueError, Aligner.from_experiment, exp)
+        aligner = Aligner.from_experiment(exp, {2: 0.05})
+        assert aligner.period == 0.01
+        assert aligner.timelines[2].period == 0.05
+        self.assertRaises(ValueError, Aligner, {1: 0})
@@ -0,0 +1,33 @@
+import json
+import os
+import tempfile
+import unittest
+from opendaq import bench
+
+
+class TestBench(unittest.TestCase):
+    def test_report(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            bench.main(['-n', '10', '-s', '1', '--profile', '--memory',
+                        '--top', '3', '-j', path])
+            with open(path) as f:
+                report = json.load(f)
+        finally:
+            os.remove(path)
+
+        assert 'numpy' in report and 'python' in report
+        results = dict((r['name'], r) for r in report['scenarios'])
+        assert sorted(results) == sorted(bench.SCENARIOS)
+        assert results['commands']['items'] == 20
+        # 2 channels, one sample per millisecond
+        assert results['decode']['items'] == 2000
+        assert results['record']['items'] == 2000
+        for r in results.values():
+            assert r['seconds'] >= 0
+            assert len(r['hotspots']) == 3
+            assert 'memory' in r
+
+    def test_unknown_scenario(self):
+        self.assertRaises(SystemExit, bench.main, ['nonsense'])
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from array import array
+import numpy as np
+from opendaq.buffer import SpillBuffer
+from opendaq.records import SAMPLE_DTYPE
+from opendaq.stream import StreamPacket
+
+
+class TestSpillBuffer(unittest.TestCase):
+    def test_order(self):
+        rng = np.random.RandomState(0)
+        buf = SpillBuffer(100)
+        out = []
+        total = 0
+        for i in range(300):
+            n = rng.randint(0, 300)
+            buf.put(np.arange(total, total + n) % 30000)
+            total += n
+            out.append(buf.get(rng.randint(0, 200)))
+            assert buf.count <= 100
+        out.append(buf.get(total))
+        assert np.array_equal(np.concatenate(out), np.arange(total) % 30000)
+        assert len(buf) == 0
+        buf.close()
+
+    def test_occupancy(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'spill')
+        try:
+            with SpillBuffer(10, path=path, rate=100) as buf:
+                buf.put(np.arange(25))
+                occ = buf.occupancy()
+                assert (occ['memory'], occ['spilled'], occ['pending']) == \
+                    (10, 15, 25)
+                assert occ['fill'] == 1.0
+                assert occ['lag'] == 0.25
+                assert os.path.getsize(path) == occ['spill_bytes'] > 0
+
+                # all the items in memory; the ring is refilled
+                assert list(buf.get()) == range(10)
+                assert buf.occupancy()['spilled'] == 5
+                assert list(buf.get(12)) == range(10, 22)
+                buf.put([25, 26])
+                assert list(buf.get()) == [22, 23, 24, 25, 26]
+                occ = buf.occupancy()
+                assert (occ['pending'], occ['max_pending']) == (0, 25)
+                assert (occ['total_in'], occ['total_out']) == (27, 27)
+                assert occ['total_spilled'] == 15
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_packets(self):
+        packets = [StreamPacket(1, 25, values=array('h', range(3))),
+                   StreamPacket(2, 25, values=array('h', [7, 8]),
+                                offset=5),
+                   StreamPacket(1, 25, values=array('h', [3]), offset=3)]
+        buf = SpillBuffer(4, dtype=SAMPLE_DTYPE)
+        buf.put(packets)
+        samples = buf.get(10)
+        assert list(samples['number']) == [1, 1, 1, 2, 2, 1]
+        assert list(samples['offset']) == [0, 1, 2, 5, 6, 3]
+        assert list(samples['value']) == [0, 1, 2, 7, 8, 3]
+
+        buf = SpillBuffer(4)
+        buf.put(packets)
+        assert list(buf.get(10)) == [0, 1, 2, 7, 8, 3]
+
+    def test_threads(self):
+        buf = SpillBuffer(1000)
+        n = 100000
+
+        def produce():
+            for i in range(0, n, 500):
+                buf.put(np.arange(i, i + 500) % 30000)
+        thread = threading.Thread(target=produce)
+        thread.start()
+        out = []
+        received = 0
+        while received < n:
+            values = buf.get(700, timeout=1)
+            assert len(values)
+            out.append(values)
+            received += len(values)
+        thread.join()
+        assert np.array_equal(np.concatenate(out), np.arange(n) % 30000)
+        assert len(buf.get(timeout=0.01)) == 0
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+from opendaq import DAQ
+from opendaq.calibration import fit_linear, raw_to_volts, volts_to_raw,\
+    adc_cal_from_fit, dac_cal_from_fit, Calibrator
+from opendaq.signals import Loopback
+
+
+class TestCalibration(unittest.TestCase):
+    def test_fit_linear(self):
+        x = np.array([np.arange(10.), np.arange(10.)*3 - 5])
+        y = x*np.array([[2.], [-0.5]]) + np.array([[1.], [7.]])
+        a, b = fit_linear(x, y)
+        assert np.allclose(a, [2, -0.5])
+        assert np.allclose(b, [1, 7])
+
+    def test_adc_cal(self):
+        raw = np.linspace(-20000, 20000, 15)
+        for hw_ver, gain, offset in (('m', 12345, -12), ('s', 3000, 40)):
+            volts = raw_to_volts(raw, gain, offset, hw_ver)
+            a, b = fit_linear(raw, volts*1000)
+            gains, offsets = adc_cal_from_fit(a, b, hw_ver)
+            assert gains == gain and offsets == offset
+
+    def test_dac_cal(self):
+        u = np.linspace(-3000, 3000, 10)
+        # The output is 2% low and 5 mV high
+        gain, offset = dac_cal_from_fit(*fit_linear(u, 0.98*u + 5))
+        assert gain == 1020 and offset == -5
+
+    def test_volts_to_raw(self):
+        daq = DAQ('sim')
+        volts = [0, 0.001, 2.5, 3.3]
+        raw = volts_to_raw(volts, daq.dac_gain, daq.dac_offset, daq.hw_ver)
+        assert list(raw) == [int(round(daq._DAQ__volts_to_raw(v)))
+                             for v in volts]
+        self.assertRaises(ValueError, volts_to_raw, [-1], daq.dac_gain,
+                          daq.dac_offset, daq.hw_ver)
+
+    def test_calibrator(self):
+        daq = DAQ('sim')
+        sim = daq.ser
+        for pinput in range(1, 9):
+            sim.set_signal(pinput, Loopback(sim))
+        # Uncalibrated ADC, measured against an accurate DAC
+        sim.adc_gains = [1250 + 10*i for i in range(17)]
+        sim.adc_offsets = [5*i - 20 for i in range(17)]
+        cal = Calibrator(daq, pinput=3)
+        differential = sim.calib_gains[9:17]
+        gains, offsets = cal.calibrate_adc(write=True)
+        assert list(gains) == sim.adc_gains[1:9]
+        assert sim.calib_gains[1:9] == sim.adc_gains[1:9]
+        # the differential entries are not calibrated
+        assert sim.calib_gains[9:17] == differential
+        assert daq.offsets[1:9] == sim.adc_offsets[1:9]
+
+        # Then the DAC, measured with the calibrated ADC
+        sim.dac_response = (1013, -7)
+        assert cal.calibrate_dac(write=True) == (1013, -7)
+        assert daq.get_dac_cal() == (1013, -7)
+
+        daq.conf_adc(3)
+        daq.set_analog(2.0)
+        assert abs(sim.dac_volts - 2.0) < 0.001
+        assert abs(daq.read_analog() - 2.0) < 0.001
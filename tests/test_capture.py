@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from opendaq import DAQ
+from opendaq.capture import ReplayTransport, read_capture, READ, WRITE
+from opendaq.common import mkcmd
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'link.cap')
+        daq = DAQ('sim', capture=self.path)
+        daq.set_led(1)
+        self.adc = daq.read_adc()
+        self.dev_id = daq.get_info()[2]
+        daq.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_records(self):
+        records = list(read_capture(self.path))
+        assert records[0][1:] == (WRITE, mkcmd(39, ''))
+        assert records[1][1] == READ
+        times = [t for t, _, _ in records]
+        assert times == sorted(times)
+
+    def test_reopen(self):
+        daq = DAQ('sim', capture=self.path)
+        daq.close()
+        assert daq.capture.closed
+        count = len(list(read_capture(self.path)))
+        # The capture continues after reopening the link
+        daq.open()
+        daq.set_led(2)
+        daq.close()
+        records = list(read_capture(self.path))
+        assert records[count][1:] == (WRITE, mkcmd(18, 'B', 2))
+        assert daq.capture.closed
+
+    def test_replay(self):
+        daq = DAQ('replay://' + self.path)
+        daq.set_led(1)
+        assert daq.read_adc() == self.adc
+        assert daq.get_info()[2] == self.dev_id
+        assert daq.ser.finished
+
+    def test_replay_strict(self):
+        daq = DAQ(ReplayTransport(self.path, strict=True))
+        self.assertRaises(IOError, daq.set_led, 2)
+
+    def test_replay_realtime(self):
+        records = list(read_capture(self.path))
+        link = ReplayTransport(self.path, realtime=True, timeout=1)
+        assert link.read(1, 0) == ''
+        link.write(records[0][2])
+        assert link.read(len(records[1][2])) == records[1][2]
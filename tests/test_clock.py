@@ -0,0 +1,42 @@
+import time
+import unittest
+from opendaq import DAQ
+from opendaq.clock import VirtualClock
+from opendaq.simulator import DAQSimulator
+
+
+class TestVirtualClock(unittest.TestCase):
+    def test_sleep(self):
+        clock = VirtualClock(10)
+        start = time.time()
+        clock.sleep(3600)
+        clock.sleep(-1)
+        assert clock.time() == 3610
+        assert time.time() - start < 0.1
+
+    def run_stream(self, seconds):
+        clock = VirtualClock()
+        daq = DAQ(DAQSimulator(seed=1), clock=clock)
+        assert daq.ser.clock is clock
+        daq.create_stream(1, 10)
+        daq.conf_channel(1, 0, 1)
+        daq.create_stream(2, 250)
+        daq.conf_channel(2, 0, 2)
+        daq.start()
+        t0 = clock.time()
+        values = {1: [], 2: []}
+        while clock.time() - t0 < seconds:
+            for p in daq.read_stream():
+                values[p.number].extend(p.values)
+        daq.stop()
+        daq.close()
+        return values, clock.time() - t0
+
+    def test_stream(self):
+        start = time.time()
+        values, elapsed = self.run_stream(60)
+        assert time.time() - start < 5
+        # exact sample timing: one sample per period
+        assert len(values[1]) == int(elapsed/0.01)
+        assert len(values[2]) == int(elapsed/0.25)
+        assert values == self.run_stream(60)[0]
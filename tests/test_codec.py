@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from opendaq.codec import BlockEncoder, BlockDecoder, BITPACK, ZLIB,\
+    pack_bits, unpack_bits, zigzag_encode, zigzag_decode
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        walk = np.cumsum(rng.randint(-20, 21, 5000))
+        self.values = np.clip(walk + 1000*np.sin(np.arange(5000)/300.),
+                              -32768, 32767).astype(np.int16)
+
+    def test_zigzag(self):
+        v = np.array([0, -1, 1, -2, 2, -32768, 32767])
+        assert list(zigzag_encode(v)) == [0, 1, 2, 3, 4, 65535, 65534]
+        assert list(zigzag_decode(zigzag_encode(v))) == list(v)
+
+    def test_bits(self):
+        v = np.array([0, 5, 7, 1, 3])
+        assert len(pack_bits(v, 3)) == 2
+        assert list(unpack_bits(pack_bits(v, 3), 3, 5)) == list(v)
+        assert list(unpack_bits('', 0, 3)) == [0, 0, 0]
+
+    def roundtrip(self, order, method, block, chunk):
+        enc = BlockEncoder(order, method)
+        data = ''.join(enc.encode(self.values[i:i + block])
+                       for i in range(0, len(self.values), block))
+        dec = BlockDecoder()
+        out = np.concatenate([dec.feed(data[i:i + chunk])
+                              for i in range(0, len(data), chunk)])
+        assert np.array_equal(out, self.values)
+        return len(data)
+
+    def test_roundtrip(self):
+        for order in (1, 2):
+            for method in (BITPACK, ZLIB):
+                for block, chunk in ((1000, 4096), (7, 1), (5000, 13)):
+                    self.roundtrip(order, method, block, chunk)
+
+    def test_ratio(self):
+        size = self.roundtrip(1, BITPACK, 1000, 4096)
+        assert size < self.values.nbytes/2
+
+    def test_extremes(self):
+        self.values = np.array([-32768, 32767]*50 + [0], np.int16)
+        self.roundtrip(2, BITPACK, 10, 3)
+
+    def test_bad_frame(self):
+        self.assertRaises(ValueError, BlockDecoder().feed, 'x'*20)
@@ -1,5 +1,6 @@
 import unittest
-from opendaq.common import crc, check_crc, CRCError, str2hex, mkcmd
+from opendaq.common import crc, check_crc, CRCError, str2hex, mkcmd, \
+    RTTEstimator
 
 
 class TestCommon(unittest.TestCase):
@@ -22,3 +23,20 @@ class TestCommon(unittest.TestCase):
         assert str2hex(mkcmd(160, '')) == '00 a0 a0 00'
         assert str2hex(mkcmd(18, 'b', 1)) == '00 14 12 01 01'
         assert str2hex(mkcmd(100, 'bH', 32, 1000)) == '01 72 64 03 20 03 e8'
+
+    def test_rtt_estimator(self):
+        est = RTTEstimator(initial=1.0, min_timeout=0.01, max_timeout=1.0)
+        assert est.timeout(1) == 1.0
+        est.update(1, 0.02)
+        assert abs(est.timeout(1) - 0.06) < 1e-9
+        for i in range(100):
+            est.update(1, 0.02)
+        # the deviation decays, down to the lower limit
+        assert est.timeout(1) == 0.02 + 4*est.estimates[1][1] >= 0.01
+        assert est.timeout(1) < 0.021
+        est.backoff(1)
+        est.backoff(1)
+        assert abs(est.timeout(1) - 4*(0.02 + 4*est.estimates[1][1])) < 1e-9
+        est.update(1, 5.0)
+        assert est.timeout(1) == 1.0
+        assert est.timeout(2) == 1.0
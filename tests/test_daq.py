@@ -1,5 +1,34 @@
+import time
 import unittest
 from opendaq import DAQ
+from opendaq.clock import VirtualClock
+from opendaq.experiment import Experiment
+from opendaq.simulator import DAQSimulator
+
+
+class SlowSimulator(DAQSimulator):
+    """Simulator whose responses arrive `delay` seconds late"""
+    def __init__(self, *args, **kwargs):
+        DAQSimulator.__init__(self, *args, **kwargs)
+        self.delay = 0
+        self.pending = []
+
+    def exec_command(self, data):
+        ret = DAQSimulator.exec_command(self, data)
+        if not self.delay and not self.pending:
+            return ret
+        # the responses arrive in order
+        self.pending.append((self.clock.time() + self.delay, ret))
+        return ''
+
+    def _recv(self, size, timeout):
+        if self.pending and timeout:
+            self.clock.sleep(min(timeout,
+                                 self.pending[0][0] - self.clock.time()))
+        data = ''
+        while self.pending and self.pending[0][0] <= self.clock.time():
+            data += self.pending.pop(0)[1]
+        return data + DAQSimulator._recv(self, size, 0 if data else timeout)
 
 
 class TestDAQ(unittest.TestCase):
@@ -39,3 +68,201 @@ class TestDAQ(unittest.TestCase):
             assert self.sim.pios_dir[pio] == 1
             self.daq.set_pio_dir(pio + 1, 0)
             assert self.sim.pios_dir[pio] == 0
+
+    def test_spi_transfer(self):
+        self.daq.spi_config(0, 1)
+        self.daq.spi_setup(1)
+        data = bytearray(range(40))
+        assert self.daq.spi_transfer(data) == str(data)
+        assert self.sim.spi_sent == range(40)
+        assert self.daq.spi_transfer('\x12\x34\xab\xcd', word=True) == \
+            '\x12\x34\xab\xcd'
+        assert self.sim.spi_sent[-2:] == [0x1234, 0xabcd]
+        self.assertRaises(ValueError, self.daq.spi_transfer, 'abc', True)
+
+    def test_read_block(self):
+        daq = DAQ(DAQSimulator(seed=3))
+        daq.conf_adc(2, gain=1)
+        values = [daq.read_adc() for i in range(40)]
+        volts = [daq.read_analog() for i in range(40)]
+        daq.close()
+
+        daq = DAQ(DAQSimulator(seed=3))
+        daq.conf_adc(2, gain=1)
+        block = daq.read_adc_block(40)
+        assert list(block) == values
+        assert list(daq.read_analog_block(40, batch_size=7)) == volts
+        assert len(daq.read_adc_block(0)) == 0
+        daq.close()
+
+    def test_command_timeouts(self):
+        # a NAK does not wait for the length of the expected response
+        start = time.time()
+        self.assertRaises(IOError, self.daq.send_command, '\x12\x01\x05',
+                          'B')
+        # the timeout of a known command adapts to its latency
+        self.daq.get_info()
+        self.sim.write = len
+        self.assertRaises(ValueError, self.daq.get_info)
+        assert time.time() - start < 0.5
+        assert self.daq.latency.timeout(39) <= 0.1
+
+    def test_late_response(self):
+        ref = DAQ(DAQSimulator(seed=3))
+        values = [ref.read_adc() for i in range(4)]
+        ref.close()
+
+        sim = SlowSimulator(seed=3)
+        daq = DAQ(sim, clock=VirtualClock())
+        assert daq.read_adc() == values[0]
+        assert daq.latency.timeout(1) < 0.1
+        # the response arrives after the timeout
+        sim.delay = 0.2
+        self.assertRaises(ValueError, daq.read_adc)
+        sim.delay = 0
+        # it is not taken as the response of the next command
+        assert daq.read_adc() == values[2]
+        assert daq.get_info()[2] == sim.dev_id
+        # a truncated response backs the timeout off too
+        timeout = daq.latency.timeout(1)
+        sim.write = lambda data: sim._rbuf.extend('\x00\x01\x01\x02')
+        self.assertRaises(ValueError, daq.read_adc)
+        assert daq.latency.timeout(1) == 2*timeout
+        del sim.write
+        assert daq.read_adc() == values[3]
+        daq.close()
+
+    def test_read_block_late(self):
+        ref = DAQ(DAQSimulator(seed=3))
+        values = [ref.read_adc() for i in range(5)]
+        ref.close()
+
+        sim = SlowSimulator(seed=3)
+        daq = DAQ(sim, clock=VirtualClock())
+        assert daq.read_adc() == values[0]
+        sim.delay = 0.2
+        self.assertRaises(ValueError, daq.read_adc)
+        sim.delay = 0
+        # the late response is not parsed as ADC data
+        assert list(daq.read_adc_block(2)) == values[2:4]
+        # a missing response of a block backs its timeout off
+        timeout = daq.latency.timeout(1)
+        sim.delay = 0.2
+        self.assertRaises(ValueError, daq.read_adc_block, 3)
+        assert daq.latency.timeout(1) > timeout
+        daq.close()
+
+    def test_send_batch_late(self):
+        sim = SlowSimulator()
+        daq = DAQ(sim, clock=VirtualClock())
+        cmds = [('\x12\x01\x01', 'B'), ('\x12\x01\x02', 'B')]
+        assert daq.send_batch(cmds) == [(1,), (2,)]
+        # the timeout of the commands of a batch adapts too
+        assert daq.latency.timeout(18) < 0.1
+        sim.delay = 0.2
+        self.assertRaises(ValueError, daq.send_batch, cmds)
+        sim.delay = 0
+        assert daq.get_info()[2] == sim.dev_id
+        daq.close()
+
+    def test_command_while_streaming(self):
+        daq = DAQ(DAQSimulator(), clock=VirtualClock())
+        exp = Experiment()
+        exp.add_stream(1, 1)
+        daq.apply_experiment(exp)
+        daq.start()
+        daq.clock.sleep(0.1)
+        # the stream packets received before the response are kept
+        daq.send_command('\x12\x01\x02', 'B', stop_stream=False)
+        assert daq.measuring and daq.ser.led_color == 2
+        daq.clock.sleep(0.1)
+        daq.stop_stream = False
+        assert daq.get_info()[2] == daq.ser.dev_id
+        # pipelined commands too
+        assert len(daq.read_adc_block(40)) == 40
+        assert daq.send_batch([('\x12\x01\x01', 'B')]*20) == [(1,)]*20
+        assert daq.measuring
+        daq.stop_stream = True
+        daq.clock.sleep(0.1)
+        daq.stop()
+        packets = daq.read_stream()
+        assert sum(len(p.values) for p in packets) == 300
+        assert daq.decoder.skipped == 0
+        daq.close()
+
+    def test_read_stream_idle(self):
+        start = time.time()
+        assert self.daq.read_stream() == []
+        assert time.time() - start < 0.1
+
+    def test_send_batch_nak(self):
+        cmds = [('\x12\x01\x01', 'B'), ('\x12\x01\x05', 'B'),
+                ('\x12\x01\x02', 'B')]
+        self.assertRaises(IOError, self.daq.send_batch, cmds)
+        # the link is still in sync after the NAK
+        assert self.sim.led_color == 2
+        assert self.daq.get_info()[2] == self.sim.dev_id
+
+    def test_port(self):
+        self.daq.set_port_dir(0b000111)
+        self.sim.pios[5] = 1
+        assert self.daq.set_port(0b101011) == 0b100011
+        assert self.sim.pios[:6] == [1, 1, 0, 0, 0, 1]
+
+    def test_peripherals(self):
+        self.daq.init_counter(1)
+        self.sim.counter = 7
+        assert self.daq.get_counter(1) == 7
+        assert self.daq.get_counter(0) == 0
+
+        self.daq.init_capture(1000)
+        self.sim.capture_input = (300, 700)
+        assert self.daq.get_capture(2) == (2, 1000)
+        self.daq.stop_capture()
+        self.assertRaises(IOError, self.daq.get_capture, 0)
+
+        self.daq.init_encoder(200)
+        self.sim.encoder_position = 210
+        assert self.daq.get_encoder() == (10,)
+        self.daq.stop_encoder()
+
+        self.daq.init_pwm(512, 1000)
+        assert (self.sim.pwm_duty, self.sim.pwm_period) == (512, 1000)
+        self.daq.stop_pwm()
+        assert self.sim.pwm_period == 0
+
+    def test_config(self):
+        self.daq.enable_crc(1)
+        assert self.sim.crc_enabled == 1
+        self.daq.set_id(123)
+        assert self.daq.get_info()[2] == 123
+        self.daq.set_cal([1300]*8, range(8), 'SE')
+        assert self.daq.get_cal()[0][1:9] == [1300]*8
+        assert self.daq.get_cal()[1][1:9] == range(8)
+        self.daq.load_signal([0.5, 1.0], 10)
+        assert self.sim.signal_buffer[10:12] == [
+            int(round(2*self.daq._DAQ__volts_to_raw(v))) for v in (0.5, 1.0)]
+        # Split into several commands
+        volts = [0.5 + i*0.01 for i in range(300)]
+        assert self.daq.load_signal(volts, 50) == (300, 50)
+        assert self.sim.signal_buffer[50:350] == [
+            int(round(2*self.daq._DAQ__volts_to_raw(v))) for v in volts]
+
+    def test_stream(self):
+        self.daq.create_stream(1, 1)
+        self.daq.setup_channel(1, 30, continuous=False)
+        self.daq.conf_channel(1, 0, 2)
+        self.daq.create_stream(2, 2)
+        self.daq.conf_channel(2, 2)
+        self.sim.pios[0] = 1
+        self.daq.start()
+        packets = []
+        while not any(p.is_stop for p in packets):
+            packets += self.daq.read_stream()
+        self.daq.stop()
+        ch1 = [v for p in packets if p.number == 1 for v in p.values]
+        ch2 = [v for p in packets if p.number == 2 for v in p.values]
+        assert len(ch1) == 30
+        assert len(ch2) >= 14 and set(ch2) == set([1])
+        assert not self.sim.streaming
+        assert self.daq.decoder.crc_errors == 0
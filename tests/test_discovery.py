@@ -0,0 +1,139 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from opendaq import DAQ
+from opendaq import discovery
+from opendaq.__main__ import main
+from opendaq.daq import TIMEOUT
+from opendaq.discovery import (DeviceCache, DeviceInfo, discover,
+                               find_device, probe)
+from opendaq.simulator import DAQSimulator
+from StringIO import StringIO
+
+
+class SlowSimulator(DAQSimulator):
+    """Simulator which needs some time to boot after the port is opened"""
+    reset_delay = 0.3
+
+    def __init__(self, dev_id):
+        DAQSimulator.__init__(self)
+        self.dev_id = dev_id
+        self.opened = 0
+
+    def _open(self):
+        DAQSimulator._open(self)
+        self.opened += 1
+
+
+class SilentSimulator(DAQSimulator):
+    """Device which is not an openDAQ"""
+    def _send(self, data):
+        pass
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.devices = {
+            '/dev/ttyUSB0': SlowSimulator(10),
+            '/dev/ttyUSB1': SlowSimulator(11),
+            '/dev/ttyUSB2': SilentSimulator(),
+            '/dev/ttyACM0': SlowSimulator(12),
+        }
+        self.ports = sorted(self.devices) + ['/dev/ttyUSB3']
+        self.open_transport = discovery.open_transport
+        discovery.open_transport = self.fake_open
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmpdir, 'cache', 'devices.json')
+
+    def tearDown(self):
+        discovery.open_transport = self.open_transport
+        shutil.rmtree(self.tmpdir)
+
+    def fake_open(self, port, baudrate, timeout=None):
+        if port not in self.devices:
+            raise OSError("No such file or directory: %s" % port)
+        return self.open_transport(self.devices[port], baudrate, timeout)
+
+    def test_probe(self):
+        info = probe('/dev/ttyUSB1')
+        self.assertEqual(info, DeviceInfo('/dev/ttyUSB1', 's', 56, 11))
+        self.assertFalse(self.devices['/dev/ttyUSB1'].port_open)
+        self.assertIsNone(probe('/dev/ttyUSB2', timeout=0.05))
+        self.assertIsNone(probe('/dev/ttyUSB3'))
+
+    def test_discover_parallel(self):
+        start = time.time()
+        found = discover(self.ports, timeout=0.1)
+        elapsed = time.time() - start
+        self.assertEqual([(i.port, i.dev_id) for i in found],
+                         [('/dev/ttyACM0', 12), ('/dev/ttyUSB0', 10),
+                          ('/dev/ttyUSB1', 11)])
+        # All the reset delays are waited at the same time
+        self.assertLess(elapsed, 0.8)
+
+    def test_cache(self):
+        cache = DeviceCache(self.cache_path)
+        discover(self.ports, timeout=0.1, cache=cache)
+        cache = DeviceCache(self.cache_path)
+        self.assertEqual(cache.find(11).port, '/dev/ttyUSB1')
+        self.assertEqual(cache.get('/dev/ttyACM0').dev_id, 12)
+        self.assertIsNone(cache.get('/dev/ttyUSB2'))
+        self.assertIsNone(cache.find(99))
+
+        # Only the cached port is probed
+        info = find_device(10, self.ports, cache=cache)
+        self.assertEqual(info.port, '/dev/ttyUSB0')
+        self.assertEqual(self.devices['/dev/ttyUSB1'].opened, 1)
+
+        # The devices were swapped
+        self.devices['/dev/ttyUSB0'], self.devices['/dev/ttyUSB1'] = \
+            self.devices['/dev/ttyUSB1'], self.devices['/dev/ttyUSB0']
+        info = find_device(10, self.ports, timeout=0.1, cache=cache)
+        self.assertEqual(info.port, '/dev/ttyUSB1')
+        self.assertEqual(DeviceCache(self.cache_path).find(11).port,
+                         '/dev/ttyUSB0')
+
+        self.assertRaises(IOError, find_device, 99, self.ports,
+                          timeout=0.1, cache=cache)
+
+    def test_invalid_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, 'w') as f:
+            f.write('{"devices": [{"port": 3}]')
+        self.assertEqual(DeviceCache(self.cache_path).devices, {})
+
+    def test_from_id(self):
+        cache = DeviceCache(None)
+        discover(self.ports, timeout=0.1, cache=cache)
+        start = time.time()
+        daq = DAQ.from_id(12, self.ports, cache=cache)
+        elapsed = time.time() - start
+        self.assertEqual(daq.get_info()[2], 12)
+        self.assertEqual(daq.hw_ver, 's')
+        # The device reset delay was only waited once
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual(daq.ser.reset_delay, 0.3)
+        self.assertEqual(daq.ser.timeout, TIMEOUT)
+        self.assertEqual(cache.find(12).port, '/dev/ttyACM0')
+        daq.close()
+        cache.devices.clear()
+        self.assertRaises(IOError, DAQ.from_id, 99, self.ports, cache=cache)
+
+    def test_command(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            main(['discover', '/dev/ttyUSB1', '/dev/ttyUSB3', '-t', '0.1',
+                  '--cache', self.cache_path])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn('/dev/ttyUSB1', output)
+        self.assertNotIn('/dev/ttyUSB3', output)
+        self.assertEqual(DeviceCache(self.cache_path).find(11).port,
+                         '/dev/ttyUSB1')
+        self.assertRaises(SystemExit, main, ['discover', '/dev/ttyUSB3',
+                                             '--no-cache'])
@@ -0,0 +1,59 @@
+import unittest
+from opendaq import DAQ
+from opendaq.experiment import Experiment
+
+
+class TestExperiment(unittest.TestCase):
+    def setUp(self):
+        self.daq = DAQ('sim')
+        self.sim = self.daq.ser
+        self.exp = Experiment()
+        self.exp.add_stream(1, period=100, pinput=8, gain=1, npoints=10)
+        self.exp.add_external(2, edge=1, mode='COUNTER_INPUT')
+
+    def tearDown(self):
+        self.daq.close()
+
+    def test_apply(self):
+        self.daq.apply_experiment(self.exp)
+        assert self.sim.channels[1]['trigger'] == 100
+        assert self.sim.channels[1]['npoints'] == 10
+        assert self.sim.channels[2]['mode'] == 4
+        assert self.daq.experiment == self.exp
+
+    def test_diff(self):
+        self.daq.apply_experiment(self.exp)
+        new = self.exp.copy()
+        new.channels[1].gain = 2
+        new.remove(2)
+        new.add_stream(3, period=50)
+        assert new.diff(self.daq.experiment) == ([1, 3], [2])
+
+        cmds = new.commands(self.daq.hw_ver, self.daq.experiment)
+        # destroy 1 and 2, then 3 commands for each changed channel
+        assert len(cmds) == 2 + 3*2
+
+        self.daq.apply_experiment(new)
+        assert sorted(self.sim.channels) == [1, 3]
+        assert self.sim.channels[1]['gain'] == 2
+        assert self.daq.apply_experiment(new) is None
+        assert new.commands(self.daq.hw_ver, self.daq.experiment) == []
+
+    def test_invalidate(self):
+        self.daq.apply_experiment(self.exp)
+        self.daq.setup_channel(1, 20)
+        assert self.daq.experiment is None
+
+    def test_validate(self):
+        exp = Experiment()
+        exp.add_stream(5, period=100)
+        self.assertRaises(ValueError, self.daq.apply_experiment, exp)
+        exp = Experiment()
+        exp.add_stream(1, period=100, gain=8)
+        self.assertRaises(ValueError, exp.validate, 's')
+        exp = Experiment()
+        exp.add_burst(period=50)
+        self.assertRaises(ValueError, exp.validate, 'm')
+        exp = Experiment()
+        exp.add_stream(1, period=100, mode='FOO')
+        self.assertRaises(ValueError, exp.validate, 'm')
@@ -0,0 +1,152 @@
+import unittest
+import numpy as np
+from opendaq import DAQ
+from opendaq.clock import VirtualClock
+from opendaq.experiment import Experiment
+from opendaq.output import OutputStream, MAX_LOAD
+from opendaq.simulator import DAQSimulator
+from opendaq.stream import encode_packet
+
+
+def waveform(n):
+    """Volts of a slow sine, in steps of one millivolt"""
+    return np.round(2 + np.sin(np.arange(n)*2*np.pi/1000), 3)
+
+
+class TestOutputStream(unittest.TestCase):
+    def setUp(self):
+        self.sim = DAQSimulator()
+        self.daq = DAQ(self.sim, clock=VirtualClock())
+        self.loads = []
+        exec_command = self.sim.exec_command
+
+        def count_loads(packet):
+            if ord(packet[2]) == 23:
+                self.loads.append((ord(packet[3]) - 2)//2)
+            return exec_command(packet)
+        self.sim.exec_command = count_loads
+
+    def output(self, stream):
+        """Update the simulated DAC and return its output"""
+        stream.read_stream()
+        return self.sim.dac_volts
+
+    def follow(self, stream, expected, seconds, step=0.05):
+        """Refill for a while, checking the output after every step"""
+        end = self.daq.clock.time() + seconds
+        while self.daq.clock.time() < end:
+            self.daq.clock.sleep(step)
+            stream.refill()
+            played = stream.played
+            if played:
+                self.assertAlmostEqual(self.output(stream),
+                                       expected[played - 1], places=6)
+
+    def test_long_waveform(self):
+        values = waveform(5000)
+        stream = OutputStream(self.daq, values, period=1)
+        stream.start()
+        self.follow(stream, values, 4.5)
+        self.assertEqual(stream.underruns, [])
+        self.assertGreater(stream.lead, 0)
+        self.assertTrue(max(self.loads) <= MAX_LOAD)
+
+    def test_generator(self):
+        def gen():
+            i = 0
+            while True:
+                yield round(2 + np.sin(i*2*np.pi/1000), 3)
+                i += 1
+        stream = OutputStream(self.daq, gen(), period=2)
+        stream.start()
+        self.follow(stream, waveform(2000), 3.5)
+        self.assertEqual(stream.underruns, [])
+        self.assertFalse(stream.exhausted)
+
+    def test_run(self):
+        values = waveform(3000)
+        stream = OutputStream(self.daq, values, period=1)
+        stats = stream.run()
+        self.assertTrue(stream.finished)
+        self.assertEqual(stats['total'], 3000)
+        self.assertEqual(stats['underruns'], 0)
+        self.assertGreaterEqual(stats['played'], 3000)
+        self.assertAlmostEqual(self.output(stream), values[-1], places=6)
+        # The output holds the last value
+        self.daq.clock.sleep(1)
+        self.assertAlmostEqual(self.output(stream), values[-1], places=6)
+        stream.stop()
+
+    def test_run_duration(self):
+        stream = OutputStream(self.daq, waveform(10000), period=1)
+        stats = stream.run(duration=2)
+        self.assertFalse(stream.finished)
+        self.assertGreaterEqual(stats['played'], 2000)
+        self.assertLess(stats['played'], 2100)
+
+    def test_underrun(self):
+        values = waveform(5000)
+        stream = OutputStream(self.daq, values, period=1)
+        stream.start()
+        self.follow(stream, values, 0.5)
+        # Refill too late: the last values played were stale
+        self.daq.clock.sleep(0.6)
+        played = stream.played
+        stream.refill()
+        self.assertEqual(len(stream.underruns), 1)
+        first, late = stream.underruns[0]
+        self.assertEqual(first + late, played)
+        # The rest of the waveform keeps its timing
+        self.follow(stream, values, 1)
+        self.assertEqual(len(stream.underruns), 1)
+        self.assertEqual(stream.stats()['late'], late)
+
+    def test_with_inputs(self):
+        exp = Experiment()
+        exp.add_stream(1, 1)
+        self.daq.apply_experiment(exp)
+        stream = OutputStream(self.daq, waveform(3000), period=1)
+        stream.start()
+        offset = 0
+        while self.daq.clock.time() < 2:
+            self.daq.clock.sleep(0.1)
+            stream.refill()
+            for p in stream.read_stream():
+                self.assertEqual(p.number, 1)
+                self.assertEqual(p.offset, offset)
+                offset += len(p.values)
+        self.assertGreaterEqual(offset, 1900)
+        self.assertTrue(self.daq.measuring)
+        # The stream data sent before every load response was kept
+        self.assertEqual(offset, self.sim.channels[1]['sent'])
+        self.assertEqual(self.daq.decoder.skipped, 0)
+
+    def test_stream_before_response(self):
+        # Stream packets sent while a load command is processed
+        exp = Experiment()
+        exp.add_stream(1, 1)
+        self.daq.apply_experiment(exp)
+        exec_command = self.sim.exec_command
+
+        def late_packet(packet):
+            ret = exec_command(packet)
+            if ord(packet[2]) == 23 and self.sim.streaming:
+                ret = encode_packet(2, [7]*3) + ret
+            return ret
+        self.sim.exec_command = late_packet
+        stream = OutputStream(self.daq, waveform(3000), period=1)
+        stream.start()
+        extra = 0
+        for i in range(10):
+            self.daq.clock.sleep(0.1)
+            stream.refill()
+            extra += sum(p.number == 2 for p in stream.read_stream())
+        self.assertEqual(extra, len(self.loads) - 4)
+        self.assertGreater(extra, 0)
+        self.assertTrue(self.daq.measuring)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, OutputStream, self.daq, [1], 1,
+                          size=401)
+        self.assertRaises(ValueError, OutputStream(self.daq, [], 1).start)
+        self.assertRaises(ValueError, OutputStream(self.daq, [5.0], 1).start)
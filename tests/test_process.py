@@ -0,0 +1,150 @@
+import time
+import unittest
+import numpy as np
+from opendaq.process import DAQProcess, WRITTEN
+from opendaq.signals import Ramp
+from opendaq.simulator import DAQSimulator
+from opendaq.stream import encode_packet
+
+
+class SlowSimulator(DAQSimulator):
+    """Simulator which takes 0.5 s to set the LED to orange"""
+    def exec_command(self, data):
+        if data[2:5] == '\x12\x01\x03':
+            time.sleep(0.5)
+        return DAQSimulator.exec_command(self, data)
+
+
+class CorruptSimulator(DAQSimulator):
+    """Simulator which sends a stream packet with a bad checksum first"""
+    corrupted = False
+
+    def _stream_data(self):
+        data = DAQSimulator._stream_data(self)
+        if data and not self.corrupted:
+            self.corrupted = True
+            packet = encode_packet(1, [5])
+            data = packet[:2] + chr(ord(packet[2]) ^ 1) + packet[3:] + data
+        return data
+
+
+class LateEvent(object):
+    """Event whose flag is not set when samples are written during a
+    wait, as in a race with the child"""
+    def __init__(self, counters):
+        self.counters = counters
+
+    def clear(self):
+        pass
+
+    def wait(self, timeout=None):
+        # Python 2.6 returns None
+        self.counters[WRITTEN] += 10
+
+    def is_set(self):
+        return False
+
+
+class TestDAQProcess(unittest.TestCase):
+    def setUp(self):
+        sim = DAQSimulator()
+        sim.set_signal(1, Ramp(1.0, 5, offset=1))
+        self.proc = DAQProcess(sim, capacity=1000, timeout=5)
+
+    def tearDown(self):
+        self.proc.close()
+        assert self.proc.process.exitcode == 0
+
+    def start(self):
+        self.proc.create_stream(1, 1)
+        self.proc.conf_channel(1, 0, 1)
+        self.proc.create_stream(2, 2)
+        self.proc.conf_channel(2, 0, 2)
+        self.proc.start()
+
+    def test_commands(self):
+        proc = self.proc
+        assert proc.hw_ver == 's'
+        assert proc.get_info()[2] == DAQSimulator().dev_id
+        self.assertRaises(ValueError, proc.set_led, 7)
+        assert proc.set_led(2) is None
+        self.assertRaises(AttributeError, proc.call, 'nonsense')
+
+    def test_stream(self):
+        self.start()
+        blocks = []
+        start = time.time()
+        while time.time() - start < 0.5:
+            block = self.proc.acquire(timeout=1)
+            assert block is not None
+            # zero-copy views of the shared ring
+            assert np.may_share_memory(block.values, self.proc.values)
+            blocks.append((block.start, block.channel(1).copy(),
+                           block.channel(2).copy()))
+            self.proc.release(block)
+            # commands do not stop the acquisition
+            self.proc.set_led(len(blocks) % 3)
+        assert self.proc.measuring
+        self.proc.stop()
+        assert self.proc.dropped == 0
+
+        starts = [b[0] for b in blocks]
+        assert starts == sorted(starts)
+        ch1 = np.concatenate([b[1] for b in blocks])
+        ch2 = np.concatenate([b[2] for b in blocks])
+        assert 0.4 < len(ch2)/float(len(ch1)) < 0.6
+        # the ramp rises by 2 V per 200 samples
+        steps = np.diff(ch1.astype(int))
+        assert np.median(steps) > 0
+
+    def test_overrun(self):
+        self.start()
+        time.sleep(1)
+        self.proc.stop()
+        assert self.proc.dropped > 0
+        # the packets which did not fit were dropped whole
+        pending = self.proc.pending
+        assert 980 < pending <= 1000
+        block = self.proc.acquire(timeout=0, max_samples=300)
+        assert (block.start, len(block.values)) == (0, 300)
+        self.proc.release(block)
+        block = self.proc.acquire(timeout=0)
+        assert (block.start, len(block.values)) == (300, pending - 300)
+        assert self.proc.acquire(timeout=0.01) is None
+
+    def test_late_result(self):
+        proc = DAQProcess(SlowSimulator(), timeout=0.2)
+        try:
+            self.assertRaises(IOError, proc.set_led, 3)
+            # the late result is not taken as the one of the next call
+            proc.timeout = 5
+            assert proc.get_info()[2] == DAQSimulator().dev_id
+            assert proc.set_led(1) is None
+        finally:
+            proc.close()
+
+    def test_crc_errors(self):
+        proc = DAQProcess(CorruptSimulator(), timeout=5)
+        try:
+            proc.create_stream(1, 1)
+            proc.conf_channel(1, 0, 1)
+            proc.start()
+            assert proc.acquire(timeout=1) is not None
+            proc.stop()
+            assert proc.crc_errors == 1
+        finally:
+            proc.close()
+
+    def test_acquire_race(self):
+        self.start()
+        time.sleep(0.1)
+        self.proc.stop()
+        while self.proc.acquire(timeout=0) is not None:
+            pass
+        self.proc._ready = LateEvent(self.proc._counters)
+        # the samples written while waiting are returned
+        block = self.proc.acquire(timeout=0)
+        assert block is not None and len(block.values) == 10
+
+    def test_open_error(self):
+        self.assertRaises(Exception, DAQProcess, 'socket://127.0.0.1:1')
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from opendaq import DAQ
+from opendaq.__main__ import main
+from opendaq.clock import VirtualClock
+from opendaq.codec import ZLIB
+from opendaq.experiment import Experiment, STREAM
+from opendaq.recorder import (RecordReader, Recorder, load_experiment,
+                              parse_stream, DATA, END, STOP)
+from opendaq.signals import Ramp, Sine
+from opendaq.simulator import DAQSimulator
+
+
+def make_experiment(npoints=0):
+    exp = Experiment()
+    exp.add_stream(1, 1, npoints=npoints, continuous=not npoints)
+    exp.add_stream(2, 5, pinput=3, npoints=npoints // 5,
+                   continuous=not npoints)
+    return exp
+
+
+def make_daq():
+    sim = DAQSimulator()
+    sim.set_signal(1, Sine(1.0, 10))
+    sim.set_signal(3, Ramp(2.0, 3))
+    return DAQ(sim, clock=VirtualClock())
+
+
+def direct_stream(exp):
+    """Samples of every DataChannel read without the recorder"""
+    daq = make_daq()
+    daq.apply_experiment(exp)
+    daq.start()
+    values = {1: [], 2: []}
+    stopped = set()
+    while stopped != set(values):
+        for p in daq.read_stream():
+            if p.is_stop:
+                stopped.add(p.number)
+            values[p.number].extend(p.values)
+    daq.stop()
+    daq.close()
+    return values
+
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test.odr')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def record(self, exp, duration=None, **kwargs):
+        daq = make_daq()
+        recorder = Recorder(daq, self.path, exp, **kwargs)
+        stats = recorder.run(duration)
+        daq.close()
+        return stats
+
+    def test_record(self):
+        exp = make_experiment(npoints=500)
+        stats = self.record(exp, method=ZLIB)
+        assert stats['samples'] == 600
+        assert stats['dropped'] == stats['crc_errors'] == 0
+        assert stats['bytes'] == os.path.getsize(self.path)
+
+        expected = direct_stream(exp)
+        with RecordReader(self.path) as reader:
+            data = reader.read()
+            assert reader.summary['samples'] == 600
+            assert reader.metadata['channels'][1]['pinput'] == 3
+        for number in (1, 2):
+            offsets, values = data[number]
+            assert np.all(offsets == np.arange(len(values)))
+            assert np.all(values == expected[number])
+
+        with RecordReader(self.path) as reader:
+            kinds = [c[:2] for c in reader.chunks() if c[0] != DATA]
+        assert sorted(kinds) == [(STOP, 1), (STOP, 2), (END, 0)]
+
+    def test_stop(self):
+        daq = make_daq()
+        recorder = Recorder(daq, self.path, make_experiment())
+        recorder.start()
+        daq.clock.sleep(0.2)
+        assert recorder.write_pending(timeout=1)
+        recorder.request_stop()
+        recorder._reader.join()
+        # samples due when the device is stopped
+        daq.clock.sleep(0.11)
+        recorder.stop()
+        # the packets read with the stop response are written too
+        assert recorder.nsamples == daq.decoder.nsamples > 0
+        with RecordReader(self.path) as reader:
+            data = reader.read()
+        assert sum(len(data[n][1]) for n in data) == daq.decoder.nsamples
+        daq.close()
+
+    def test_truncated(self):
+        stats = self.record(make_experiment(), duration=2)
+        with open(self.path, 'rb+') as f:
+            f.truncate(os.path.getsize(self.path) - 100)
+        with RecordReader(self.path) as reader:
+            offsets, values = reader.read()[1]
+            assert reader.summary is None
+        assert 1000 < len(values) < stats['samples']
+        assert np.all(offsets == np.arange(len(values)))
+
+    def test_config(self):
+        ch = parse_stream('2:10:3:1')
+        assert (ch.number, ch.kind, ch.trigger, ch.pinput, ch.gain) == \
+            (2, STREAM, 10, 3, 1)
+        self.assertRaises(ValueError, parse_stream, '2')
+        exp = load_experiment({'channels': [
+            {'number': 1, 'kind': 'stream', 'trigger': 10},
+            {'number': 2, 'kind': 'external', 'trigger': 1,
+             'mode': 'COUNTER_INPUT'}]})
+        assert sorted(exp.channels) == [1, 2]
+        assert exp.channels[2].mode == 4
+
+    def test_cli(self):
+        main(['record', 'sim', self.path, '-s', '1:1', '-d', '0.3',
+              '--quiet'])
+        with RecordReader(self.path) as reader:
+            assert reader.read()[1][1].size > 0
+            assert reader.summary is not None
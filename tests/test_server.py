@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from opendaq import DAQ
+from opendaq.experiment import Experiment
+from opendaq.stream import encode_packet, encode_stop
+from opendaq.server import DAQServer, DAQClient, Subscriber, parse_address
+
+
+class TestServer(unittest.TestCase):
+    address = ('127.0.0.1', 0)
+
+    def setUp(self):
+        self.daq = DAQ('sim')
+        self.server = DAQServer(self.daq, self.address)
+        self.server.start()
+        self.client = DAQClient(self.server.address, timeout=1)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.daq.close()
+
+    def test_command(self):
+        hw_ver, fw_ver, dev_id = self.client.command('get_info')
+        assert dev_id == self.daq.ser.dev_id
+        self.client.command('set_led', 3)
+        assert self.daq.ser.led_color == 3
+
+    def test_command_results(self):
+        # arrays and binary strings
+        assert len(self.client.command('read_adc_block', 5)) == 5
+        self.client.command('spi_config', 0, 1)
+        self.client.command('spi_setup', 1)
+        data = ''.join(chr(i) for i in range(256))
+        assert self.client.command('spi_transfer', data) == data
+        # a result which can not be encoded gets an error reply
+        self.daq.unencodable = lambda: object()
+        self.assertRaises(IOError, self.client.command, 'unencodable')
+        assert self.client.command('get_info')[2] == self.daq.ser.dev_id
+
+    def test_late_reply(self):
+        self.daq.slow = lambda: time.sleep(0.3) or 'slow'
+        self.client.timeout = 0.1
+        self.assertRaises(IOError, self.client.command, 'slow')
+        self.client.timeout = 1
+        # the late reply is not taken as the one of the next command
+        assert self.client.command('get_info')[2] == self.daq.ser.dev_id
+        assert self.client.command('set_led', 1) is None
+
+    def test_command_error(self):
+        self.assertRaises(ValueError, self.client.command, 'set_led', 4)
+        self.assertRaises(ValueError, self.client.command, 'close')
+        self.assertRaises(ValueError, self.client.command, '_DAQ__foo')
+
+    def test_command_while_streaming(self):
+        exp = Experiment()
+        exp.add_stream(1, 1)
+        with self.server.lock:
+            self.daq.apply_experiment(exp)
+            self.daq.start()
+        for i in range(10):
+            self.client.command('set_led', i % 3)
+            assert self.client.command('get_info')[2] == self.daq.ser.dev_id
+            assert len(self.client.command('read_adc_block', 10)) == 10
+        # the commands do not stop the shared experiment
+        assert self.daq.measuring
+        self.client.command('stop')
+        nsamples = 0
+        while True:
+            msg = self.client.get_block(timeout=0.2)
+            if msg is None:
+                break
+            assert set(msg['channel']) == set([0])
+            nsamples += len(msg['data'])
+        assert nsamples == self.daq.ser.channels[1]['sent'] > 0
+
+    def test_stream_errors(self):
+        read_stream = self.daq.read_stream
+        failures = [IOError("Link error")]
+
+        def failing(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return read_stream(*args, **kwargs)
+
+        self.client.command('get_info')     # make sure it is subscribed
+        bad = encode_packet(1, [5]*10)
+        bad = bad[:-1] + chr(ord(bad[-1]) ^ 1)
+        with self.server.lock:
+            # no DataChannels are configured: the packets are injected
+            self.daq.start()
+            self.daq.read_stream = failing
+            self.daq.ser._rbuf.extend(bad + encode_packet(2, range(10)) +
+                                      encode_stop(2))
+        # the acquisition survives the error and drops the bad packet
+        msg = self.client.get_block(timeout=1)
+        assert msg['data'] == range(10) and msg['channel'] == [1]*10
+        assert self.client.get_block(timeout=1) == {'type': 'stop',
+                                                    'channel': 1}
+        assert self.server.crc_errors == 1 and not failures
+        self.client.command('stop')
+
+    def test_publish(self):
+        other = DAQClient(self.server.address, timeout=1)
+        other.command('get_info')   # make sure both clients are subscribed
+        self.client.command('get_info')
+        self.server.publish({'type': 'stream', 'data': [1, 2],
+                             'channel': [0, 0]})
+        for client in (self.client, other):
+            msg = client.get_block(timeout=1)
+            assert msg['data'] == [1, 2]
+        other.close()
+
+
+class TestUnixServer(TestServer):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmpdir, 'opendaq.sock')
+        TestServer.setUp(self)
+
+    def tearDown(self):
+        TestServer.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+
+class TestSubscriber(unittest.TestCase):
+    def test_drop_oldest(self):
+        sub = Subscriber(queue_size=2)
+        sub.push('reply', droppable=False)
+        for i in range(4):
+            sub.push(str(i))
+        assert sub.dropped == 2
+        assert [sub.pop() for i in range(3)] == ['reply', '2', '3']
+        sub.close()
+        assert sub.pop() is None
+
+    def test_parse_address(self):
+        assert parse_address('localhost:5050') == ('localhost', 5050)
+        assert parse_address(':5050') == ('localhost', 5050)
+        assert parse_address('/tmp/opendaq.sock') == '/tmp/opendaq.sock'
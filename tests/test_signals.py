@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from opendaq import DAQ
+from opendaq.calibration import raw_to_volts
+from opendaq.signals import Constant, Sine, Square, Ramp, Noise, Replay, \
+    adc_codes
+from opendaq.simulator import DAQSimulator
+
+
+class TestSignals(unittest.TestCase):
+    def test_models(self):
+        t = np.arange(8)/8.
+        assert np.allclose(Sine(2, 1).generate(t)[:3], [0, 2**.5, 2])
+        assert list(Square(1, 2, offset=1).generate(t)) == [2, 2, 0, 0]*2
+        assert list(Ramp(1, 1).generate(t[::2])) == [-1, -.5, 0, .5]
+        replay = Replay([1, 2, 3], fs=8, loop=False)
+        assert list(replay.samples(1, 4, 1/8.)) == [2, 3, 3, 3]
+
+        noise = Noise(0.5, seed=3) + Constant(1)
+        a = noise.samples(0, 1000, 1)
+        noise.reset()
+        assert np.array_equal(a, noise.samples(0, 1000, 1))
+        assert abs(a.mean() - 1) < 0.1 and abs(a.std() - 0.5) < 0.05
+
+    def test_adc_codes(self):
+        volts = np.linspace(-1, 1, 11)
+        for hw_ver, gain, offset in (('m', 12345, -12), ('s', 1250, 40)):
+            raw = adc_codes(volts, gain, offset, hw_ver)
+            back = raw_to_volts(raw, gain, offset, hw_ver)
+            assert np.allclose(back, volts, atol=1e-3)
+        # saturation of the input range with the PGA gain
+        raw = adc_codes([1, 5], 1250, 0, 's', pga=2)
+        assert list(raw) == [8000, 16384]
+
+
+class TestSimulatorSignals(unittest.TestCase):
+    def test_read_analog(self):
+        daq = DAQ('sim')
+        daq.conf_adc(2)
+        daq.ser.set_signal(2, Ramp(1, 250, offset=1))
+        values = [daq.read_analog() for i in range(4)]
+        assert np.allclose(values, [0, 0.5, 1, 1.5], atol=1e-3)
+
+        # the ADC response is used to build the raw values
+        daq.ser.adc_gains[2] *= 2
+        values = [daq.read_analog() for i in range(2)]
+        assert np.allclose(values, [0, 0.25], atol=1e-3)
+
+    def test_seed(self):
+        a = DAQSimulator(seed=5)
+        b = DAQSimulator(seed=5)
+        assert a.generate(100) == b.generate(100)
+        a.set_signal(1, Sine(1, 10) + Noise(0.1, seed=2))
+        block = a.generate(10000, period=1e-4, pinput=1)
+        a.seed(5)
+        assert np.array_equal(block, a.generate(10000, 1e-4, pinput=1))
@@ -39,3 +39,37 @@ class TestSimulator(unittest.TestCase):
     def test_set_dac_error(self):
         # invalid DAC value
         self.cmd_fail(13, 'h', 5000)
+
+    def test_pipelined_commands(self):
+        cmds = mkcmd(18, 'B', 1) + mkcmd(18, 'B', 4) + mkcmd(13, 'h', 100)
+        self.daq.write(cmds[:3])
+        self.daq.write(cmds[3:])
+        assert self.daq.read(len(cmds)) == (mkcmd(18, 'B', 1) + NAK +
+                                            mkcmd(13, 'h', 100))
+
+    def test_variable_length(self):
+        # load_signal: an offset followed by any number of values
+        values = range(1000, 1100)
+        self.cmd_echo_ret(23, 'h100H', (0, ) + tuple(values), 'Bh', 100, 0)
+        self.cmd_echo_ret(23, 'h2H', (100, 7, 8), 'Bh', 2, 100)
+        assert self.daq.signal_buffer[:102] == values + [7, 8]
+        self.cmd_fail(23, 'h2H', 399, 1, 2)
+        self.cmd_fail(23, 'hB', 0, 1)
+
+    def test_counter(self):
+        self.cmd_echo(41, 'B', 1)
+        self.daq.counter = 12
+        self.cmd_echo_ret(42, 'B', (1,), 'H', 12)
+        self.cmd_echo_ret(42, 'B', (0,), 'H', 0)
+
+    def test_encoder(self):
+        self.cmd_fail(52, '')
+        self.cmd_echo(50, 'B', 100)
+        self.daq.encoder_position = 250
+        self.cmd_echo_ret(52, '', (), 'H', 50)
+
+    def cmd_echo_ret(self, ncmd, fmt, args, ret_fmt, *ret):
+        """ Assert that a given command returns the given values """
+        self.daq.write(mkcmd(ncmd, fmt, *args))
+        expected = mkcmd(ncmd, ret_fmt, *ret)
+        assert self.daq.read(len(expected)) == expected
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+from opendaq.experiment import Channel
+from opendaq.spectrum import Spectrum
+from opendaq.stream import StreamDecoder, encode_packet
+
+
+class TestSpectrum(unittest.TestCase):
+    def setUp(self):
+        t = np.arange(8192)/1000.
+        self.values = 1000*np.sin(2*np.pi*125*t) + \
+            100*np.sin(2*np.pi*250*t) + 50
+
+    def test_welch(self):
+        # Feeding in blocks is the same as feeding everything at once
+        spec = Spectrum(1000, nperseg=256)
+        assert spec.feed(self.values) == 63
+        blocks = Spectrum(1000, nperseg=256)
+        for i in range(0, len(self.values), 100):
+            blocks.feed(self.values[i:i + 100])
+        assert blocks.nsegments == 63
+        assert np.allclose(spec.psd, blocks.psd)
+
+        # Parseval: the PSD integrates to the signal power
+        power = spec.psd.sum()*spec.fs/spec.nperseg
+        assert abs(power/(1000**2/2 + 100**2/2) - 1) < 0.01
+
+        peaks = spec.peaks(2)
+        assert [f for f, p in peaks] == [125, 250]
+
+    def test_bounded(self):
+        spec = Spectrum(1000, nperseg=128, overlap=0, max_segments=4,
+                        alpha=0.5)
+        assert spec.feed(self.values) == 4
+        assert spec.skipped == 60
+        assert spec.peaks(1)[0][0] == 125
+        with self.assertRaises(ValueError):
+            Spectrum(1000, window=[1, 2, 3])
+
+    def test_from_channel(self):
+        ch = Channel(2, 'stream', trigger=1)
+        spec = Spectrum.from_channel(ch, nperseg=64)
+        assert spec.fs == 1000
+        dec = StreamDecoder()
+        values = self.values.astype(int)
+        data = encode_packet(1, [0]*100)
+        for i in range(0, 1024, 64):
+            data += encode_packet(2, values[i:i + 64])
+        spec.feed(dec.feed(data))
+        assert spec.nsegments == 31
+        assert spec.peaks(1)[0][0] == 125
+        with self.assertRaises(ValueError):
+            Spectrum.from_channel(Channel(1, 'external', 0))
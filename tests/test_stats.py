@@ -0,0 +1,54 @@
+import json
+import unittest
+import numpy as np
+from opendaq.stats import RunningStats, ChannelStats
+from opendaq.stream import StreamDecoder, encode_packet
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.values = np.random.RandomState(1).randint(-500, 2000, 1000)
+
+    def check(self, stats, values):
+        assert stats.count == len(values)
+        assert np.isclose(stats.mean, values.mean())
+        assert np.isclose(stats.variance, values.var(ddof=1))
+        assert np.isclose(stats.rms, np.sqrt((values**2.).mean()))
+        assert stats.min == values.min() and stats.max == values.max()
+
+    def test_blocks(self):
+        stats = RunningStats()
+        for i in range(0, 1000, 37):
+            stats.update(self.values[i:i + 37])
+        self.check(stats, self.values)
+
+    def test_merge(self):
+        a, b = RunningStats(), RunningStats()
+        a.update(self.values[:300])
+        b.update(self.values[300:])
+        b = RunningStats.from_dict(json.loads(json.dumps(b.to_dict())))
+        self.check(a.merge(b), self.values)
+
+    def test_channels(self):
+        stats = ChannelStats(window=100)
+        numbers = np.arange(1000) % 2 + 1
+        for i in range(0, 1000, 64):
+            stats.update_mixed(self.values[i:i + 64], numbers[i:i + 64])
+        assert stats.channels() == [1, 2]
+        self.check(stats[2], self.values[1::2])
+        self.check(stats.window(1), self.values[::2][-100:])
+
+        other = ChannelStats()
+        other.update(2, self.values)
+        stats.merge(other)
+        self.check(stats[2], np.concatenate((self.values[1::2],
+                                             self.values)))
+
+    def test_packets(self):
+        decoder = StreamDecoder()
+        data = ''.join(encode_packet(3, self.values[i:i + 50])
+                       for i in range(0, 1000, 50))
+        stats = ChannelStats(window=10)
+        stats.update_packets(decoder.feed(data))
+        self.check(stats[3], self.values)
+        self.check(stats.window(3), self.values[-10:])
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+from opendaq import DAQ
+from opendaq.records import PacketStore
+from opendaq.stream import StreamDecoder, encode_packet, encode_stop
+
+
+class TestStreamDecoder(unittest.TestCase):
+    def setUp(self):
+        # 0x7e7d forces escaped bytes
+        self.data = (encode_packet(1, [1, -2, 0x7e7d]) +
+                     encode_packet(2, [-32768, 32767]) +
+                     encode_packet(1, [5]) + encode_stop(1))
+
+    def test_decode(self):
+        packets = StreamDecoder().feed(self.data)
+        assert [p.number for p in packets] == [1, 2, 1, 1]
+        assert list(packets[0].values) == [1, -2, 0x7e7d]
+        assert list(packets[1].values) == [-32768, 32767]
+        assert packets[2].offset == 3
+        assert packets[3].is_stop
+        assert all(p.crc_ok for p in packets)
+
+    def test_chunks(self):
+        decoder = StreamDecoder()
+        packets = []
+        for c in self.data:
+            packets.extend(decoder.feed(c))
+        assert [p.index for p in packets] == range(4)
+        assert list(packets[0].values) == [1, -2, 0x7e7d]
+
+    def test_errors(self):
+        bad = bytearray(encode_packet(3, [7, 8]))
+        bad[-1] ^= 1
+        decoder = StreamDecoder()
+        packets = decoder.feed('xy' + str(bad))
+        assert decoder.skipped == 2
+        assert decoder.crc_errors == 1 and not packets[0].crc_ok
+
+    def test_read_stream(self):
+        daq = DAQ('sim')
+        daq.ser._rbuf.extend(self.data)
+        packets = daq.read_stream()
+        assert len(packets) == 4
+        assert daq.read_stream() == []
+
+
+class TestPacketStore(unittest.TestCase):
+    def test_store(self):
+        decoder = StreamDecoder()
+        store = PacketStore(capacity=1)
+        for i in range(5):
+            store.extend(decoder.feed(encode_packet(1 + i % 2, [i, i, i])))
+        store.extend(decoder.feed(encode_stop(1)))
+        assert len(store) == 6
+        assert list(store.channel(2)) == [1, 1, 1, 3, 3, 3]
+        assert list(store.records['count']) == [3]*5 + [0]
+        assert list(store.records['start']) == [0, 3, 6, 9, 12, 15]
+
+        samples = store.samples()
+        ch1 = samples[samples['number'] == 1]
+        assert list(ch1['offset']) == range(9)
+        assert list(ch1['packet']) == [0]*3 + [2]*3 + [4]*3
+        assert np.all(store.values[store.records['start'][1:5]] ==
+                      [1, 2, 3, 4])
@@ -0,0 +1,141 @@
+import threading
+import unittest
+from opendaq import DAQ
+from opendaq.experiment import Experiment
+from opendaq.stream import encode_packet
+from opendaq.threaded import ThreadedDAQ, Future, TimeoutError, \
+    CancelledError
+
+
+class RacingEvent(threading._Event):
+    """Event which finishes its future while a callback is being added"""
+    def __init__(self, future):
+        threading._Event.__init__(self)
+        self.future = future
+        self.thread = None
+
+    def is_set(self):
+        flag = threading._Event.is_set(self)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.future.set_result,
+                                           args=(1,))
+            self.thread.start()
+            self.thread.join(0.1)
+        return flag
+
+
+class OldEvent(threading._Event):
+    """Event of Python 2.6, whose wait returns None"""
+    def wait(self, timeout=None):
+        threading._Event.wait(self, timeout)
+
+
+class TestThreadedDAQ(unittest.TestCase):
+    def setUp(self):
+        self.daq = DAQ('sim')
+        self.tdaq = ThreadedDAQ(self.daq)
+
+    def tearDown(self):
+        self.tdaq.close()
+        self.daq.close()
+
+    def test_concurrent_commands(self):
+        errors = []
+
+        def worker(color):
+            try:
+                for i in range(20):
+                    info = self.tdaq.get_info().result(1)
+                    assert info[2] == self.daq.ser.dev_id
+                    self.tdaq.set_led(color).result(1)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(c,))
+                   for c in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors
+        assert self.tdaq.hw_ver == self.daq.hw_ver
+        self.assertRaises(ValueError, self.tdaq.set_led(5).result, 1)
+
+    def test_priority(self):
+        order = []
+        release = threading.Event()
+        self.daq.block = release.wait
+        self.daq.stop = lambda: order.append('stop')
+        self.daq.set_led = lambda c: order.append(c)
+
+        blocked = self.tdaq.block()
+        futures = [self.tdaq.set_led(c) for c in range(3)]
+        cancelled = self.tdaq.set_led(3)
+        assert cancelled.cancel()
+        stop = self.tdaq.stop()
+        release.set()
+        for f in futures + [stop, blocked]:
+            f.result(1)
+        assert order == ['stop', 0, 1, 2]
+        self.assertRaises(CancelledError, cancelled.result, 1)
+
+    def test_stream(self):
+        # no DataChannels are configured: the packets are injected
+        self.tdaq.start().result(1)
+        self.daq.ser._rbuf.extend(encode_packet(1, range(10)))
+        packets = self.tdaq.read_stream(timeout=1)
+        # commands are served while reading the stream
+        self.tdaq.set_led(1).result(1)
+        assert self.daq.measuring
+        self.daq.ser._rbuf.extend(encode_packet(1, range(5)))
+        packets += self.tdaq.read_stream(timeout=1)
+        assert [len(p.values) for p in packets] == [10, 5]
+        self.tdaq.stop().result(1)
+        assert not self.daq.measuring
+
+    def test_stream_commands(self):
+        exp = Experiment()
+        exp.add_stream(1, 1)
+        self.tdaq.apply_experiment(exp).result(1)
+        self.tdaq.start().result(1)
+        packets = []
+        for i in range(40):
+            # the responses arrive after the stream data sent meanwhile
+            self.tdaq.set_led(i % 3).result(1)
+            assert self.tdaq.get_info().result(1)[2] == self.daq.ser.dev_id
+            assert len(self.tdaq.read_adc_block(20).result(1)) == 20
+            packets += self.tdaq.read_stream(timeout=0.01)
+        assert self.daq.measuring
+        self.tdaq.stop().result(1)
+        packets += self.tdaq.read_stream(timeout=0)
+        # no stream data was lost or taken as a response
+        assert all(p.crc_ok for p in packets)
+        assert self.daq.decoder.skipped == 0
+        assert sum(len(p.values) for p in packets) == \
+            self.daq.ser.channels[1]['sent'] > 0
+
+    def test_future(self):
+        f = Future()
+        done = []
+        f.add_done_callback(done.append)
+        self.assertRaises(TimeoutError, f.result, 0.01)
+        f.set_result(3)
+        assert f.result() == 3 and done == [f]
+        f.add_done_callback(done.append)
+        assert len(done) == 2
+        assert not f.cancel()
+
+    def test_future_race(self):
+        f = Future()
+        f._event = RacingEvent(f)
+        done = []
+        f.add_done_callback(done.append)
+        f._event.thread.join()
+        assert done == [f]
+
+    def test_future_old_event(self):
+        f = Future()
+        f._event = OldEvent()
+        self.assertRaises(TimeoutError, f.result, 0.01)
+        f.set_result(3)
+        assert f.result(1) == 3
@@ -0,0 +1,81 @@
+import os
+import socket
+import threading
+import unittest
+from opendaq import DAQ
+from opendaq.common import mkcmd
+from opendaq.simulator import DAQSimulator
+from opendaq.transport import PtyTransport, TCPTransport, open_transport
+
+
+class SimServer(threading.Thread):
+    """Local stand-in for a raw TCP serial server, backed by a simulator"""
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sim = DAQSimulator()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        conn, _ = self.sock.accept()
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                break
+            self.sim.write(data)
+            conn.sendall(self.sim.read_available())
+        conn.close()
+        self.sock.close()
+
+
+class TestTCPTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = SimServer()
+        self.server.start()
+
+    def test_daq(self):
+        daq = DAQ('socket://127.0.0.1:%d' % self.server.port)
+        assert daq.get_info()[2] == self.server.sim.dev_id
+        daq.set_led(2)
+        assert self.server.sim.led_color == 2
+        daq.close()
+
+    def test_command(self):
+        link = TCPTransport('127.0.0.1', self.server.port, timeout=1)
+        cmd = mkcmd(18, 'B', 1)
+        link.write(cmd)
+        assert link.read(len(cmd)) == cmd
+        assert not link.wait_ready(0.01)
+        link.close()
+
+    def test_bad_address(self):
+        self.assertRaises(ValueError, open_transport, 'socket://localhost')
+
+
+class TestPtyTransport(unittest.TestCase):
+    def setUp(self):
+        self.link = PtyTransport(timeout=0.05)
+
+    def tearDown(self):
+        self.link.close()
+
+    def test_read(self):
+        os.write(self.link.peer_fd, 'abcdef')
+        assert self.link.wait_ready()
+        assert self.link.read(2) == 'ab'
+        assert self.link.inWaiting() == 4
+        assert self.link.read(10) == 'cdef'
+        assert self.link.read(1) == ''
+
+    def test_write(self):
+        self.link.write('\x7e' * 3)
+        assert os.read(self.link.peer_fd, 10) == '\x7e' * 3
+
+    def test_flush(self):
+        os.write(self.link.peer_fd, 'abc')
+        self.link.wait_ready()
+        self.link.flushInput()
+        assert self.link.read_available() == ''
@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+from opendaq.trigger import Trigger, Level, Edge, Window, Slope
+
+
+def feed(trig, values, block):
+    segments = []
+    for i in range(0, len(values), block):
+        segments.extend(trig.feed(values[i:i + block]))
+    return segments
+
+
+class TestTrigger(unittest.TestCase):
+    def setUp(self):
+        # square wave with a 100-sample period
+        self.values = np.tile(np.repeat([0, 1000], 50), 10)
+
+    def test_edge(self):
+        for block in (1, 7, 1000):
+            trig = Trigger(Edge(500), pre=10, post=20, period=0.001)
+            segs = feed(trig, self.values, block)
+            assert [s.index for s in segs] == range(50, 1000, 100)
+            assert segs[1].time == 0.15
+            data = segs[0].data[:, 0]
+            assert len(data) == 30
+            assert list(data[8:12]) == [0, 0, 1000, 1000]
+
+    def test_holdoff(self):
+        trig = Trigger(Edge(500, rising=False), post=10, holdoff=150)
+        segs = feed(trig, self.values, 64)
+        assert [s.index for s in segs] == [100, 300, 500, 700, 900]
+
+    def test_rearm(self):
+        trig = Trigger(Level(500), post=10, rearm=False)
+        assert len(feed(trig, self.values, 1000)) == 1
+        trig.arm()
+        assert [s.index for s in trig.feed(self.values)] == [1050]
+
+    def test_pre_fill(self):
+        # no trigger until the pre-trigger history is full
+        trig = Trigger(Level(500), pre=60, post=5)
+        assert feed(trig, self.values, 1000)[0].index == 60
+
+    def test_window_slope(self):
+        ramp = np.concatenate((np.arange(100), np.arange(100, 0, -1)))
+        trig = Trigger(Window(20, 80), post=5)
+        assert [s.index for s in trig.feed(ramp)] == [81, 181]
+        trig = Trigger(Slope(50), post=5)
+        assert [s.index for s in trig.feed(self.values)] == \
+            range(50, 1000, 100)
+
+    def test_multichannel(self):
+        frames = np.column_stack((self.values, np.arange(1000)))
+        trig = Trigger(Edge(500) & Level(400, channel=1), pre=2, post=3)
+        segs = trig.feed(frames)
+        assert [s.index for s in segs] == range(450, 1000, 100)
+        assert segs[0].data.shape == (5, 2)
+        trig = Trigger(Edge(500) | Level(990, channel=1), post=3)
+        segs = trig.feed(frames)
+        assert [s.index for s in segs][-4:] == [950, 990, 993, 996]
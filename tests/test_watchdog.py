@@ -0,0 +1,158 @@
+import unittest
+from opendaq import DAQ
+from opendaq.clock import VirtualClock
+from opendaq.experiment import Experiment
+from opendaq.signals import Ramp
+from opendaq.simulator import DAQSimulator
+from opendaq.watchdog import (Watchdog, RecoveryError, CORRUPT, LINK_ERROR,
+                              STALL)
+
+
+class FaultySimulator(DAQSimulator):
+    """Simulator whose link can fail until it is reopened"""
+    def __init__(self, *args, **kwargs):
+        DAQSimulator.__init__(self, *args, **kwargs)
+        self.fault = None
+        self.open_failures = 0
+        self.reset_cal = False
+
+    def _open(self):
+        if self.open_failures:
+            self.open_failures -= 1
+            raise IOError("No such device")
+        DAQSimulator._open(self)
+        self.fault = None
+        if self.reset_cal:
+            self.calib_gains[1] = 1
+
+    def _recv(self, size, timeout):
+        if self.fault == LINK_ERROR:
+            raise IOError("Device disconnected")
+        if self.fault == STALL:
+            if timeout:
+                self.clock.sleep(timeout)
+            return ''
+        if self.fault == CORRUPT:
+            if timeout == 0:
+                return ''
+            self.clock.sleep(0.01)
+            return '\x55'*64
+        return DAQSimulator._recv(self, size, timeout)
+
+
+def make_experiment():
+    exp = Experiment()
+    exp.add_stream(1, 1)
+    exp.add_stream(2, 5, pinput=3)
+    return exp
+
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.sim = FaultySimulator()
+        self.sim.set_signal(1, Ramp(2.0, 3))
+        self.daq = DAQ(self.sim, clock=VirtualClock())
+
+    def read(self, watchdog, seconds):
+        """Read the stream for some time; return {number: [(offset, n)]}"""
+        blocks = {}
+        end = self.daq.clock.time() + seconds
+        while self.daq.clock.time() < end:
+            for p in watchdog.read_stream():
+                if p.crc_ok and not p.is_stop:
+                    blocks.setdefault(p.number, []).append(
+                        (p.offset, len(p.values)))
+        return blocks
+
+    def check_contiguous(self, blocks):
+        for number, bl in blocks.items():
+            for (o1, n1), (o2, _) in zip(bl, bl[1:]):
+                self.assertEqual(o1 + n1, o2)
+
+    def test_no_faults(self):
+        watchdog = Watchdog(self.daq, make_experiment())
+        watchdog.start()
+        blocks = self.read(watchdog, 2)
+        watchdog.stop()
+        self.assertEqual(watchdog.gaps, [])
+        self.assertEqual(sorted(blocks), [1, 2])
+        self.check_contiguous(blocks)
+        self.assertEqual(watchdog.stall_timeout, 1.0)
+
+    def check_recovery(self, fault):
+        gaps = []
+        watchdog = Watchdog(self.daq, make_experiment(),
+                            callback=gaps.append)
+        watchdog.start()
+        before = self.read(watchdog, 1)
+        self.sim.fault = fault
+        after = self.read(watchdog, 3)
+        watchdog.stop()
+
+        self.assertEqual(gaps, watchdog.gaps)
+        self.assertEqual(len(gaps), 1)
+        gap = gaps[0]
+        self.assertEqual(gap.reason, fault)
+        self.assertLess(gap.duration, 2)
+        self.assertTrue(self.daq.experiment == make_experiment())
+        for number in (1, 2):
+            offset, n = before[number][-1]
+            self.assertEqual(gap.offsets[number], offset + n)
+            self.assertGreaterEqual(gap.resume[number], offset + n)
+            # The samples after the gap start where it ends
+            self.assertEqual(after[number][0][0], gap.resume[number])
+        self.check_contiguous(after)
+        return gap
+
+    def test_link_error(self):
+        gap = self.check_recovery(LINK_ERROR)
+        self.assertEqual(gap.attempts, 1)
+
+    def test_stall(self):
+        gap = self.check_recovery(STALL)
+        # The samples lost while stalled are skipped
+        period = 0.001
+        lost = gap.resume[1] - gap.offsets[1]
+        self.assertAlmostEqual(lost*period, gap.duration, delta=period)
+
+    def test_corrupt(self):
+        self.check_recovery(CORRUPT)
+
+    def test_retries(self):
+        self.sim.open_failures = 3
+        watchdog = Watchdog(self.daq, make_experiment(), retry_delay=0.25)
+        watchdog.start()
+        self.read(watchdog, 0.5)
+        self.sim.fault = LINK_ERROR
+        after = self.read(watchdog, 2)
+        watchdog.stop()
+        self.assertEqual(watchdog.gaps[0].attempts, 4)
+        self.assertAlmostEqual(watchdog.downtime, 0.75, delta=0.05)
+        self.assertIn(1, after)
+
+    def test_retries_exhausted(self):
+        self.sim.open_failures = 5
+        watchdog = Watchdog(self.daq, make_experiment(), max_retries=3)
+        watchdog.start()
+        self.sim.fault = LINK_ERROR
+        self.assertRaises(RecoveryError, watchdog.read_stream)
+        self.assertFalse(watchdog.running)
+
+    def test_restore_calibration(self):
+        gains = list(self.daq.gains)
+        self.sim.reset_cal = True
+        watchdog = Watchdog(self.daq, make_experiment())
+        watchdog.start()
+        self.sim.fault = LINK_ERROR
+        self.read(watchdog, 0.5)
+        watchdog.stop()
+        self.assertEqual(len(watchdog.gaps), 1)
+        self.assertEqual(self.daq.get_cal()[0], gains)
+        self.assertEqual(self.daq.gains, gains)
+
+    def test_applied_experiment(self):
+        self.daq.apply_experiment(make_experiment())
+        watchdog = Watchdog(self.daq)
+        watchdog.start()
+        self.assertTrue(watchdog.experiment == make_experiment())
+        self.assertRaises(ValueError, Watchdog(DAQ('sim')).start)